@@ -2,26 +2,46 @@ from abc import ABC, abstractmethod
 from typing import Dict, Any, List, Optional
 import logging
 from ..core.types import Problem, Solution
-from ..core.config import Config
+from ..core.profiles import current_profile
+from ..services.matlab_codegen import run_sympy, validate_matlab
+from ..services.accounting import accountant
+from ..services.cassette import get_cassette
+from ..services.llm_providers import get_router
+from ..services.latex import LatexBuilder
 
 logger = logging.getLogger(__name__)
 
+_latex_builder = LatexBuilder()
+
 
 class BaseAgent(ABC):
     """Base class for all math agents"""
     
-    def __init__(self, model: Optional[str] = None, api_key: Optional[str] = None):
-        self.model = model or Config.MISTRAL_MODEL
+    def __init__(self, model: Optional[str] = None, api_key: Optional[str] = None,
+                 temperature: Optional[float] = None):
+        # Settings not fixed here are read from the runtime profile of the request being
+        # served at completion time, so an agent reused across requests follows each one's profile
+        self._model = model
         self.api_key = api_key
-        self.client = None  # Will be initialized on first use
+        self._temperature = temperature
         logger.info(f"Initialized {self.__class__.__name__} with model: {self.model}")
+
+    @property
+    def model(self) -> str:
+        return self._model or current_profile().model
+
+    @property
+    def temperature(self) -> float:
+        return self._temperature if self._temperature is not None else current_profile().temperature
+
+    @property
+    def max_tokens(self) -> int:
+        return current_profile().max_tokens
+
+    @property
+    def top_p(self) -> float:
+        return current_profile().top_p
     
-    def _get_client(self):
-        """Get or create Mistral client with current API key"""
-        if self.client is None:
-            self.client = Config.get_mistral_client(self.api_key)
-        return self.client
-        
     @abstractmethod
     def can_handle(self, problem: Problem) -> bool:
         """Determine if this agent can handle the given problem"""
@@ -33,38 +53,64 @@ class BaseAgent(ABC):
         pass
     
     async def _get_completion(self, messages: List[Dict[str, str]]) -> str:
-        """Get completion from Mistral AI API"""
+        """Get a completion from the configured LLM backends"""
         try:
             logger.debug(f"Requesting completion with model: {self.model}")
+            request = {
+                "model": self.model,
+                "messages": messages,
+                "max_tokens": self.max_tokens,
+                "temperature": self.temperature,
+                "top_p": self.top_p,
+            }
             
-            # Get client (will use session API key if available)
-            client = self._get_client()
-            
-            # Call Mistral AI API
-            response = client.chat.complete(
-                model=self.model,
-                messages=messages,
-                max_tokens=Config.MAX_TOKENS,
-                temperature=Config.TEMPERATURE,
-                top_p=Config.TOP_P,
-            )
+            # Serve recorded completions when replaying (offline development and tests)
+            cassette = get_cassette()
+            if cassette is not None:
+                replayed = await cassette.replay(request)
+                if replayed is not None:
+                    return replayed
             
-            # Extract the generated text
-            content = response.choices[0].message.content
-            logger.debug("Successfully received completion from Mistral AI")
-            return content.strip()
+            # Served by the configured backends (Mistral and/or OpenAI-compatible
+            # servers), hedging slow requests and skipping failing backends
+            completion = await get_router().complete(request, self.api_key)
+            logger.debug(f"Received completion from {completion.provider}")
+            accountant.record(completion.model, completion.prompt_tokens, completion.completion_tokens,
+                              completion.latency)
+            # A cancelled hedge was still sent: its prompt is billed, its partial output is unknown
+            for model in completion.cancelled:
+                accountant.record(model, completion.prompt_tokens, 0, 0.0)
+            if cassette is not None:
+                await cassette.record(request, completion.content, completion.latency)
+            return completion.content
             
         except Exception as e:
-            logger.error(f"Error getting completion from Mistral AI: {str(e)}")
-            raise RuntimeError(f"Failed to get completion from Mistral AI: {str(e)}") from e
+            logger.error(f"Error getting completion: {str(e)}")
+            raise RuntimeError(f"Failed to get completion: {str(e)}") from e
     
     def _format_matlab_code(self, code: str) -> str:
         """Format MATLAB code with proper indentation and comments"""
         # Remove empty lines at start and end
         code = code.strip()
         
+        # Flag structurally broken code instead of passing it through silently
+        issues = validate_matlab(code)
+        
         # Add header comment
         if not code.startswith('%'):
             code = f"% MATLAB Solution\n{code}"
+        
+        if issues:
+            logger.warning(f"MATLAB code failed syntax check: {issues[0]}")
+            notes = "\n".join(f"% Syntax check: {issue}" for issue in issues)
+            code = f"{notes}\n{code}"
             
-        return code 
\ No newline at end of file
+        return code
+    
+    async def _generate_latex(self, steps: List[str], problem_latex: Optional[str] = None) -> str:
+        """Generate normalized LaTeX for the solution from the math in its steps"""
+        # Plain-text equations are parsed with SymPy, off the loop and under SYMPY_TIMEOUT
+        latex = await run_sympy(_latex_builder.solution_latex, steps, problem_latex)
+        if latex is None:
+            latex = _latex_builder.solution_latex(steps, problem_latex, equations=False)
+        return latex
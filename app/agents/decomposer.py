@@ -0,0 +1,155 @@
+"""
+Hierarchical decomposition of multi-part problems
+
+Splits a problem with sub-parts ("(a)", "(b)", ...) into one sub-problem per
+part that shares the problem stem, solves the parts concurrently and merges
+the results into a single solution with steps grouped by part. Parts that
+refer to earlier answers ("using your answer to (a)", "hence ...") are
+scheduled as a DAG so only they wait for the parts they depend on.
+"""
+import asyncio
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from ..core.config import Config
+from ..core.types import Problem, Solution
+from ..services.answer_matcher import AnswerMatcher
+from ..services.segmenter import ProblemSegmenter, Segment
+
+logger = logging.getLogger(__name__)
+
+# Explicit references to another part: "part (a)", "in (b)", "parts a and c"
+_PART_REFERENCE = re.compile(
+    r"\bparts?\s*\(?([a-h]|i{1,3}|iv|vi{0,3}|ix|x)\)?(?![\w])|(?<![\w])\(([a-h]|i{1,3}|iv|vi{0,3}|ix|x)\)",
+    re.IGNORECASE,
+)
+
+# Implicit references to the part just before
+_PREVIOUS_REFERENCE = re.compile(
+    r"\b(?:hence|thus|therefore|using (?:this|that|these|your|the (?:result|answer|value))"
+    r"|previous part|part above|from above|above result|found above)\b",
+    re.IGNORECASE,
+)
+
+
+class DecompositionSolver:
+    """Solve the sub-parts of a problem concurrently and merge the results"""
+
+    def __init__(self, solver: Any, max_concurrency: Optional[int] = None):
+        # Anything with an async solve(problem) method: an agent or an ensemble
+        self.solver = solver
+        self.max_concurrency = max(1, max_concurrency or Config.DECOMPOSE_MAX_CONCURRENCY)
+        self.segmenter = ProblemSegmenter()
+        self.matcher = AnswerMatcher()
+
+    def split(self, problem: Problem) -> Segment:
+        """Stem and sub-parts of a problem, preferring those found during segmentation"""
+        parts = (problem.context or {}).get("parts") or []
+        if len(parts) >= 2:
+            stem = self.segmenter.split_parts(problem.text).text
+            return Segment(text=stem, parts=[Segment(text=p["text"], label=p["label"]) for p in parts])
+        return self.segmenter.split_parts(problem.text)
+
+    @staticmethod
+    def dependencies(parts: List[Segment]) -> Dict[int, List[int]]:
+        """Map each part's index to the indexes of earlier parts it refers to"""
+        graph: Dict[int, List[int]] = {}
+        # Label -> index of its latest occurrence so far; labels can repeat in badly numbered text
+        latest: Dict[str, int] = {}
+        for index, part in enumerate(parts):
+            referenced = {
+                (match.group(1) or match.group(2)).lower()
+                for match in _PART_REFERENCE.finditer(part.text)
+            }
+            deps = sorted(latest[label] for label in referenced if label in latest)
+            if not deps and index and _PREVIOUS_REFERENCE.search(part.text):
+                deps = [index - 1]
+            graph[index] = deps
+            latest[part.label] = index
+        return graph
+
+    async def solve(self, problem: Problem) -> Solution:
+        """
+        Solve a problem part by part
+
+        Args:
+            problem: Problem to solve
+
+        Returns:
+            Merged solution; problems with fewer than two parts are passed to
+            the wrapped solver unchanged
+        """
+        segment = self.split(problem)
+        if len(segment.parts) < 2:
+            return await self.solver.solve(problem)
+
+        graph = self.dependencies(segment.parts)
+        logger.info(f"Decomposed problem into {len(segment.parts)} parts, dependencies: {graph}")
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks: List[asyncio.Task] = []
+
+        async def solve_part(index: int, part: Segment) -> Solution:
+            # Parts only ever depend on earlier parts, so these tasks already exist
+            earlier = [(segment.parts[i].label, await tasks[i]) for i in graph[index]]
+            async with semaphore:
+                return await self.solver.solve(self._sub_problem(problem, segment.text, part, earlier))
+
+        for index, part in enumerate(segment.parts):
+            tasks.append(asyncio.create_task(solve_part(index, part)))
+        try:
+            solutions = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return self._merge(self._unique_labels(segment.parts), solutions)
+
+    def _sub_problem(self, problem: Problem, stem: str, part: Segment,
+                     earlier: List[Tuple[str, Solution]]) -> Problem:
+        sections = [stem] if stem else []
+        if earlier:
+            results = [f"({label}) {self._answer(solution)}" for label, solution in earlier]
+            sections.append("Results of earlier parts:\n" + "\n".join(results))
+        sections.append(f"Solve only part ({part.label}): {part.text}")
+        context = {**(problem.context or {}), "parts": [], "part": part.label, "stem": stem}
+        return Problem(
+            text="\n\n".join(sections),
+            type=problem.type,
+            latex=problem.latex,
+            context=context,
+            images=problem.images
+        )
+
+    def _answer(self, solution: Solution) -> str:
+        answer = self.matcher.extract(solution)
+        if answer:
+            return answer
+        return solution.explanation.strip().split("\n")[-1]
+
+    @staticmethod
+    def _unique_labels(parts: List[Segment]) -> List[str]:
+        """Part labels with repeats numbered ("a", "a-2"), so no part's results are merged over another's"""
+        seen: Dict[str, int] = {}
+        labels = []
+        for part in parts:
+            seen[part.label] = seen.get(part.label, 0) + 1
+            labels.append(part.label if seen[part.label] == 1 else f"{part.label}-{seen[part.label]}")
+        return labels
+
+    @staticmethod
+    def _merge(labels: List[str], solutions: List[Solution]) -> Solution:
+        explanation = "\n\n".join(f"Part ({label}): {s.explanation}" for label, s in zip(labels, solutions))
+        steps = [f"({label}) {step}" for label, s in zip(labels, solutions) for step in s.steps]
+        matlab = [f"%% Part ({label})\n{s.matlab_code}" for label, s in zip(labels, solutions) if s.matlab_code]
+        latex = [f"({label})\\; {s.latex_solution}" for label, s in zip(labels, solutions) if s.latex_solution]
+        numerical = {label: s.numerical_result for label, s in zip(labels, solutions)
+                     if s.numerical_result is not None}
+        plots = [plot for s in solutions for plot in (s.plots or [])]
+        return Solution(
+            explanation=explanation,
+            steps=steps,
+            matlab_code="\n\n".join(matlab) or None,
+            latex_solution="\n\n".join(latex) or None,
+            plots=plots or None,
+            numerical_result=numerical or None,
+            confidence=min(s.confidence for s in solutions)
+        )
@@ -0,0 +1,120 @@
+"""
+Self-consistency ensemble over an agent
+
+Runs several solves of the same problem concurrently (varying temperature
+and optionally model), groups the final answers by equivalence and returns
+the majority solution with confidence set from the agreement rate. Stops as
+soon as a quorum agrees and cancels the solves still in flight.
+"""
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+from .base_agent import BaseAgent
+from ..core.config import Config
+from ..core.types import Problem, Solution
+from ..services.answer_matcher import AnswerMatcher
+from ..services.matlab_codegen import run_sympy
+
+logger = logging.getLogger(__name__)
+
+
+class EnsembleSolver:
+    """Majority-vote wrapper around a single agent"""
+
+    def __init__(
+        self,
+        agent: BaseAgent,
+        size: Optional[int] = None,
+        temperatures: Optional[List[float]] = None,
+        models: Optional[List[str]] = None,
+        quorum: Optional[int] = None,
+        tolerance: Optional[float] = None,
+    ):
+        self.agent = agent
+        self.size = max(1, size or Config.ENSEMBLE_SIZE)
+        self.temperatures = temperatures or Config.ENSEMBLE_TEMPERATURES or [agent.temperature]
+        self.models = models or Config.ENSEMBLE_MODELS or [agent.model]
+        self.quorum = quorum or Config.ENSEMBLE_QUORUM or self.size // 2 + 1
+        self.matcher = AnswerMatcher(tolerance if tolerance is not None else Config.ENSEMBLE_TOLERANCE)
+
+    def _members(self) -> List[BaseAgent]:
+        """Create one agent per ensemble slot, cycling through temperatures and models"""
+        # Members share the backends' connection pools through the LLM router
+        return [
+            self.agent.__class__(
+                model=self.models[i % len(self.models)],
+                api_key=self.agent.api_key,
+                temperature=self.temperatures[i % len(self.temperatures)],
+            )
+            for i in range(self.size)
+        ]
+
+    async def solve(self, problem: Problem) -> Solution:
+        """
+        Solve the problem with every ensemble member and vote on the answer
+
+        Args:
+            problem: Problem to solve
+
+        Returns:
+            The solution from the largest agreeing group, with confidence equal
+            to the share of successful solves that agree with it
+        """
+        if self.size == 1:
+            return await self.agent.solve(problem)
+
+        logger.info(f"Solving with ensemble of {self.size} (quorum {self.quorum})")
+        pending = {asyncio.create_task(member.solve(problem)) for member in self._members()}
+        # Each group is (canonical answer, solutions agreeing with it)
+        groups: List[Tuple[Optional[str], List[Solution]]] = []
+        received = 0
+        first_error: Optional[BaseException] = None
+
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        logger.warning(f"Ensemble member failed: {task.exception()}")
+                        first_error = first_error or task.exception()
+                        continue
+                    received += 1
+                    group = await self._add_to_groups(groups, task.result())
+                    if group[0] is not None and len(group[1]) >= self.quorum:
+                        logger.info(f"Ensemble quorum reached after {received} of {self.size} solves")
+                        return self._pick(group, received)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if not groups:
+            raise first_error or RuntimeError("All ensemble members failed")
+        best = max(groups, key=lambda g: (g[0] is not None, len(g[1])))
+        return self._pick(best, received)
+
+    async def _add_to_groups(self, groups: List[Tuple[Optional[str], List[Solution]]],
+                             solution: Solution) -> Tuple[Optional[str], List[Solution]]:
+        answer = self.matcher.extract(solution)
+        if answer is not None:
+            # Comparing model answers is SymPy work, so it runs off the loop under SYMPY_TIMEOUT
+            index = await run_sympy(self._matching_group, [group[0] for group in groups], answer)
+            if index is not None and index >= 0:
+                groups[index][1].append(solution)
+                return groups[index]
+        # Unextractable answers (and ones too costly to compare) never agree with anything
+        group = (answer, [solution])
+        groups.append(group)
+        return group
+
+    def _matching_group(self, answers: List[Optional[str]], answer: str) -> int:
+        """Index of the first group whose answer is equivalent, or -1"""
+        for index, other in enumerate(answers):
+            if other is not None and self.matcher.equivalent(other, answer):
+                return index
+        return -1
+
+    @staticmethod
+    def _pick(group: Tuple[Optional[str], List[Solution]], received: int) -> Solution:
+        solution = group[1][0]
+        solution.confidence = len(group[1]) / received
+        return solution
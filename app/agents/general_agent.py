@@ -2,9 +2,12 @@ from typing import List, Dict, Any, Tuple
 import logging
 from .base_agent import BaseAgent
 from ..core.types import Problem, Solution, ProblemType
+from ..services.matlab_codegen import MatlabCodeGenerator, run_sympy
 
 logger = logging.getLogger(__name__)
 
+_codegen = MatlabCodeGenerator()
+
 
 class GeneralAgent(BaseAgent):
     """Agent specialized in solving general mathematics problems"""
@@ -17,22 +20,13 @@ class GeneralAgent(BaseAgent):
         """Solve a general math problem"""
         logger.info(f"Solving {problem.type.value} problem with GeneralAgent")
         
+        # Build MATLAB from templates when the problem structure is recognized,
+        # so the model does not have to spend output tokens writing it
+        template_matlab = await run_sympy(_codegen.from_problem, problem)
+        
         # Create a prompt for the problem
         messages = [
-            {"role": "system", "content": """You are a mathematics expert. Your task is to solve math problems step by step.
-            For each problem, provide:
-            1. A clear explanation of the problem and approach
-            2. Step-by-step solution with clear mathematical reasoning
-            3. MATLAB code to solve or simulate the problem (if applicable)
-            4. Mathematical formulas in LaTeX format
-            
-            Format your response as follows:
-            - Start with a clear explanation
-            - Number each step clearly
-            - Put MATLAB code between ```matlab and ``` markers (if applicable)
-            - Put LaTeX formulas between $ markers
-            
-            Use proper mathematical terminology and methods. Be thorough and accurate."""},
+            {"role": "system", "content": self._build_system_prompt(include_matlab=template_matlab is None)},
             {"role": "user", "content": f"Please solve this mathematics problem:\n{problem.text}"}
         ]
         
@@ -41,9 +35,11 @@ class GeneralAgent(BaseAgent):
         
         # Parse the response to extract different components
         explanation, steps, matlab_code = self._parse_solution(response)
+        if template_matlab:
+            matlab_code = template_matlab
         
         # Generate LaTeX solution
-        latex_solution = self._generate_latex(steps)
+        latex_solution = await self._generate_latex(steps, problem.latex)
         
         logger.info(f"Successfully solved {problem.type.value} problem")
         
@@ -55,6 +51,35 @@ class GeneralAgent(BaseAgent):
             confidence=0.85  # Slightly lower confidence for general problems
         )
     
+    def _build_system_prompt(self, include_matlab: bool = True) -> str:
+        """Build the system prompt, optionally asking the model for MATLAB code"""
+        sections = [
+            "A clear explanation of the problem and approach",
+            "Step-by-step solution with clear mathematical reasoning",
+        ]
+        if include_matlab:
+            sections.append("MATLAB code to solve or simulate the problem (if applicable)")
+        sections.append("Mathematical formulas in LaTeX format")
+        
+        format_rules = [
+            "Start with a clear explanation",
+            "Number each step clearly",
+        ]
+        if include_matlab:
+            format_rules.append("Put MATLAB code between ```matlab and ``` markers (if applicable)")
+        else:
+            format_rules.append("Do not include any MATLAB or other code")
+        format_rules.append("Put LaTeX formulas between $ markers")
+        
+        numbered = "\n".join(f"{i}. {section}" for i, section in enumerate(sections, 1))
+        bullets = "\n".join(f"- {rule}" for rule in format_rules)
+        return (
+            "You are a mathematics expert. Your task is to solve math problems step by step.\n"
+            f"For each problem, provide:\n{numbered}\n\n"
+            f"Format your response as follows:\n{bullets}\n\n"
+            "Use proper mathematical terminology and methods. Be thorough and accurate."
+        )
+    
     def _parse_solution(self, response: str) -> Tuple[str, List[str], str]:
         """Parse the LLM response into components"""
         parts = response.split("```")
@@ -107,38 +132,3 @@ class GeneralAgent(BaseAgent):
             explanation = "Solution provided below."
         
         return " ".join(explanation) if isinstance(explanation, list) else explanation, steps, matlab_code
-    
-    def _generate_latex(self, steps: List[str]) -> str:
-        """Generate LaTeX representation of the solution"""
-        latex = "\\begin{align*}\n"
-        found_latex = False
-        
-        for step in steps:
-            # Extract any mathematical expressions between $ signs
-            parts = step.split("$")
-            if len(parts) > 1:
-                found_latex = True
-                for i in range(1, len(parts), 2):
-                    latex += parts[i] + " \\\\\n"
-        
-        if not found_latex:
-            # Try to extract equations from the text
-            for step in steps:
-                # Look for common equation patterns
-                if "=" in step:
-                    # Try to extract the equation part
-                    eq_parts = step.split("=")
-                    if len(eq_parts) >= 2:
-                        left = eq_parts[0].strip()
-                        right = eq_parts[1].strip()
-                        # Simple LaTeX conversion
-                        left = left.replace("^", "^{").replace(" ", "} ") + "}"
-                        latex += f"{left} = {right} \\\\\n"
-                        found_latex = True
-        
-        if not found_latex:
-            latex = "\\text{Solution steps provided in text format.}\n"
-        
-        latex += "\\end{align*}"
-        return latex
-
@@ -2,9 +2,13 @@ from typing import List, Dict, Any, Tuple
 import logging
 from .base_agent import BaseAgent
 from ..core.types import Problem, Solution, ProblemType
+from ..services.stats_kernel import StatsKernel
 
 logger = logging.getLogger(__name__)
 
+# Shared across agents so the log-factorial table is built once per process
+_stats_kernel = StatsKernel()
+
 class ProbabilityAgent(BaseAgent):
     """Agent specialized in solving probability and statistics problems"""
     
@@ -15,20 +19,24 @@ class ProbabilityAgent(BaseAgent):
         """Solve a probability or statistics problem"""
         logger.info(f"Solving {problem.type.value} problem")
         
+        # Try the exact closed-form templates before calling the LLM
+        solution = _stats_kernel.solve(problem)
+        if solution is not None:
+            return solution
+        
         # Create a prompt for the problem
         messages = [
             {"role": "system", "content": """You are a probability and statistics expert. Your task is to solve math problems step by step.
             For each problem, provide:
             1. A clear explanation of the problem and approach
             2. Step-by-step solution with clear mathematical reasoning
-            3. MATLAB code to solve or simulate the problem
-            4. Mathematical formulas in LaTeX format
+            3. Mathematical formulas in LaTeX format
             
             Format your response as follows:
             - Start with a clear explanation
             - Number each step clearly
-            - Put MATLAB code between ```matlab and ``` markers
             - Put LaTeX formulas between $ markers
+            - Do not include any MATLAB or other code
             
             Use proper statistical terminology and methods."""},
             {"role": "user", "content": f"Please solve this probability/statistics problem:\n{problem.text}"}
@@ -41,14 +49,14 @@ class ProbabilityAgent(BaseAgent):
         explanation, steps, matlab_code = self._parse_solution(response)
         
         # Generate LaTeX solution
-        latex_solution = self._generate_latex(steps)
+        latex_solution = await self._generate_latex(steps, problem.latex)
         
         logger.info(f"Successfully solved {problem.type.value} problem")
         
         return Solution(
             explanation=explanation,
             steps=steps,
-            matlab_code=self._format_matlab_code(matlab_code),
+            matlab_code=self._format_matlab_code(matlab_code) if matlab_code else None,
             latex_solution=latex_solution,
             confidence=0.9  # High confidence with Mistral models
         )
@@ -93,15 +101,3 @@ class ProbabilityAgent(BaseAgent):
             steps.append(" ".join(current_step))
         
         return " ".join(explanation), steps, matlab_code
-    
-    def _generate_latex(self, steps: List[str]) -> str:
-        """Generate LaTeX representation of the solution"""
-        latex = "\\begin{align*}\n"
-        for step in steps:
-            # Extract any mathematical expressions between $ signs
-            parts = step.split("$")
-            if len(parts) > 1:
-                for i in range(1, len(parts), 2):
-                    latex += parts[i] + " \\\\\n"
-        latex += "\\end{align*}"
-        return latex 
\ No newline at end of file
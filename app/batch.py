@@ -0,0 +1,451 @@
+"""
+Offline bulk processing of PDF coursework
+
+Extracts (and optionally solves) the problems of every PDF in a set of
+directories or a manifest, using a process pool so that parsing uses all
+cores. Results are streamed to JSONL or SQLite, one record per document.
+The output doubles as the checkpoint: documents already written
+successfully are skipped on the next run, so an interrupted run resumes
+where it stopped. Files are deduplicated by content hash, both within a run
+and against earlier runs.
+
+Usage:
+    python -m app.batch coursework/ -o results.jsonl
+    python -m app.batch --manifest files.txt -o results.db --workers 8 --no-solve
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from .agents.base_agent import BaseAgent
+from .agents.decomposer import DecompositionSolver
+from .agents.ensemble import EnsembleSolver
+from .agents.general_agent import GeneralAgent
+from .agents.probability_agent import ProbabilityAgent
+from .core.config import Config
+from .core.profiles import current_profile
+from .core.types import Problem, ProblemType, Solution
+from .services.cassette import get_cassette
+from .services.matlab_codegen import run_sympy
+from .services.pdf_processor import PDFProcessor
+from .services.solution_cache import problem_fingerprint
+from .services.state_store import MemoryStateStore
+from .services.text_processor import TextProcessor
+from .services.variants import ProblemGroup, VariantSolver, group_problems
+
+logger = logging.getLogger(__name__)
+
+INPUT_SUFFIXES = (".pdf", ".txt")
+
+
+def file_hash(path: Path) -> str:
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def collect_inputs(paths: Iterable[str], manifest: Optional[str] = None) -> List[Path]:
+    """
+    Input files from files, directories (searched recursively) and a manifest
+
+    Args:
+        paths: Files or directories
+        manifest: File listing one input path per line, relative to the manifest
+
+    Returns:
+        PDF and text files in a stable order
+    """
+    entries = [Path(p) for p in paths]
+    if manifest:
+        base = Path(manifest).parent
+        with open(manifest, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    entries.append(base / line)
+    files = []
+    for entry in entries:
+        if entry.is_dir():
+            files.extend(sorted(p for p in entry.rglob("*") if p.suffix.lower() in INPUT_SUFFIXES and p.is_file()))
+        elif entry.is_file():
+            files.append(entry)
+        else:
+            logger.warning(f"Skipping missing input: {entry}")
+    return files
+
+
+def solution_record(solution: Solution) -> Dict[str, Any]:
+    return {
+        "explanation": solution.explanation,
+        "steps": solution.steps,
+        "matlab_code": solution.matlab_code,
+        "latex_solution": solution.latex_solution,
+        "numerical_result": solution.numerical_result,
+        "confidence": solution.confidence,
+    }
+
+
+class _Worker:
+    """Per-process services, created once by the pool initializer"""
+
+    def __init__(self, solve: bool, api_key: Optional[str], concurrency: int):
+        self.solve = solve
+        self.api_key = api_key
+        self.concurrency = concurrency
+        # A worker's event loop lives as long as the process so LLM connections are reused
+        self.loop = asyncio.new_event_loop()
+        self.pdf_processor = PDFProcessor(store=MemoryStateStore())
+        self.text_processor = TextProcessor()
+        self.variants = VariantSolver(MemoryStateStore())
+        self.agents: Dict[type, BaseAgent] = {}
+
+    def process(self, path: str, sha256: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            record = self.loop.run_until_complete(self._process(Path(path)))
+        except Exception as e:
+            record = {"pages": 0, "problems": [], "solved": False, "error": str(e)}
+        return {"path": path, "sha256": sha256, "seconds": round(time.perf_counter() - started, 3), **record}
+
+    async def _process(self, path: Path) -> Dict[str, Any]:
+        if path.suffix.lower() == ".txt":
+            # Blank-line separated problems
+            blocks = [b.strip() for b in path.read_text(encoding="utf-8").split("\n\n") if b.strip()]
+            problems = [self.text_processor.process_text(block) for block in blocks]
+            pages = 0
+        else:
+            processed = await self.pdf_processor.process_pdf(path.read_bytes())
+            problems = processed.problems
+            pages = processed.metadata["num_pages"]
+
+        if Config.VARIANT_GROUPING_ENABLED:
+            groups = group_problems(problems)
+        else:
+            groups = [ProblemGroup(representative=index) for index in range(len(problems))]
+        entries = [
+            {"text": problem.text, "type": problem.type.value, "fingerprint": problem_fingerprint(problem)}
+            for problem in problems
+        ]
+        for number, group in enumerate(groups):
+            entries[group.representative].update(group=number, role="representative")
+            for index in group.duplicates:
+                entries[index].update(group=number, role="duplicate")
+            for index in group.variants:
+                entries[index].update(group=number, role="variant")
+        if self.solve:
+            await self._solve(problems, groups, entries)
+        # Only a document whose every problem was solved is complete for a solving run
+        solved = self.solve and not any("error" in entry for entry in entries)
+        return {"pages": pages, "problems": entries, "solved": solved}
+
+    async def _solve(self, problems: List[Problem], groups: List[ProblemGroup],
+                     entries: List[Dict[str, Any]]) -> None:
+        """Solve each group's representative, then derive or solve its duplicates and variants"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def solve(index: int) -> None:
+            async with semaphore:
+                try:
+                    solution = await self._solver(problems[index]).solve(problems[index])
+                    entries[index]["solution"] = solution_record(solution)
+                except Exception as e:
+                    entries[index]["error"] = str(e)
+
+        await asyncio.gather(*(solve(group.representative) for group in groups))
+        fallback = []
+        for group in groups:
+            representative = entries[group.representative]
+            for index in group.duplicates:
+                for key in ("solution", "error"):
+                    if key in representative:
+                        entries[index][key] = representative[key]
+            for index in group.variants:
+                solution = None
+                if "solution" in representative:
+                    rep_solution = Solution(**representative["solution"])
+                    solution = await run_sympy(self.variants.derive, problems[group.representative],
+                                               rep_solution, problems[index])
+                if solution is not None:
+                    entries[index]["solution"] = solution_record(solution)
+                else:
+                    fallback.append(index)
+        await asyncio.gather(*(solve(index) for index in fallback))
+
+    def _solver(self, problem: Problem) -> Any:
+        """The agent for a problem's type, wrapped as the server does (see solve_with_agent)"""
+        if problem.type in [ProblemType.PROBABILITY, ProblemType.STATISTICS]:
+            agent_class = ProbabilityAgent
+        else:
+            agent_class = GeneralAgent
+        if agent_class not in self.agents:
+            self.agents[agent_class] = agent_class(api_key=self.api_key)
+        solver = self.agents[agent_class]
+        size = current_profile().ensemble_size
+        if size > 1:
+            solver = EnsembleSolver(solver, size=size)
+        if Config.DECOMPOSE_ENABLED:
+            solver = DecompositionSolver(solver)
+        return solver
+
+
+_worker: Optional[_Worker] = None
+
+
+def _init_worker(solve: bool, api_key: Optional[str], concurrency: int, level: int) -> None:
+    global _worker
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    logging.getLogger().setLevel(level)
+    _worker = _Worker(solve, api_key, concurrency)
+
+
+def _process(path: str, sha256: str) -> Dict[str, Any]:
+    return _worker.process(path, sha256)
+
+
+class JsonlSink:
+    """One JSON document record per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._repair()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _repair(self) -> None:
+        # A crash mid-write leaves a partial last line; drop it so appends stay valid JSONL
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def completed(self, solved: bool = False) -> Set[str]:
+        """Documents written without an error (and, if `solved`, with every problem solved)"""
+        done = set()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not record.get("error") and (record.get("solved") or not solved):
+                    done.add(record["sha256"])
+        return done
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SQLiteSink:
+    """Document and problem tables; each document is committed in one transaction"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "sha256 TEXT PRIMARY KEY, path TEXT, paths TEXT, pages INTEGER, problems INTEGER, "
+            "seconds REAL, error TEXT, processed_at REAL, solved INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Outputs written before documents recorded whether they were solved
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if "solved" not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN solved INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS problems ("
+            "sha256 TEXT, idx INTEGER, text TEXT, type TEXT, fingerprint TEXT, grp INTEGER, role TEXT, "
+            "solution TEXT, error TEXT, PRIMARY KEY (sha256, idx))"
+        )
+        self._conn.commit()
+
+    def completed(self, solved: bool = False) -> Set[str]:
+        """Documents written without an error (and, if `solved`, with every problem solved)"""
+        query = "SELECT sha256 FROM documents WHERE error IS NULL" + (" AND solved = 1" if solved else "")
+        return {row[0] for row in self._conn.execute(query)}
+
+    def write(self, record: Dict[str, Any]) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM problems WHERE sha256 = ?", (record["sha256"],))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(sha256, path, paths, pages, problems, seconds, error, processed_at, solved) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (record["sha256"], record["path"], json.dumps(record["paths"]), record["pages"],
+                 len(record["problems"]), record["seconds"], record.get("error"), time.time(),
+                 int(bool(record.get("solved")))),
+            )
+            self._conn.executemany(
+                "INSERT INTO problems VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (record["sha256"], index, problem["text"], problem["type"], problem["fingerprint"],
+                     problem.get("group"), problem.get("role"),
+                     json.dumps(problem["solution"], ensure_ascii=False, default=str) if "solution" in problem else None,
+                     problem.get("error"))
+                    for index, problem in enumerate(record["problems"])
+                ],
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def open_sink(path: str, fmt: Optional[str] = None):
+    """JSONL or SQLite output, chosen by format or by the file extension"""
+    fmt = fmt or ("sqlite" if Path(path).suffix.lower() in (".db", ".sqlite", ".sqlite3") else "jsonl")
+    return SQLiteSink(path) if fmt == "sqlite" else JsonlSink(path)
+
+
+class Progress:
+    """Throughput counters, reported periodically on stderr"""
+
+    def __init__(self, total: int, interval: float):
+        self.total = total
+        self.interval = interval
+        self.started = time.perf_counter()
+        self._reported = self.started
+        self.documents = self.failed = self.pages = self.problems = 0
+
+    def add(self, record: Dict[str, Any]) -> None:
+        self.documents += 1
+        self.pages += record["pages"]
+        self.problems += len(record["problems"])
+        if record.get("error"):
+            self.failed += 1
+            print(f"Failed: {record['path']}: {record['error']}", file=sys.stderr)
+        now = time.perf_counter()
+        if now - self._reported >= self.interval:
+            self._reported = now
+            self.report()
+
+    def report(self, final: bool = False) -> None:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        print(
+            f"{'Done' if final else 'Progress'}: {self.documents}/{self.total} documents "
+            f"({self.failed} failed) in {elapsed:.1f}s; "
+            f"{self.pages / elapsed:.2f} pages/s, {self.problems / elapsed:.2f} problems/s",
+            file=sys.stderr,
+        )
+
+
+def run(args: argparse.Namespace) -> int:
+    files = collect_inputs(args.inputs, args.manifest)
+    sink = open_sink(args.output, args.format)
+    done = sink.completed(args.solve) if args.resume else set()
+
+    # Identical files are processed once; the record lists every path with that content
+    paths_by_hash: Dict[str, List[str]] = {}
+    for path in files:
+        paths_by_hash.setdefault(file_hash(path), []).append(str(path))
+    pending = {sha: paths for sha, paths in paths_by_hash.items() if sha not in done}
+    workers = max(1, min(args.workers, len(pending)))
+    print(
+        f"{len(files)} files, {len(paths_by_hash)} unique, {len(paths_by_hash) - len(pending)} already done; "
+        f"processing {len(pending)} with {workers} workers",
+        file=sys.stderr,
+    )
+
+    progress = Progress(len(pending), args.report_interval)
+
+    def start_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(args.solve, args.api_key, args.concurrency, logging.getLogger().level),
+        )
+
+    pool = start_pool()
+    try:
+        # Keep a bounded number of documents in flight so results stream out in steady order
+        queue = iter(pending.items())
+        inflight: Dict[Future, Tuple[str, List[str], ProcessPoolExecutor]] = {}
+        while True:
+            while len(inflight) < workers * 2:
+                item = next(queue, None)
+                if item is None:
+                    break
+                sha, paths = item
+                try:
+                    future = pool.submit(_process, paths[0], sha)
+                except BrokenProcessPool:
+                    # A worker died since the last result was collected
+                    pool.shutdown(wait=False)
+                    pool = start_pool()
+                    future = pool.submit(_process, paths[0], sha)
+                inflight[future] = (sha, paths, pool)
+            if not inflight:
+                break
+            finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                sha, paths, submitted_to = inflight.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # The worker process died (e.g. out of memory on a pathological PDF). That breaks
+                    # the pool and fails every document in it; they are retried on the next run.
+                    record = {"path": paths[0], "sha256": sha, "seconds": 0, "pages": 0, "problems": [],
+                              "solved": False, "error": str(e)}
+                    if isinstance(e, BrokenProcessPool) and submitted_to is pool:
+                        pool.shutdown(wait=False)
+                        pool = start_pool()
+                record["paths"] = paths
+                sink.write(record)
+                progress.add(record)
+    except KeyboardInterrupt:
+        print("Interrupted; rerun with the same output to resume", file=sys.stderr)
+        pool.shutdown(wait=False, cancel_futures=True)
+        return 130
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        sink.close()
+        progress.report(final=True)
+    return 1 if progress.failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Extract and solve the problems of many PDFs offline")
+    parser.add_argument("inputs", nargs="*", help="PDF/text files or directories to search recursively")
+    parser.add_argument("--manifest", help="File listing one input path per line")
+    parser.add_argument("-o", "--output", required=True, help="Output file (.jsonl, or .db/.sqlite for SQLite)")
+    parser.add_argument("--format", choices=["jsonl", "sqlite"], help="Output format (default: from extension)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent LLM solves per worker")
+    parser.add_argument("--no-solve", dest="solve", action="store_false", help="Only extract problems")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="Reprocess documents already in the output")
+    parser.add_argument("--api-key", default=None, help="Mistral API key (default: MISTRAL_API_KEY)")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="Seconds between progress lines")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    if not args.inputs and not args.manifest:
+        parser.error("no inputs given")
+    uses_mistral = any(name == "mistral" for name, _ in Config.LLM_PROVIDERS)
+    if args.solve and uses_mistral and not (get_cassette() and get_cassette().replaying):
+        try:
+            Config.validate(args.api_key)
+        except ValueError as e:
+            parser.error(f"{e} Use --no-solve to only extract problems.")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Compact, versioned serialization for core types
+
+Encodes Problem, Solution and ProcessedPDF as positional arrays inside a
+small envelope carrying the type name and schema version. Uses orjson when
+it is installed and falls back to the standard library json module.
+"""
+import base64
+import json
+from dataclasses import fields
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .types import Problem, Solution, ProcessedPDF, ProblemType
+
+# Make orjson optional (faster encoding/decoding when available)
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Bump when the field layout of a serialized type changes
+SCHEMA_VERSION = 1
+
+
+class CodecError(ValueError):
+    """Raised when a payload cannot be decoded"""
+    pass
+
+
+def json_dumps(value: Any) -> bytes:
+    """Serialize a JSON-compatible value to UTF-8 bytes"""
+    if HAS_ORJSON:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def json_loads(data: Any) -> Any:
+    """Parse JSON from bytes or str"""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_default(value: Any) -> Any:
+    # NumPy scalars and arrays, which the stats kernel can produce
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encode_bytes_list(value: Optional[List[bytes]]) -> Optional[List[str]]:
+    if value is None:
+        return None
+    return [base64.b64encode(item).decode("ascii") for item in value]
+
+
+def _decode_bytes_list(value: Optional[List[str]]) -> Optional[List[bytes]]:
+    if value is None:
+        return None
+    return [base64.b64decode(item) for item in value]
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+# Per-field converters (encode, decode); fields not listed are stored as-is
+_FIELD_CODECS: Dict[Tuple[str, str], Tuple[Callable, Callable]] = {
+    ("Problem", "type"): (lambda t: t.value, ProblemType),
+    ("Problem", "images"): (_encode_bytes_list, _decode_bytes_list),
+    ("Solution", "plots"): (_encode_bytes_list, _decode_bytes_list),
+    ("ProcessedPDF", "images"): (_encode_bytes_list, _decode_bytes_list),
+    ("ProcessedPDF", "problems"): (
+        lambda problems: [_encode_fields(p) for p in problems],
+        lambda problems: [_decode_fields(Problem, p) for p in problems],
+    ),
+}
+
+_TYPES = {cls.__name__: cls for cls in (Problem, Solution, ProcessedPDF)}
+
+
+def _encode_fields(obj: Any) -> List[Any]:
+    name = type(obj).__name__
+    encoded = []
+    for f in fields(obj):
+        encode, _ = _FIELD_CODECS.get((name, f.name), (_identity, None))
+        encoded.append(encode(getattr(obj, f.name)))
+    return encoded
+
+
+def _decode_fields(cls: type, values: List[Any]) -> Any:
+    cls_fields = fields(cls)
+    if len(values) != len(cls_fields):
+        raise CodecError(f"Expected {len(cls_fields)} fields for {cls.__name__}, got {len(values)}")
+    kwargs = {}
+    for f, value in zip(cls_fields, values):
+        _, decode = _FIELD_CODECS.get((cls.__name__, f.name), (None, _identity))
+        kwargs[f.name] = decode(value) if value is not None else None
+    return cls(**kwargs)
+
+
+def to_payload(obj: Any) -> Dict[str, Any]:
+    """Convert a core type into a JSON-compatible, versioned envelope"""
+    name = type(obj).__name__
+    if name not in _TYPES:
+        raise CodecError(f"Unsupported type: {name}")
+    return {"v": SCHEMA_VERSION, "t": name, "d": _encode_fields(obj)}
+
+
+def from_payload(payload: Dict[str, Any]) -> Any:
+    """Rebuild a core type from an envelope produced by to_payload"""
+    try:
+        version, name, values = payload["v"], payload["t"], payload["d"]
+    except (KeyError, TypeError) as e:
+        raise CodecError(f"Malformed payload: {str(e)}") from e
+    if version != SCHEMA_VERSION:
+        raise CodecError(f"Unsupported schema version {version} (expected {SCHEMA_VERSION})")
+    if name not in _TYPES:
+        raise CodecError(f"Unsupported type: {name}")
+    return _decode_fields(_TYPES[name], values)
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize a core type to bytes"""
+    return json_dumps(to_payload(obj))
+
+
+def loads(data: Any) -> Any:
+    """Deserialize bytes produced by dumps"""
+    try:
+        payload = json_loads(data)
+    except ValueError as e:
+        raise CodecError(f"Invalid encoded data: {str(e)}") from e
+    return from_payload(payload)
+
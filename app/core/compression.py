@@ -0,0 +1,135 @@
+"""
+Negotiated response compression (brotli or gzip)
+
+Pure ASGI middleware, so streamed responses are compressed chunk by chunk
+and WebSocket traffic passes through untouched. The encoding is chosen
+from the client's Accept-Encoding, honouring q-values. Brotli is used only
+when the brotli package is installed. Small bodies, already-encoded
+responses and media that does not compress (PNG plots) are sent as is.
+"""
+import zlib
+from typing import Dict, List, Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from .config import Config
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "image/svg+xml", "application/javascript")
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}"""
+    codings = {}
+    for item in value.split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, number = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+
+def choose_encoding(accept_encoding: str, available: List[str]) -> Optional[str]:
+    """The acceptable coding the client prefers most, ties broken by the order of available"""
+    codings = parse_accept_encoding(accept_encoding)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = codings.get(coding, codings.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=Config.BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits=31 writes a gzip header and trailer
+            self._zlib = zlib.compressobj(Config.GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """Compress HTTP responses with the best encoding the client accepts"""
+
+    def __init__(self, app: ASGIApp, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else Config.COMPRESSION_MIN_SIZE
+        self.available = (["br"] if HAS_BROTLI else []) + ["gzip"]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.available)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether compressing is worthwhile
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=list(start["headers"]))
+                media_type = headers.get("content-type", "")
+                if ("content-encoding" in headers or not media_type.startswith(COMPRESSIBLE_TYPES)
+                        or (not more_body and len(body) < self.minimum_size)):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                    await send({**start, "headers": headers.raw})
+                    await send({**message, "body": compressor.compress(body)})
+                else:
+                    compressed = compressor.finish(body)
+                    headers["Content-Length"] = str(len(compressed))
+                    await send({**start, "headers": headers.raw})
+                    await send({**message, "body": compressed})
+                return
+            if more_body:
+                await send({**message, "body": compressor.compress(body)})
+            else:
+                await send({**message, "body": compressor.finish(body)})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,6 +1,8 @@
 """Configuration management for the Math Agent System"""
 import os
-from typing import Optional
+import tempfile
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 import logging
 
@@ -15,6 +17,28 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _parse_prices(value: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "model=input/output,..." prices in USD per million tokens"""
+    prices = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        model, price = item.split("=", 1)
+        input_price, _, output_price = price.partition("/")
+        prices[model.strip()] = (float(input_price), float(output_price or input_price))
+    return prices
+
+
+def _parse_providers(value: str) -> List[Tuple[str, str]]:
+    """Parse "mistral,name=base_url,..." into (name, base_url) pairs, in order of preference"""
+    providers = []
+    for item in value.split(","):
+        name, _, base_url = item.strip().partition("=")
+        if name.strip():
+            providers.append((name.strip(), base_url.strip()))
+    return providers
+
+
 class Config:
     """Application configuration"""
     
@@ -27,8 +51,146 @@ class Config:
     TEMPERATURE: float = float(os.getenv("TEMPERATURE", "0.2"))
     TOP_P: float = float(os.getenv("TOP_P", "0.95"))
     
+    # Ensemble (self-consistency) Configuration - disabled when size is 1
+    ENSEMBLE_SIZE: int = int(os.getenv("ENSEMBLE_SIZE", "1"))
+    ENSEMBLE_TEMPERATURES: List[float] = [
+        float(t) for t in os.getenv("ENSEMBLE_TEMPERATURES", "0.2,0.5,0.8").split(",") if t.strip()
+    ]
+    ENSEMBLE_MODELS: List[str] = [
+        m.strip() for m in os.getenv("ENSEMBLE_MODELS", "").split(",") if m.strip()
+    ]
+    ENSEMBLE_QUORUM: int = int(os.getenv("ENSEMBLE_QUORUM", "0"))  # 0 means simple majority
+    ENSEMBLE_TOLERANCE: float = float(os.getenv("ENSEMBLE_TOLERANCE", "1e-6"))
+    
+    # Multi-part problems are solved part by part, concurrently where parts are independent
+    DECOMPOSE_ENABLED: bool = os.getenv("DECOMPOSE_ENABLED", "True").lower() == "true"
+    DECOMPOSE_MAX_CONCURRENCY: int = int(os.getenv("DECOMPOSE_MAX_CONCURRENCY", "4"))
+    
+    # Record/replay of LLM completions: off, record, replay (offline) or auto (replay, record misses)
+    LLM_CASSETTE_MODE: str = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+    LLM_CASSETTE_PATH: str = os.getenv("LLM_CASSETTE_PATH", "cassettes/llm.jsonl")
+    LLM_REPLAY_LATENCY_SCALE: float = float(os.getenv("LLM_REPLAY_LATENCY_SCALE", "0"))  # 1 replays recorded latency
+    
+    # LLM backends in order of preference: "mistral" and/or name=base_url of OpenAI-compatible servers
+    LLM_PROVIDERS: List[Tuple[str, str]] = _parse_providers(os.getenv("LLM_PROVIDERS", "mistral"))
+    LLM_PROVIDER_MODELS: Dict[str, str] = dict(_parse_providers(os.getenv("LLM_PROVIDER_MODELS", "")))  # name=model to serve
+    OPENAI_COMPAT_API_KEY: str = os.getenv("OPENAI_COMPAT_API_KEY", "")
+    
+    # Hedged requests: duplicate a request with no token after this percentile of recent time to first token
+    # (unset: on only when more than one backend is configured)
+    LLM_HEDGE_ENABLED: Optional[bool] = (os.getenv("LLM_HEDGE_ENABLED").lower() == "true"
+                                         if os.getenv("LLM_HEDGE_ENABLED") else None)
+    LLM_HEDGE_PERCENTILE: float = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    LLM_HEDGE_DELAY: float = float(os.getenv("LLM_HEDGE_DELAY", "2.0"))  # seconds, until enough latencies are seen
+    LLM_HEDGE_MIN_DELAY: float = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.25"))
+    
+    # Circuit breaking: a backend failing this many times in a row is skipped for the cool-down
+    LLM_CIRCUIT_FAILURES: int = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))
+    LLM_CIRCUIT_COOLDOWN: float = float(os.getenv("LLM_CIRCUIT_COOLDOWN", "30"))
+    
+    # Runtime profiles (low-latency, balanced, high-quality); PROFILES_FILE is hot-reloaded
+    PROFILES_FILE: str = os.getenv("PROFILES_FILE", "profiles.json")
+    DEFAULT_PROFILE: str = os.getenv("DEFAULT_PROFILE", "balanced")
+    PROFILE_RELOAD_INTERVAL: float = float(os.getenv("PROFILE_RELOAD_INTERVAL", "5"))  # seconds between file checks
+    PROFILE_AUDIT_SIZE: int = int(os.getenv("PROFILE_AUDIT_SIZE", "1000"))
+    
+    # Fair scheduling of solves across sessions (deficit round-robin over estimated tokens)
+    SCHEDULER_CONCURRENCY: int = int(os.getenv("SCHEDULER_CONCURRENCY", "8"))  # solves in flight per worker
+    SCHEDULER_QUANTUM: int = int(os.getenv("SCHEDULER_QUANTUM", "4096"))  # tokens credited per turn
+    SCHEDULER_MAX_QUEUED: int = int(os.getenv("SCHEDULER_MAX_QUEUED", "100"))  # per session or API key
+    SCHEDULER_BACKGROUND_RESERVE: int = int(os.getenv("SCHEDULER_BACKGROUND_RESERVE", "2"))  # slots background work never uses
+    
+    # Per session/API key quotas per window; 0 disables a limit
+    QUOTA_WINDOW_SECONDS: int = int(os.getenv("QUOTA_WINDOW_SECONDS", "3600"))
+    QUOTA_REQUESTS: int = int(os.getenv("QUOTA_REQUESTS", "0"))
+    QUOTA_TOKENS: int = int(os.getenv("QUOTA_TOKENS", "0"))
+    
+    # Problems one WebSocket connection may have in flight at once
+    WS_MAX_INFLIGHT: int = int(os.getenv("WS_MAX_INFLIGHT", "32"))
+    
+    # Speculative pre-solving of uploaded problems into the solution cache (per-document budget)
+    PRESOLVE_ENABLED: bool = os.getenv("PRESOLVE_ENABLED", "False").lower() == "true"
+    PRESOLVE_MAX_PROBLEMS: int = int(os.getenv("PRESOLVE_MAX_PROBLEMS", "20"))
+    PRESOLVE_TOKEN_BUDGET: int = int(os.getenv("PRESOLVE_TOKEN_BUDGET", "100000"))
+    
+    # Problems per page of an upload's problem list, and how long the list stays pageable
+    PROBLEM_PAGE_SIZE: int = int(os.getenv("PROBLEM_PAGE_SIZE", "100"))
+    PROBLEM_PAGE_MAX: int = int(os.getenv("PROBLEM_PAGE_MAX", "500"))
+    DOCUMENT_TTL: int = int(os.getenv("DOCUMENT_TTL", str(24 * 3600)))
+    
+    # Negotiated brotli/gzip compression of responses of at least COMPRESSION_MIN_SIZE bytes
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "True").lower() == "true"
+    COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    GZIP_LEVEL: int = int(os.getenv("GZIP_LEVEL", "6"))
+    BROTLI_QUALITY: int = int(os.getenv("BROTLI_QUALITY", "5"))
+    
+    # Solve one representative per group of duplicate/parameter-variant problems in an upload
+    VARIANT_GROUPING_ENABLED: bool = os.getenv("VARIANT_GROUPING_ENABLED", "True").lower() == "true"
+    
+    # Server-side LaTeX pre-rendering: "" (off, browser renders), "mathml" or "svg"
+    LATEX_PRERENDER: str = os.getenv("LATEX_PRERENDER", "")
+    LATEX_RENDER_CACHE_TTL: int = int(os.getenv("LATEX_RENDER_CACHE_TTL", str(30 * 24 * 3600)))
+    
+    # Seconds allowed for SymPy work on user text (MATLAB templates, equation LaTeX, variants); it runs off the event loop
+    SYMPY_TIMEOUT: float = float(os.getenv("SYMPY_TIMEOUT", "2"))
+    
+    # Server-side distribution/function plots (needs matplotlib), rendered in a process pool
+    PLOTS_ENABLED: bool = os.getenv("PLOTS_ENABLED", "True").lower() == "true"
+    PLOT_FORMAT: str = os.getenv("PLOT_FORMAT", "png")  # png or svg
+    PLOT_WORKERS: int = int(os.getenv("PLOT_WORKERS", "2"))
+    PLOT_RENDER_TIMEOUT: float = float(os.getenv("PLOT_RENDER_TIMEOUT", "20"))
+    PLOT_CACHE_TTL: int = int(os.getenv("PLOT_CACHE_TTL", str(30 * 24 * 3600)))
+    PLOT_FAILURE_TTL: int = int(os.getenv("PLOT_FAILURE_TTL", "600"))  # failed renders are not retried for this long
+    
+    # Token/cost accounting, aggregated in memory and flushed to SQLite (outside the source tree by default)
+    ACCOUNTING_DB_PATH: str = os.getenv(
+        "ACCOUNTING_DB_PATH", os.path.join(tempfile.gettempdir(), "math-agent", "usage.db")
+    )
+    ACCOUNTING_FLUSH_SECONDS: float = float(os.getenv("ACCOUNTING_FLUSH_SECONDS", "60"))
+    MODEL_PRICES: Dict[str, Tuple[float, float]] = _parse_prices(os.getenv(
+        "MODEL_PRICES",
+        "mistral-small-latest=0.1/0.3,mistral-medium-latest=0.4/2.0,mistral-large-latest=2.0/6.0"
+    ))
+    
+    # Profiling: admin sampling profiles and capture of requests slower than SLOW_REQUEST_SECONDS (0 disables)
+    PROFILING_MAX_SECONDS: float = float(os.getenv("PROFILING_MAX_SECONDS", "60"))
+    PROFILING_SAMPLE_INTERVAL: float = float(os.getenv("PROFILING_SAMPLE_INTERVAL", "0.01"))
+    SLOW_REQUEST_SECONDS: float = float(os.getenv("SLOW_REQUEST_SECONDS", "5"))
+    SLOW_REQUEST_PATHS: List[str] = [
+        p.strip() for p in os.getenv("SLOW_REQUEST_PATHS", "/solve,/solve-text,/upload").split(",") if p.strip()
+    ]
+    SLOW_REQUEST_KEEP: int = int(os.getenv("SLOW_REQUEST_KEEP", "50"))
+    
+    # Token required in the X-Admin-Token header for /api/admin endpoints (disabled when empty)
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+    
+    # Deployment Configuration - set SESSION_SECRET (same value on every worker)
+    # to share sessions across processes; list old secrets in SESSION_SECRET_PREVIOUS
+    # while rotating so existing cookies stay valid
+    SESSION_SECRET: str = os.getenv("SESSION_SECRET", "")
+    SESSION_SECRET_PREVIOUS: List[str] = [
+        s.strip() for s in os.getenv("SESSION_SECRET_PREVIOUS", "").split(",") if s.strip()
+    ]
+    SESSION_MAX_AGE: int = int(os.getenv("SESSION_MAX_AGE", "86400"))
+    STATE_STORE_URL: str = os.getenv("STATE_STORE_URL", "memory://")
+    # memory:// only: least recently used keys are evicted beyond this (session keys are exempt), and expired ones swept periodically
+    MEMORY_STORE_MAX_ENTRIES: int = int(os.getenv("MEMORY_STORE_MAX_ENTRIES", "10000"))
+    MEMORY_STORE_PURGE_SECONDS: float = float(os.getenv("MEMORY_STORE_PURGE_SECONDS", "60"))
+    
+    # Cache Configuration (seconds)
+    SOLUTION_CACHE_TTL: int = int(os.getenv("SOLUTION_CACHE_TTL", str(7 * 86400)))
+    PAGE_CACHE_TTL: int = int(os.getenv("PAGE_CACHE_TTL", str(7 * 86400)))
+    
+    # Warmup Configuration
+    WARMUP_ENABLED: bool = os.getenv("WARMUP_ENABLED", "True").lower() == "true"
+    WARMUP_SYNTHETIC_SOLVE: bool = os.getenv("WARMUP_SYNTHETIC_SOLVE", "False").lower() == "true"
+    
     # Application Configuration
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
+    CLIENT_CACHE_SIZE: int = int(os.getenv("CLIENT_CACHE_SIZE", "32"))
+    
+    # Mistral clients keyed by API key, most recently used last
+    _clients: "OrderedDict[str, Any]" = OrderedDict()
     
     @classmethod
     def get_api_key(cls, session_key: Optional[str] = None) -> str:
@@ -51,9 +213,18 @@ class Config:
     
     @classmethod
     def get_mistral_client(cls, api_key: Optional[str] = None):
-        """Get a configured Mistral AI client"""
+        """Get a configured Mistral AI client, reusing its connection pool per API key"""
         from mistralai import Mistral
         key = cls.get_api_key(api_key)
         cls.validate(key)
-        return Mistral(api_key=key)
+        client = cls._clients.get(key)
+        if client is None:
+            client = Mistral(api_key=key)
+            cls._clients[key] = client
+            # Keep the cache bounded when many session keys are in use
+            while len(cls._clients) > cls.CLIENT_CACHE_SIZE:
+                cls._clients.popitem(last=False)
+        else:
+            cls._clients.move_to_end(key)
+        return client
 
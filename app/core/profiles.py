@@ -0,0 +1,242 @@
+"""
+Named runtime profiles with per-request overrides and hot-reload
+
+A profile fixes the model and sampling settings used for a request
+(low-latency, balanced, high-quality, or any defined in PROFILES_FILE).
+Requests may pick a profile and override individual settings within safe
+ranges. The profile file is re-read when it changes or on SIGHUP, so
+settings change without restarting workers, and every request's effective
+profile is kept in an audit log.
+"""
+import contextvars
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from .codec import json_dumps, json_loads
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Allowed ranges for settings that requests may override
+SAFE_RANGES: Dict[str, Tuple[float, float]] = {
+    "max_tokens": (64, 4096),
+    "temperature": (0.0, 1.0),
+    "top_p": (0.1, 1.0),
+    "ensemble_size": (1, 5),
+}
+_INTEGER_SETTINGS = ("max_tokens", "ensemble_size")
+
+
+def _validated(key: str, value: Any) -> Any:
+    """A numeric setting checked against SAFE_RANGES and cast to its type; raises ValueError"""
+    low, high = SAFE_RANGES[key]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+        raise ValueError(f"{key} must be between {low} and {high}")
+    if key in _INTEGER_SETTINGS:
+        if value != int(value):
+            raise ValueError(f"{key} must be a whole number")
+        return int(value)
+    return float(value)
+
+
+@dataclass(frozen=True)
+class RuntimeProfile:
+    name: str
+    model: str
+    max_tokens: int
+    temperature: float
+    top_p: float
+    ensemble_size: int = 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def fingerprint(self, ensemble: Optional[int] = None) -> str:
+        """Digest of the settings a solution is produced with, optionally with a per-request ensemble size"""
+        settings = {**self.to_dict(), "ensemble_size": ensemble or self.ensemble_size}
+        return hashlib.sha256(json_dumps(settings)).hexdigest()[:16]
+
+
+def default_profiles() -> Dict[str, RuntimeProfile]:
+    """Built-in profiles; "balanced" follows the environment configuration"""
+    return {
+        "low-latency": RuntimeProfile(
+            name="low-latency", model="mistral-small-latest", max_tokens=1024, temperature=0.1, top_p=0.9
+        ),
+        "balanced": RuntimeProfile(
+            name="balanced",
+            model=Config.MISTRAL_MODEL,
+            max_tokens=Config.MAX_TOKENS,
+            temperature=Config.TEMPERATURE,
+            top_p=Config.TOP_P,
+            ensemble_size=Config.ENSEMBLE_SIZE,
+        ),
+        "high-quality": RuntimeProfile(
+            name="high-quality", model="mistral-large-latest", max_tokens=4096, temperature=0.2, top_p=0.95,
+            ensemble_size=3,
+        ),
+    }
+
+
+_active: contextvars.ContextVar[Optional[RuntimeProfile]] = contextvars.ContextVar("runtime_profile", default=None)
+
+
+class ProfileRegistry:
+    """Holds the current profiles, reloads them from a file and audits their use"""
+
+    def __init__(self, path: Optional[str] = None, default: Optional[str] = None,
+                 audit_size: Optional[int] = None):
+        self.path = path if path is not None else Config.PROFILES_FILE
+        self.default = default or Config.DEFAULT_PROFILE
+        self.version = 0
+        self._profiles = default_profiles()
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.audit: Deque[Dict[str, Any]] = deque(maxlen=audit_size or Config.PROFILE_AUDIT_SIZE)
+        self.reload()
+
+    @property
+    def profiles(self) -> Dict[str, RuntimeProfile]:
+        self._maybe_reload()
+        return self._profiles
+
+    def reload(self) -> bool:
+        """
+        Re-read the profile file
+
+        The file is a JSON object mapping profile names to settings; settings
+        not given are taken from the built-in profile of the same name (or
+        "balanced"). An optional "default" key names the default profile.
+
+        Returns:
+            True if the profiles changed, False if there is no file or it is invalid
+        """
+        with self._lock:
+            if not self.path or not os.path.exists(self.path):
+                return False
+            try:
+                mtime = os.path.getmtime(self.path)
+                with open(self.path, "rb") as f:
+                    data = json_loads(f.read())
+                profiles, default = self._parse(data)
+            except (OSError, ValueError, TypeError) as e:
+                # Keep serving the last good profiles
+                logger.error(f"Ignoring invalid profile file {self.path}: {str(e)}")
+                return False
+            self._profiles, self._mtime = profiles, mtime
+            self.default = default
+            self.version += 1
+            logger.info(f"Loaded runtime profiles v{self.version} from {self.path}: {', '.join(profiles)}")
+            self.audit.append({"time": time.time(), "event": "reload", "version": self.version})
+            return True
+
+    def _parse(self, data: Any) -> Tuple[Dict[str, RuntimeProfile], str]:
+        if not isinstance(data, dict):
+            raise ValueError("profile file must contain a JSON object")
+        base = default_profiles()
+        default = data.get("default", self.default)
+        known = {f.name for f in fields(RuntimeProfile)} - {"name"}
+        profiles = dict(base)
+        for name, settings in data.items():
+            if name == "default":
+                continue
+            if not isinstance(settings, dict) or set(settings) - known:
+                raise ValueError(f"invalid settings for profile '{name}'")
+            # One bad value rejects the whole file, so the last good profiles stay active
+            checked = {}
+            for key, value in settings.items():
+                if key == "model":
+                    if not isinstance(value, str) or not value.strip():
+                        raise ValueError(f"profile '{name}': model must be a non-empty string")
+                    checked[key] = value
+                else:
+                    try:
+                        checked[key] = _validated(key, value)
+                    except ValueError as e:
+                        raise ValueError(f"profile '{name}': {str(e)}") from None
+            profiles[name] = replace(base.get(name, base["balanced"]), name=name, **checked)
+        if default not in profiles:
+            raise ValueError(f"default profile '{default}' is not defined")
+        return profiles, default
+
+    def _maybe_reload(self) -> None:
+        """Pick up edits to the profile file, checking its mtime at most once per interval"""
+        now = time.monotonic()
+        if not self.path or now - self._checked_at < Config.PROFILE_RELOAD_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def resolve(self, name: Optional[str] = None, overrides: Optional[Dict[str, Any]] = None) -> RuntimeProfile:
+        """
+        The profile for a request
+
+        Args:
+            name: Profile name, or None for the default profile
+            overrides: Settings to change for this request only
+
+        Returns:
+            The named profile with overrides applied
+
+        Raises:
+            ValueError: If the profile is unknown or an override is not allowed
+        """
+        profiles = self.profiles
+        profile = profiles.get(name or self.default)
+        if profile is None:
+            raise ValueError(f"Unknown profile '{name}'. Available: {', '.join(profiles)}")
+        if not overrides:
+            return profile
+        changes: Dict[str, Any] = {}
+        for key, value in overrides.items():
+            if key == "model":
+                allowed = sorted({p.model for p in profiles.values()})
+                if value not in allowed:
+                    raise ValueError(f"Model must be one of: {', '.join(allowed)}")
+                changes[key] = value
+            elif key in SAFE_RANGES:
+                changes[key] = _validated(key, value)
+            else:
+                raise ValueError(f"Setting '{key}' cannot be overridden")
+        return replace(profile, **changes)
+
+    def activate(self, name: Optional[str] = None, overrides: Optional[Dict[str, Any]] = None,
+                 **audit: Any) -> RuntimeProfile:
+        """Resolve a profile, make it current for this request (and its tasks) and audit it"""
+        profile = self.resolve(name, overrides)
+        _active.set(profile)
+        self.audit.append({
+            "time": time.time(),
+            "event": "request",
+            "version": self.version,
+            "profile": profile.name,
+            "overrides": overrides or {},
+            **audit,
+        })
+        return profile
+
+    def recent(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Most recent audit entries, newest first"""
+        return list(reversed(self.audit))[:limit]
+
+
+def current_profile() -> RuntimeProfile:
+    """The profile active for the current request, or the default one outside a request"""
+    profile = _active.get()
+    if profile is None:
+        profile = profiles.resolve()
+    return profile
+
+
+profiles = ProfileRegistry()
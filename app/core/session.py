@@ -0,0 +1,34 @@
+"""Session middleware with a shared, rotatable signing secret"""
+import logging
+import secrets
+from typing import List
+import itsdangerous
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.types import ASGIApp
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class RotatingSessionMiddleware(SessionMiddleware):
+    """
+    SessionMiddleware that signs with the current secret but still accepts
+    cookies signed with any previous secret, so secrets can be rotated
+    across workers without logging everyone out
+    """
+
+    def __init__(self, app: ASGIApp, secret_keys: List[str], **kwargs):
+        super().__init__(app, secret_key=secret_keys[-1], **kwargs)
+        # itsdangerous signs with the last key and verifies against all of them
+        self.signer = itsdangerous.TimestampSigner(secret_keys)
+
+
+def get_session_secrets() -> List[str]:
+    """Session secrets ordered oldest to newest (the last one signs new cookies)"""
+    if not Config.SESSION_SECRET:
+        logger.warning(
+            "SESSION_SECRET is not set; using a per-process secret. "
+            "Sessions will not be shared between workers or survive restarts."
+        )
+        return [secrets.token_urlsafe(32)]
+    return Config.SESSION_SECRET_PREVIOUS + [Config.SESSION_SECRET]
@@ -1,7 +1,11 @@
+import sys
 from dataclasses import dataclass
 from typing import Optional, List, Dict, Any
 from enum import Enum
 
+# Slotted dataclasses drop the per-instance __dict__ (Python 3.10+)
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
 class ProblemType(Enum):
     GENERAL = "general"
     ALGEBRA = "algebra"
@@ -10,7 +14,7 @@ class ProblemType(Enum):
     STATISTICS = "statistics"
     LINEAR_ALGEBRA = "linear_algebra"
 
-@dataclass
+@dataclass(**_SLOTS)
 class Problem:
     text: str
     type: ProblemType
@@ -18,7 +22,7 @@ class Problem:
     context: Optional[Dict[str, Any]] = None
     images: Optional[List[bytes]] = None
 
-@dataclass
+@dataclass(**_SLOTS)
 class Solution:
     explanation: str
     steps: List[str]
@@ -28,9 +32,9 @@ class Solution:
     numerical_result: Optional[Any] = None
     confidence: float = 1.0
 
-@dataclass
+@dataclass(**_SLOTS)
 class ProcessedPDF:
     text: str
     images: List[bytes]
     problems: List[Problem]
-    metadata: Dict[str, Any] 
\ No newline at end of file
+    metadata: Dict[str, Any] 
@@ -1,19 +1,44 @@
+import asyncio
+import base64
+import hashlib
 import logging
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request
-from fastapi.responses import HTMLResponse
+import time
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from starlette.middleware.sessions import SessionMiddleware
+from contextlib import asynccontextmanager
 import secrets
+import signal
 
 from .services.pdf_processor import PDFProcessor
 from .services.text_processor import TextProcessor
 from .agents.probability_agent import ProbabilityAgent
 from .agents.general_agent import GeneralAgent
+from .agents.ensemble import EnsembleSolver
+from .agents.decomposer import DecompositionSolver
+from .agents.base_agent import BaseAgent
 from .core.types import Problem, Solution, ProblemType
 from .core.config import Config
-from pydantic import BaseModel
-from typing import Optional
+from .core.codec import HAS_ORJSON, json_loads
+from .core.compression import CompressionMiddleware
+from .core.session import RotatingSessionMiddleware, get_session_secrets
+from .core.profiles import SAFE_RANGES, current_profile, profiles
+from .services.state_store import create_state_store
+from .services.warmup import Warmup
+from .services.solution_cache import SolutionCache, problem_fingerprint
+from .services.accounting import accountant, tag_usage
+from .services.latex import LatexRenderer
+from .services.scheduler import FairScheduler, QuotaExceededError, estimate_tokens
+from .services.presolver import SpeculativeSolver
+from .services.variants import VariantSolver, group_problems
+from .services.llm_providers import get_router
+from .services.cassette import get_cassette
+from .services.plots import PlotRenderer, plot_specs
+from .services.matlab_codegen import run_sympy
+from .services.profiler import ProfilingMiddleware, collapsed, mark, request_profiler, sampler, stage
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -21,10 +46,17 @@ logger = logging.getLogger(__name__)
 # This is important for Vercel serverless functions
 _config_validated = False
 
-def validate_config_on_demand(request: Request):
+# Shared store for per-user state, caches and job results (see STATE_STORE_URL)
+state_store = create_state_store(Config.STATE_STORE_URL)
+
+async def validate_config_on_demand(request: Request):
     """Validate configuration when first needed, checking session first"""
     global _config_validated
-    session_key = request.session.get("mistral_api_key")
+    # Pure replay serves every completion from the cassette, so no API key is needed
+    cassette = get_cassette()
+    if cassette is not None and cassette.mode == "replay":
+        return
+    session_key = await get_api_key_from_session(request)
     
     try:
         Config.validate(session_key)
@@ -36,21 +68,77 @@ def validate_config_on_demand(request: Request):
             detail=f"API key not configured. Please set your Mistral API key in settings."
         )
 
-def get_api_key_from_session(request: Request) -> Optional[str]:
-    """Get API key from session"""
-    return request.session.get("mistral_api_key")
+def get_session_id(request: Request) -> str:
+    """Get the session ID, creating one on first use"""
+    session_id = request.session.get("session_id")
+    if not session_id:
+        session_id = secrets.token_urlsafe(16)
+        request.session["session_id"] = session_id
+    return session_id
+
+def require_admin(request: Request) -> None:
+    """Allow /api/admin endpoints only with the configured admin token"""
+    if not Config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = request.headers.get("X-Admin-Token", "")
+    if not secrets.compare_digest(token, Config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+async def get_api_key_from_session(request: Request) -> Optional[str]:
+    """Get API key for this session from the shared state store"""
+    session_id = request.session.get("session_id")
+    if not session_id:
+        return None
+    return await state_store.get(f"session:{session_id}:api_key")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown"""
+    # Warm up in the background so /health answers while /ready reports 503
+    accountant.start()
+    # SIGHUP reloads runtime profiles without restarting the worker
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, profiles.reload)
+    except (NotImplementedError, RuntimeError, AttributeError):
+        logger.info("SIGHUP profile reload not available on this platform")
+    warmup_task = None
+    if Config.WARMUP_ENABLED:
+        warmup_task = asyncio.create_task(warmup.run())
+    else:
+        warmup.ready = True
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await presolver.close()
+    await plot_renderer.close()
+    await get_router().close()
+    await accountant.close()
+    await state_store.close()
 
 # Initialize FastAPI app
-app = FastAPI(title="Math Agent System")
+# orjson-backed responses when available (faster encoding of large problem lists)
+app = FastAPI(
+    title="Math Agent System",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse if HAS_ORJSON else JSONResponse
+)
 
-# Add session middleware for secure API key storage
+# Add session middleware; the cookie only carries the session ID, and the
+# API key itself lives in the shared state store
 app.add_middleware(
-    SessionMiddleware,
-    secret_key=secrets.token_urlsafe(32),
-    max_age=86400,  # 24 hours
+    RotatingSessionMiddleware,
+    secret_keys=get_session_secrets(),
+    max_age=Config.SESSION_MAX_AGE,
     same_site="lax"
 )
 
+# Negotiated brotli/gzip compression of large JSON responses
+if Config.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Stage breakdowns and stack samples of slow /solve, /solve-text and /upload requests
+app.add_middleware(ProfilingMiddleware, profiler=request_profiler)
+
 # Mount static files (optional - only if directory exists)
 import os
 static_dir = "app/static"
@@ -64,28 +152,211 @@ else:
 templates = Jinja2Templates(directory="app/templates")
 
 # Initialize services
-pdf_processor = PDFProcessor()
+pdf_processor = PDFProcessor(store=state_store)
+solution_cache = SolutionCache(state_store)
+scheduler = FairScheduler(state_store)
+latex_renderer = LatexRenderer(state_store)
+plot_renderer = PlotRenderer(state_store)
 text_processor = TextProcessor()
+warmup = Warmup(templates, pdf_processor, text_processor)
 # Agents will be created per-request with session API keys
 
+# Largest voting ensemble a request may ask for, the same bound as profile overrides
+MAX_ENSEMBLE = int(SAFE_RANGES["ensemble_size"][1])
+
 # Request models
 class TextInputRequest(BaseModel):
     text: str
     problem_type: Optional[str] = None
+    ensemble: Optional[int] = Field(None, ge=1, le=MAX_ENSEMBLE)  # Number of concurrent solves to vote over
+    profile: Optional[str] = None  # low-latency, balanced, high-quality or a custom profile
+    overrides: Optional[Dict[str, Any]] = None  # Per-request settings within safe ranges
 
 class ApiKeyRequest(BaseModel):
     api_key: str
 
+def get_agent(problem: Problem, api_key: Optional[str],
+              agents: Optional[Dict[type, BaseAgent]] = None) -> BaseAgent:
+    """Agent for the problem's type, reused from agents when given (e.g. per WebSocket connection)"""
+    # Select appropriate agent based on problem type
+    if problem.type in [ProblemType.PROBABILITY, ProblemType.STATISTICS]:
+        agent_class = ProbabilityAgent
+    else:
+        # Use general agent for all other problem types
+        logger.info(f"Using GeneralAgent for problem type: {problem.type.value}")
+        agent_class = GeneralAgent
+    if agents is None:
+        return agent_class(api_key=api_key)
+    if agent_class not in agents:
+        agents[agent_class] = agent_class(api_key=api_key)
+    return agents[agent_class]
+
+async def solve_with_agent(problem: Problem, api_key: Optional[str], ensemble: Optional[int] = None,
+                           agents: Optional[Dict[type, BaseAgent]] = None) -> Solution:
+    """Solve a problem with the agent for its type, optionally as a voting ensemble and part by part"""
+    agent = get_agent(problem, api_key, agents)
+    
+    solver = agent
+    size = ensemble or current_profile().ensemble_size
+    if size > 1:
+        solver = EnsembleSolver(agent, size=size)
+    if Config.DECOMPOSE_ENABLED:
+        solver = DecompositionSolver(solver)
+    return await solver.solve(problem)
+
+# Background solving of uploaded problems, at lower priority than any request
+presolver = SpeculativeSolver(scheduler, solution_cache, solve_with_agent)
+# Duplicates and parameter variants within an upload, served from one solved representative
+variant_solver = VariantSolver(state_store)
+
+def get_tenant(request: Request, api_key: Optional[str]) -> str:
+    """Scheduling and quota identity: the user's own API key if set, otherwise the session"""
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return "session:" + get_session_id(request)
+
+async def solve_cached(problem: Problem, api_key: Optional[str], tenant: str, lane: str,
+                       ensemble: Optional[int] = None,
+                       agents: Optional[Dict[type, BaseAgent]] = None) -> Tuple[Solution, bool]:
+    """Return a cached solution for an unchanged problem, or schedule a solve and cache it"""
+    with stage("cache"):
+        solution = await solution_cache.get(problem, ensemble)
+    if solution is not None:
+        logger.info("Reusing cached solution")
+        return solution, True
+    with stage("presolve_wait"):
+        solution = await presolver.wait_for(problem, ensemble)
+    if solution is not None:
+        logger.info("Reusing speculatively pre-solved solution")
+        return solution, True
+    with stage("variant"):
+        grouped = await variant_solver.solve(
+            problem, tenant, lambda representative: solve_cached(representative, api_key, tenant, lane, ensemble, agents),
+            current_profile().fingerprint(ensemble)
+        )
+    if grouped is not None:
+        solution, cached = grouped
+        if not cached:
+            await solution_cache.put(problem, solution, ensemble)
+        return solution, cached
+    cost = estimate_tokens(problem, ensemble or current_profile().ensemble_size)
+    queued = time.perf_counter()
+
+    async def job() -> Solution:
+        mark("queue", time.perf_counter() - queued)
+        with stage("solve"):
+            return await solve_with_agent(problem, api_key, ensemble, agents)
+
+    solution = await scheduler.run(tenant, job, cost=cost, lane=lane)
+    await solution_cache.put(problem, solution, ensemble)
+    return solution, False
+
+SOLUTION_FIELDS = ["explanation", "steps", "matlab_code", "latex_solution", "confidence"]
+RENDERED_FIELDS = ["latex_rendered", "plots"]
+
+def parse_ensemble(value: Any) -> Optional[int]:
+    """
+    Ensemble size from an untyped message (e.g. over the WebSocket)
+
+    Raises:
+        ValueError: If it is not a whole number between 1 and MAX_ENSEMBLE
+    """
+    if value is None:
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= MAX_ENSEMBLE:
+        raise ValueError(f"ensemble must be a whole number between 1 and {MAX_ENSEMBLE}")
+    return value
+
+def parse_fields(fields: Optional[Iterable[str]]) -> Optional[Set[str]]:
+    """
+    Solution fields a client asked for, e.g. from ?fields=steps,latex_solution
+
+    Returns:
+        The selected fields, or None for all of them
+
+    Raises:
+        ValueError: If a field name is unknown
+    """
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    selected = {field.strip() for field in fields if field.strip()}
+    unknown = selected.difference(SOLUTION_FIELDS, RENDERED_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. "
+                         f"Available: {', '.join(SOLUTION_FIELDS + RENDERED_FIELDS)}")
+    return selected or None
+
+def solution_to_dict(solution: Solution, fields: Optional[Set[str]] = None) -> dict:
+    """Response fields shared by all endpoints that return a solution, optionally only the selected ones"""
+    return {
+        field: getattr(solution, field)
+        for field in SOLUTION_FIELDS
+        if fields is None or field in fields
+    }
+
+async def solution_response(solution: Solution, problem: Optional[Problem] = None,
+                            fields: Optional[Set[str]] = None) -> dict:
+    """solution_to_dict plus pre-rendered LaTeX and links to plots rendering in the background"""
+    response = solution_to_dict(solution, fields)
+    with stage("render"):
+        # Rendering is skipped for fields the client did not ask for
+        if latex_renderer.enabled and (fields is None or "latex_rendered" in fields):
+            response["latex_rendered"] = await latex_renderer.render_solution(solution)
+        if problem is not None and plot_renderer.enabled and (fields is None or "plots" in fields):
+            specs = await run_sympy(plot_specs, problem, solution) or []
+            response["plots"] = [await plot_renderer.submit(spec) for spec in specs]
+    return response
+
+def encode_cursor(document_id: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{offset}:{document_id}".encode("ascii")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, document_id: str) -> int:
+    """Offset encoded in a cursor of the given document's problem list; raises ValueError if invalid"""
+    try:
+        offset, _, cursor_document = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii").partition(":")
+        if cursor_document != document_id or int(offset) < 0:
+            raise ValueError
+        return int(offset)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor") from None
+
+def page_limit(limit: Optional[int]) -> int:
+    return min(max(limit or Config.PROBLEM_PAGE_SIZE, 1), Config.PROBLEM_PAGE_MAX)
+
+async def with_status(entries: List[Dict[str, Any]], fields: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Problem list entries with their cache status
+
+    Problems whose normalized text is unchanged since an earlier upload
+    come back with their cached solution and need no re-solve.
+    """
+    problems = []
+    for entry in entries:
+        entry = dict(entry)
+        cached = await solution_cache.get(Problem(text=entry["text"], type=ProblemType(entry["type"])))
+        if cached is not None:
+            entry["status"] = "reused"
+            entry["solution"] = solution_to_dict(cached, fields)
+        else:
+            entry["status"] = "recompute"
+        problems.append(entry)
+    return problems
+
 @app.post("/api/set-api-key")
 async def set_api_key(request: Request, api_key_request: ApiKeyRequest):
     """Set or update the Mistral API key in the session"""
     try:
-        # Validate the API key by trying to create a client
-        from mistralai import Mistral
-        
         # Try a simple validation - just store it if it's not empty
         if api_key_request.api_key and len(api_key_request.api_key.strip()) > 0:
-            request.session["mistral_api_key"] = api_key_request.api_key.strip()
+            await state_store.set(
+                f"session:{get_session_id(request)}:api_key",
+                api_key_request.api_key.strip(),
+                ttl=Config.SESSION_MAX_AGE
+            )
             logger.info("API key set in session")
             return {
                 "status": "success",
@@ -102,7 +373,7 @@ async def set_api_key(request: Request, api_key_request: ApiKeyRequest):
 @app.get("/api/check-api-key")
 async def check_api_key(request: Request):
     """Check if API key is configured"""
-    session_key = get_api_key_from_session(request)
+    session_key = await get_api_key_from_session(request)
     env_key = Config.MISTRAL_API_KEY
     
     has_key = bool(session_key or env_key)
@@ -113,12 +384,22 @@ async def check_api_key(request: Request):
     }
 
 @app.post("/upload")
-async def upload_pdf(request: Request, file: UploadFile = File(...)):
-    """Upload and process a PDF file"""
-    validate_config_on_demand(request)
+async def upload_pdf(request: Request, file: UploadFile = File(...), presolve: Optional[bool] = None,
+                     limit: Optional[int] = None, fields: Optional[str] = None):
+    """
+    Upload and process a PDF file, optionally pre-solving its problems in the background
+    
+    The response carries the first `limit` problems; follow `next_cursor` on
+    /api/documents/{document_id}/problems for the rest.
+    """
+    await validate_config_on_demand(request)
     
     if not file.filename or not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="File must be a PDF")
+    try:
+        selected = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     try:
         logger.info(f"Processing PDF file: {file.filename}")
@@ -127,20 +408,67 @@ async def upload_pdf(request: Request, file: UploadFile = File(...)):
         content = await file.read()
         
         # Process PDF
-        processed_pdf = await pdf_processor.process_pdf(content)
+        with stage("extract"):
+            processed_pdf = await pdf_processor.process_pdf(content)
         
         logger.info(f"Successfully processed PDF: {processed_pdf.metadata['num_problems']} problems found")
         
+        api_key = await get_api_key_from_session(request)
+        tenant = get_tenant(request, api_key)
+        
+        # Duplicates and variants of an earlier problem are solved from that representative
+        roles = {}
+        groups = []
+        if Config.VARIANT_GROUPING_ENABLED:
+            groups = group_problems(processed_pdf.problems)
+            await variant_solver.register(processed_pdf.problems, groups, tenant)
+            for number, group in enumerate(groups):
+                roles[group.representative] = (number, "representative")
+                roles.update({index: (number, "duplicate") for index in group.duplicates})
+                roles.update({index: (number, "variant") for index in group.variants})
+        
+        entries = []
+        for index, problem in enumerate(processed_pdf.problems):
+            entry = {
+                "text": problem.text,
+                "type": problem.type.value,
+                "fingerprint": problem_fingerprint(problem)
+            }
+            if index in roles:
+                entry["group"], entry["role"] = roles[index]
+            entries.append(entry)
+        problems = await with_status(entries, selected)
+        reused = sum(1 for entry in problems if entry["status"] == "reused")
+        
+        # The problem list stays pageable for this session
+        document_id = hashlib.sha256(content).hexdigest()[:16]
+        await state_store.set(f"document:{tenant}:{document_id}", entries, ttl=Config.DOCUMENT_TTL)
+        size = page_limit(limit)
+        
+        # Speculatively solve the remaining problems into the cache while the user reads them
+        presolving = 0
+        if presolve if presolve is not None else Config.PRESOLVE_ENABLED:
+            presolving = await presolver.start(
+                f"{tenant}:{document_id}",
+                [processed_pdf.problems[group.representative] for group in groups] if groups
+                else processed_pdf.problems,
+                api_key, tenant
+            )
+        
         return {
             "message": "PDF processed successfully",
             "num_problems": processed_pdf.metadata["num_problems"],
-            "problems": [
-                {
-                    "text": problem.text,
-                    "type": problem.type.value
-                }
-                for problem in processed_pdf.problems
-            ]
+            "pages_reused": processed_pdf.metadata["pages_reused"],
+            "pages_parsed": processed_pdf.metadata["pages_parsed"],
+            "problems_reused": reused,
+            "problems_to_recompute": len(problems) - reused,
+            "document_id": document_id,
+            "presolving": presolving,
+            "groups": len(groups),
+            "duplicates": sum(len(group.duplicates) for group in groups),
+            "variants": sum(len(group.variants) for group in groups),
+            "problems": problems[:size],
+            "next_cursor": encode_cursor(document_id, size) if len(problems) > size else None
         }
     except HTTPException:
         raise
@@ -148,13 +476,41 @@ async def upload_pdf(request: Request, file: UploadFile = File(...)):
         logger.error(f"Error processing PDF: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
 
+@app.get("/api/documents/{document_id}/problems")
+async def document_problems(request: Request, document_id: str, cursor: Optional[str] = None,
+                            limit: Optional[int] = None, fields: Optional[str] = None):
+    """A page of the problem list of a document uploaded in this session"""
+    try:
+        selected = parse_fields(fields)
+        offset = decode_cursor(cursor, document_id) if cursor else 0
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tenant = get_tenant(request, await get_api_key_from_session(request))
+    entries = await state_store.get(f"document:{tenant}:{document_id}")
+    if entries is None:
+        raise HTTPException(status_code=404, detail="Document not found or expired; upload it again")
+    end = offset + page_limit(limit)
+    return {
+        "document_id": document_id,
+        "total": len(entries),
+        "problems": await with_status(entries[offset:end], selected),
+        "next_cursor": encode_cursor(document_id, end) if end < len(entries) else None
+    }
+
+@app.delete("/api/presolve/{document_id}")
+async def cancel_presolve(request: Request, document_id: str):
+    """Cancel the speculative pre-solves of a document uploaded in this session"""
+    tenant = get_tenant(request, await get_api_key_from_session(request))
+    return {"document_id": document_id, "cancelled": presolver.cancel(f"{tenant}:{document_id}")}
+
 @app.post("/solve-text")
-async def solve_text_equation(request: Request, text_request: TextInputRequest):
-    """Solve a math problem or equation from text input"""
-    validate_config_on_demand(request)
-    api_key = get_api_key_from_session(request)
+async def solve_text_equation(request: Request, text_request: TextInputRequest, fields: Optional[str] = None):
+    """Solve a math problem or equation from text input, optionally returning only the selected fields"""
+    await validate_config_on_demand(request)
+    api_key = await get_api_key_from_session(request)
     
     try:
+        selected = parse_fields(fields)
         logger.info(f"Processing text input: {text_request.text[:100]}...")
         
         # Process the text input
@@ -162,28 +518,25 @@ async def solve_text_equation(request: Request, text_request: TextInputRequest):
         
         logger.info(f"Detected problem type: {problem.type.value}")
         
-        # Create agents with session API key
-        prob_agent = ProbabilityAgent(api_key=api_key)
-        gen_agent = GeneralAgent(api_key=api_key)
+        tenant = get_tenant(request, api_key)
+        tag_usage(session=tenant, endpoint=request.url.path, problem_type=problem.type.value)
+        profile = profiles.activate(
+            text_request.profile, text_request.overrides, endpoint=request.url.path, session=tenant
+        )
         
-        # Select appropriate agent based on problem type
-        if problem.type in [ProblemType.PROBABILITY, ProblemType.STATISTICS]:
-            solution = await prob_agent.solve(problem)
-        else:
-            # Use general agent for all other problem types
-            logger.info(f"Using GeneralAgent for problem type: {problem.type.value}")
-            solution = await gen_agent.solve(problem)
+        # Single typed-in problems are interactive and jump ahead of batch work
+        solution, cached = await solve_cached(problem, api_key, tenant, "interactive", text_request.ensemble)
         
         logger.info("Problem solved successfully")
         
         return {
-            "explanation": solution.explanation,
-            "steps": solution.steps,
-            "matlab_code": solution.matlab_code,
-            "latex_solution": solution.latex_solution,
-            "confidence": solution.confidence,
-            "problem_type": problem.type.value
+            **(await solution_response(solution, problem, selected)),
+            "problem_type": problem.type.value,
+            "profile": profile.name,
+            "cached": cached
         }
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
         logger.error(f"Invalid input: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -194,41 +547,229 @@ async def solve_text_equation(request: Request, text_request: TextInputRequest):
         raise HTTPException(status_code=500, detail=f"Error solving problem: {str(e)}")
 
 @app.post("/solve")
-async def solve_problem(request: Request, problem: Problem):
+async def solve_problem(request: Request, problem: Problem,
+                        ensemble: Optional[int] = Query(None, ge=1, le=MAX_ENSEMBLE),
+                        profile: Optional[str] = None, fields: Optional[str] = None):
     """Solve a math problem (from Problem object)"""
-    validate_config_on_demand(request)
-    api_key = get_api_key_from_session(request)
+    await validate_config_on_demand(request)
+    api_key = await get_api_key_from_session(request)
     
     try:
+        selected = parse_fields(fields)
         logger.info(f"Solving problem of type: {problem.type.value}")
         
-        # Create agents with session API key
-        prob_agent = ProbabilityAgent(api_key=api_key)
-        gen_agent = GeneralAgent(api_key=api_key)
-        
-        # Select appropriate agent based on problem type
-        if problem.type in [ProblemType.PROBABILITY, ProblemType.STATISTICS]:
-            solution = await prob_agent.solve(problem)
-        else:
-            # Use general agent for all other problem types
-            logger.info(f"Using GeneralAgent for problem type: {problem.type.value}")
-            solution = await gen_agent.solve(problem)
+        tenant = get_tenant(request, api_key)
+        tag_usage(session=tenant, endpoint=request.url.path, problem_type=problem.type.value)
+        active = profiles.activate(profile, endpoint=request.url.path, session=tenant)
+        solution, cached = await solve_cached(problem, api_key, tenant, "batch", ensemble)
         
         logger.info("Problem solved successfully")
         
         return {
-            "explanation": solution.explanation,
-            "steps": solution.steps,
-            "matlab_code": solution.matlab_code,
-            "latex_solution": solution.latex_solution,
-            "confidence": solution.confidence
+            **(await solution_response(solution, problem, selected)),
+            "profile": active.name,
+            "cached": cached
         }
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error solving problem: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error solving problem: {str(e)}")
 
+@app.websocket("/ws")
+async def solve_channel(websocket: WebSocket):
+    """
+    Solve many problems over one connection, streaming results as they finish
+
+    Client messages:
+        {"type": "solve", "id": ..., "text": ..., "problem_type": ..., "ensemble": ...}
+        {"type": "solve", "id": ..., "problem": {"text": ..., "type": ...}}
+        Either solve message may carry "fields": [...] to receive only those solution fields
+        {"type": "cancel", "id": ...}
+        {"type": "ping"}
+
+    Server messages carry the request id: "accepted", "result", "error" and "cancelled"
+    """
+    await websocket.accept()
+    try:
+        await validate_config_on_demand(websocket)
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
+        await websocket.close(code=1008)
+        return
+    api_key = await get_api_key_from_session(websocket)
+    tenant = get_tenant(websocket, api_key)
+    # Agents (and their pooled API clients) are reused by every solve on this connection
+    agents: Dict[type, BaseAgent] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+    send_lock = asyncio.Lock()
+    
+    async def send(message: Dict[str, Any]) -> None:
+        async with send_lock:
+            await websocket.send_json(message)
+    
+    async def error(request_id: Optional[str], status: int, detail: str, **extra: Any) -> None:
+        await send({"type": "error", "id": request_id, "status": status, "detail": detail, **extra})
+    
+    async def run(request_id: str, message: Dict[str, Any]) -> None:
+        try:
+            if "problem" in message:
+                data = message["problem"]
+                problem = Problem(
+                    text=data["text"],
+                    type=ProblemType(data.get("type", ProblemType.GENERAL.value)),
+                    latex=data.get("latex"),
+                    context=data.get("context")
+                )
+                lane = "batch"
+            else:
+                problem = text_processor.process_text(message["text"], message.get("problem_type"))
+                lane = "interactive"
+            selected = parse_fields(message.get("fields"))
+            ensemble = parse_ensemble(message.get("ensemble"))
+            tag_usage(session=tenant, endpoint="/ws", problem_type=problem.type.value)
+            profile = profiles.activate(message.get("profile"), message.get("overrides"), endpoint="/ws", session=tenant)
+            solution, cached = await solve_cached(problem, api_key, tenant, lane, ensemble, agents)
+            await send({
+                "type": "result",
+                "id": request_id,
+                **(await solution_response(solution, problem, selected)),
+                "problem_type": problem.type.value,
+                "profile": profile.name,
+                "cached": cached
+            })
+        except QuotaExceededError as e:
+            await error(request_id, 429, str(e), retry_after=e.retry_after)
+        except (KeyError, ValueError) as e:
+            await error(request_id, 400, f"Invalid problem: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error solving problem over WebSocket: {str(e)}", exc_info=True)
+            await error(request_id, 500, f"Error solving problem: {str(e)}")
+        finally:
+            tasks.pop(request_id, None)
+    
+    try:
+        while True:
+            try:
+                message = json_loads(await websocket.receive_text())
+                kind, request_id = message.get("type"), message.get("id")
+            except (ValueError, AttributeError):
+                await error(None, 400, "Messages must be JSON objects")
+                continue
+            request_id = str(request_id) if request_id is not None else None
+            if kind == "ping":
+                await send({"type": "pong"})
+            elif kind == "solve":
+                if not request_id or request_id in tasks:
+                    await error(request_id, 400, "Each solve needs an id that is not already in use")
+                elif len(tasks) >= Config.WS_MAX_INFLIGHT:
+                    await error(request_id, 429, f"Too many problems in flight (limit {Config.WS_MAX_INFLIGHT})")
+                else:
+                    tasks[request_id] = asyncio.create_task(run(request_id, message))
+                    await send({"type": "accepted", "id": request_id})
+            elif kind == "cancel":
+                task = tasks.pop(request_id, None)
+                if task is None:
+                    await error(request_id, 404, "No problem in flight with this id")
+                else:
+                    task.cancel()
+                    await send({"type": "cancelled", "id": request_id})
+            else:
+                await error(request_id, 400, f"Unknown message type: {kind}")
+    except WebSocketDisconnect:
+        logger.info("WebSocket client disconnected")
+    finally:
+        for task in list(tasks.values()):
+            task.cancel()
+
+@app.get("/api/plots/{plot_id}")
+async def get_plot(plot_id: str):
+    """A plot linked from a solution response, rendered on first request if not already"""
+    data = await plot_renderer.get(plot_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Plot not found")
+    # Plot IDs are content hashes, so the image never changes
+    return Response(content=data, media_type=plot_renderer.media_type,
+                    headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.get("/api/queue")
+async def queue_status(request: Request):
+    """Scheduler queue depth, overall and for the caller"""
+    api_key = await get_api_key_from_session(request)
+    return scheduler.status(get_tenant(request, api_key))
+
+@app.get("/api/admin/usage")
+async def usage_summary(request: Request, group_by: str = "model,problem_type", since: Optional[float] = None):
+    """Token usage and cost, grouped by any of session, endpoint, model and problem_type"""
+    require_admin(request)
+    try:
+        groups = [tag.strip() for tag in group_by.split(",") if tag.strip()]
+        return {"group_by": groups, "usage": await accountant.summary(groups, since)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/admin/profiles")
+async def list_profiles(request: Request, limit: int = 100):
+    """Current runtime profiles and the audit of which profile served recent requests"""
+    require_admin(request)
+    return {
+        "version": profiles.version,
+        "default": profiles.default,
+        "profiles": {name: profile.to_dict() for name, profile in profiles.profiles.items()},
+        "audit": profiles.recent(limit)
+    }
+
+@app.post("/api/admin/profiles/reload")
+async def reload_profiles(request: Request):
+    """Re-read PROFILES_FILE now instead of waiting for the next change check"""
+    require_admin(request)
+    return {"reloaded": profiles.reload(), "version": profiles.version}
+
+@app.get("/api/admin/providers")
+async def provider_status(request: Request):
+    """Health, circuit state and hedging counts of the LLM backends"""
+    require_admin(request)
+    return get_router().status()
+
+@app.get("/api/admin/profiling/sample")
+async def sample_profile(request: Request, seconds: float = 10, interval: Optional[float] = None,
+                         format: str = "collapsed"):
+    """Wall-clock stack samples of every thread for a few seconds, as collapsed stacks or JSON"""
+    require_admin(request)
+    try:
+        samples = await sampler.sample(seconds, interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "json":
+        return {"samples": dict(samples.most_common())}
+    return Response(content=collapsed(samples), media_type="text/plain")
+
+@app.get("/api/admin/profiling/requests")
+async def slow_requests(request: Request, limit: int = 50):
+    """Recently captured slow (and cProfiled) requests with their stage breakdowns"""
+    require_admin(request)
+    return {"threshold": request_profiler.threshold, "requests": request_profiler.recent(limit)}
+
+@app.get("/api/admin/profiling/requests/{capture_id}")
+async def slow_request(request: Request, capture_id: str, format: str = "collapsed"):
+    """Stack samples of a captured request as collapsed stacks, or its cProfile statistics"""
+    require_admin(request)
+    capture = request_profiler.get(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    if format == "cprofile":
+        if capture["profile"] is None:
+            raise HTTPException(status_code=404, detail="Request was not profiled with cProfile")
+        return Response(content=capture["profile"], media_type="text/plain")
+    if format == "json":
+        return {**{k: v for k, v in capture.items() if k not in ("samples", "profile")},
+                "samples": dict(capture["samples"].most_common())}
+    return Response(content=collapsed(capture["samples"]), media_type="text/plain")
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint for monitoring"""
@@ -237,6 +778,14 @@ async def health_check():
         "service": "Math Agent System"
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint: only succeeds once this worker has finished warming up"""
+    status = warmup.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", **status})
+    return {"status": "ready", **status}
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """Render the home page"""
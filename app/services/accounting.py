@@ -0,0 +1,180 @@
+"""
+Token and cost accounting for LLM completions
+
+Every completion's usage is tagged with the session, endpoint and problem
+type of the request it belongs to (carried in a context variable) and the
+model that served it. Usage is aggregated in memory per hour and flushed
+periodically to a local SQLite file, so recording adds no I/O to the hot
+path. Summaries can be grouped by any of the tags.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from ..core.config import Config
+
+logger = logging.getLogger(__name__)
+
+TAGS = ["session", "endpoint", "model", "problem_type"]
+
+_usage_tags: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar("usage_tags", default={})
+
+# Aggregation key: hour bucket followed by the TAGS values
+_Key = Tuple[int, str, str, str, str]
+
+
+def tag_usage(**tags: str) -> None:
+    """Tag completions made from the current request (and tasks it spawns) for accounting"""
+    _usage_tags.set({**_usage_tags.get(), **{k: v for k, v in tags.items() if v is not None}})
+
+
+class UsageAccountant:
+    """In-memory usage aggregation with periodic flushes to SQLite"""
+
+    def __init__(self, path: Optional[str] = None, flush_interval: Optional[float] = None,
+                 prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.path = path or Config.ACCOUNTING_DB_PATH
+        self.flush_interval = flush_interval or Config.ACCOUNTING_FLUSH_SECONDS
+        # Model -> (input, output) price in USD per million tokens
+        self.prices = prices if prices is not None else Config.MODEL_PRICES
+        self._pending: Dict[_Key, List[float]] = defaultdict(lambda: [0, 0, 0, 0.0, 0.0])
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, latency: float) -> None:
+        """Add one completion's usage to the in-memory aggregate (no I/O)"""
+        tags = _usage_tags.get()
+        key = (
+            int(time.time()) // 3600 * 3600,
+            tags.get("session", "unknown"),
+            tags.get("endpoint", "unknown"),
+            model,
+            tags.get("problem_type", "unknown"),
+        )
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            totals = self._pending[key]
+            totals[0] += 1
+            totals[1] += prompt_tokens
+            totals[2] += completion_tokens
+            totals[3] += latency
+            totals[4] += cost
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        """Cost in USD of a completion, or 0 for models without a configured price"""
+        input_price, output_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+    def start(self) -> None:
+        """Start the background flush loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """Stop the flush loop and write out anything still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Failed to flush usage: {str(e)}")
+
+    async def flush(self) -> None:
+        """Write pending aggregates to SQLite"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: [0, 0, 0, 0.0, 0.0])
+        if pending:
+            await asyncio.to_thread(self._write, pending)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "hour INTEGER, session TEXT, endpoint TEXT, model TEXT, problem_type TEXT, "
+                "requests INTEGER, prompt_tokens INTEGER, completion_tokens INTEGER, "
+                "latency REAL, cost REAL, "
+                "PRIMARY KEY (hour, session, endpoint, model, problem_type))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _write(self, pending: Dict[_Key, List[float]]) -> None:
+        # Several workers may flush into the same file, so rows are added to rather than replaced
+        conn = self._connect()
+        conn.executemany(
+            "INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (hour, session, endpoint, model, problem_type) DO UPDATE SET "
+            "requests = requests + excluded.requests, "
+            "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+            "completion_tokens = completion_tokens + excluded.completion_tokens, "
+            "latency = latency + excluded.latency, "
+            "cost = cost + excluded.cost",
+            [(*key, *totals) for key, totals in pending.items()],
+        )
+        conn.commit()
+
+    async def summary(self, group_by: Optional[List[str]] = None,
+                      since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Aggregate usage
+
+        Args:
+            group_by: Tags to group by (session, endpoint, model, problem_type)
+            since: Only include usage from this Unix time onwards (hour granularity)
+
+        Returns:
+            One row per group with requests, tokens, mean latency and cost, most expensive first
+        """
+        group_by = group_by or []
+        unknown = [tag for tag in group_by if tag not in TAGS]
+        if unknown:
+            raise ValueError(f"Cannot group usage by: {', '.join(unknown)}")
+        await self.flush()
+        return await asyncio.to_thread(self._query, group_by, since)
+
+    def _query(self, group_by: List[str], since: Optional[float]) -> List[Dict[str, Any]]:
+        columns = ", ".join(group_by)
+        select = f"{columns}, " if group_by else ""
+        query = (
+            f"SELECT {select}SUM(requests), SUM(prompt_tokens), SUM(completion_tokens), "
+            f"SUM(latency), SUM(cost) FROM usage WHERE hour >= ?"
+        )
+        if group_by:
+            query += f" GROUP BY {columns}"
+        query += " ORDER BY SUM(cost) DESC, SUM(prompt_tokens) + SUM(completion_tokens) DESC"
+        rows = self._connect().execute(query, (int(since or 0) // 3600 * 3600,)).fetchall()
+        summary = []
+        for row in rows:
+            requests, prompt, completion, latency, cost = row[len(group_by):]
+            if not requests:
+                continue
+            summary.append({
+                **dict(zip(group_by, row)),
+                "requests": requests,
+                "prompt_tokens": prompt,
+                "completion_tokens": completion,
+                "mean_latency": round(latency / requests, 3),
+                "cost": round(cost, 6),
+            })
+        return summary
+
+
+accountant = UsageAccountant()
@@ -0,0 +1,139 @@
+"""
+Final-answer extraction and equivalence checking for solutions
+
+Used to compare answers produced by independent solves, either for
+self-consistency voting or to check substituted variants of a problem.
+Answers come from the LLM, so they are parsed with the same bounds as
+problem text and comparisons should run through run_sympy.
+"""
+import math
+import re
+import logging
+from typing import Any, List, Optional
+from sympy import simplify, N
+from sympy.parsing.sympy_parser import (
+    standard_transformations,
+    implicit_multiplication,
+    convert_xor,
+)
+from ..core.types import Solution
+from .matlab_codegen import parse_bounded
+
+logger = logging.getLogger(__name__)
+
+_ANSWER_MARKERS = [
+    r"\\boxed\{(.+)\}",
+    r"final answer\s*(?:is|:)\s*(.+)",
+    r"answer\s*(?:is|:)\s*(.+)",
+    r"therefore,?\s*(.+)",
+]
+
+_LATEX_REPLACEMENTS = [
+    (r"\\left|\\right|\\,|\\;|\\!", ""),
+    (r"\\d?frac\{([^{}]+)\}\{([^{}]+)\}", r"((\1)/(\2))"),
+    (r"\\sqrt\{([^{}]+)\}", r"sqrt(\1)"),
+    (r"\\(?:cdot|times)", "*"),
+    (r"\\pi", "pi"),
+    (r"\\infty", "oo"),
+    (r"\\(sin|cos|tan|ln|log|exp)", r"\1"),
+    (r"[{}]", lambda m: "(" if m.group(0) == "{" else ")"),
+]
+
+
+class AnswerMatcher:
+    """Extract final answers from solutions and compare them for equivalence"""
+
+    def __init__(self, tolerance: float = 1e-6):
+        self.tolerance = tolerance
+        self.transformations = standard_transformations + (implicit_multiplication, convert_xor)
+
+    def extract(self, solution: Solution) -> Optional[str]:
+        """
+        Extract the final answer from a solution
+
+        Args:
+            solution: Solution produced by an agent
+
+        Returns:
+            The final answer as text, or None if none could be found
+        """
+        if solution.numerical_result is not None:
+            return self._format_numerical(solution.numerical_result)
+
+        texts = list(reversed(solution.steps)) + [solution.explanation]
+        for text in texts:
+            for marker in _ANSWER_MARKERS:
+                match = re.search(marker, text, re.IGNORECASE)
+                if match:
+                    return self._last_value(match.group(1))
+        if solution.steps:
+            return self._last_value(solution.steps[-1])
+        return None
+
+    def canonicalize(self, answer: str) -> List[Any]:
+        """Convert an answer into a sorted list of SymPy expressions (or strings as a fallback)"""
+        parts = [part for part in re.split(r",|\bor\b|\band\b", answer) if part.strip()]
+        canonical = []
+        for part in parts:
+            # Keep only the value side of assignments like "x = 3"
+            value = part.split("=")[-1].strip().rstrip(".")
+            canonical.append(self._to_expression(value))
+        return sorted(canonical, key=self._sort_key)
+
+    def equivalent(self, first: str, second: str) -> bool:
+        """Whether two answers agree symbolically or within numeric tolerance"""
+        left, right = self.canonicalize(first), self.canonicalize(second)
+        if len(left) != len(right):
+            return False
+        return all(self._values_equal(a, b) for a, b in zip(left, right))
+
+    def _values_equal(self, a: Any, b: Any) -> bool:
+        if isinstance(a, str) or isinstance(b, str):
+            return str(a) == str(b)
+        try:
+            numeric_a, numeric_b = complex(N(a)), complex(N(b))
+            return (math.isclose(numeric_a.real, numeric_b.real, rel_tol=self.tolerance, abs_tol=self.tolerance)
+                    and math.isclose(numeric_a.imag, numeric_b.imag, rel_tol=self.tolerance, abs_tol=self.tolerance))
+        except (TypeError, ValueError):
+            pass
+        try:
+            return simplify(a - b) == 0
+        except Exception:
+            return str(a) == str(b)
+
+    def _to_expression(self, value: str) -> Any:
+        text = value.strip().strip("$").strip()
+        for pattern, replacement in _LATEX_REPLACEMENTS:
+            text = re.sub(pattern, replacement, text)
+        text = text.replace("−", "-").replace("×", "*").replace("%", "/100")
+        expr = parse_bounded(text, self.transformations, names=("oo",))
+        if expr is None:
+            return re.sub(r"\s+", " ", value.strip().lower())
+        return expr
+
+    @staticmethod
+    def _sort_key(value: Any):
+        # N() would sympify (and fully evaluate) answers that were rejected as text
+        if isinstance(value, str):
+            return (1, 0.0, value)
+        try:
+            return (0, float(N(value)), "")
+        except (TypeError, ValueError):
+            return (1, 0.0, str(value))
+
+    @staticmethod
+    def _last_value(text: str) -> str:
+        """Pick the most answer-like fragment of a sentence"""
+        math_parts = re.findall(r"\$([^$]+)\$", text)
+        if math_parts:
+            text = math_parts[-1]
+        parts = [part.split("=")[-1].strip() for part in re.split(r",|\bor\b|\band\b", text)]
+        return ", ".join(part for part in parts if part).rstrip(".").strip()
+
+    @staticmethod
+    def _format_numerical(value: Any) -> str:
+        if isinstance(value, dict):
+            return ", ".join(str(v) for v in value.values() if isinstance(v, (int, float)) and not isinstance(v, bool))
+        if isinstance(value, (list, tuple)):
+            return ", ".join(str(v) for v in value)
+        return str(value)
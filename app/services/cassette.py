@@ -0,0 +1,162 @@
+"""
+Record and replay of LLM interactions
+
+Completions are recorded to an append-only cassette (a JSON-lines data file
+plus a small index of request fingerprints and byte offsets) and can be
+replayed deterministically, optionally with the recorded latency, so agents,
+benchmarks and end-to-end tests run offline without calling the API.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from ..core.codec import json_dumps, json_loads
+from ..core.config import Config
+
+logger = logging.getLogger(__name__)
+
+MODES = {"off", "record", "replay", "auto"}
+
+
+def request_fingerprint(request: Dict[str, Any]) -> str:
+    """Stable hash of the parameters that determine a completion"""
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Append-only, indexed store of recorded completions"""
+
+    def __init__(self, path: str, mode: str = "replay", latency_scale: float = 0.0):
+        if mode not in MODES:
+            raise ValueError(f"Unsupported cassette mode: {mode}")
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        # Fingerprint -> (offset, length) of each recording, in recording order
+        self._index: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        # Replays of the same request cycle through its recordings deterministically
+        self._replays: Dict[str, int] = defaultdict(int)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode in ("replay", "auto")
+
+    @property
+    def recording(self) -> bool:
+        return self.mode in ("record", "auto")
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._index.values())
+
+    def _load_index(self) -> None:
+        indexed_end = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 3:
+                        continue
+                    fingerprint, offset, length = parts[0], int(parts[1]), int(parts[2])
+                    self._index[fingerprint].append((offset, length))
+                    indexed_end = max(indexed_end, offset + length)
+        if not os.path.exists(self.path):
+            return
+        # Index any records appended after the index was last written (or if it was lost)
+        with open(self.path, "rb") as f:
+            f.seek(indexed_end)
+            offset = indexed_end
+            for line in f:
+                try:
+                    fingerprint = json_loads(line)["fp"]
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f"Skipping corrupt cassette record at offset {offset}")
+                else:
+                    self._append_index(fingerprint, offset, len(line))
+                offset += len(line)
+
+    def _append_index(self, fingerprint: str, offset: int, length: int) -> None:
+        self._index[fingerprint].append((offset, length))
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(f"{fingerprint} {offset} {length}\n")
+
+    def _read(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entries = self._index.get(fingerprint)
+            if not entries:
+                return None
+            offset, length = entries[self._replays[fingerprint] % len(entries)]
+            self._replays[fingerprint] += 1
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                return json_loads(f.read(length))
+
+    def _write(self, fingerprint: str, request: Dict[str, Any], response: str, latency: float) -> None:
+        record = json_dumps({
+            "fp": fingerprint,
+            "model": request.get("model"),
+            "response": response,
+            "latency": round(latency, 4),
+            "recorded_at": time.time(),
+        }) + b"\n"
+        with self._lock:
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(record)
+            self._append_index(fingerprint, offset, len(record))
+
+    async def replay(self, request: Dict[str, Any]) -> Optional[str]:
+        """
+        Return the recorded response for a request
+
+        Args:
+            request: Completion parameters (model, messages, sampling settings)
+
+        Returns:
+            The recorded response text, or None in auto mode when nothing was recorded
+        """
+        if not self.replaying:
+            return None
+        fingerprint = request_fingerprint(request)
+        record = await asyncio.to_thread(self._read, fingerprint)
+        if record is None:
+            if self.mode == "replay":
+                raise RuntimeError(f"No recorded response for request {fingerprint[:12]} in {self.path}")
+            return None
+        if self.latency_scale > 0:
+            await asyncio.sleep(record.get("latency", 0.0) * self.latency_scale)
+        logger.debug(f"Replayed completion {fingerprint[:12]}")
+        return record["response"]
+
+    async def record(self, request: Dict[str, Any], response: str, latency: float) -> None:
+        """Append a completion to the cassette when recording"""
+        if self.recording:
+            await asyncio.to_thread(self._write, request_fingerprint(request), request, response, latency)
+
+
+_cassette: Optional[Cassette] = None
+
+
+def get_cassette() -> Optional[Cassette]:
+    """The process-wide cassette configured by LLM_CASSETTE_MODE, or None when disabled"""
+    global _cassette
+    if Config.LLM_CASSETTE_MODE == "off":
+        return None
+    if _cassette is None or _cassette.mode != Config.LLM_CASSETTE_MODE:
+        _cassette = Cassette(
+            Config.LLM_CASSETTE_PATH,
+            mode=Config.LLM_CASSETTE_MODE,
+            latency_scale=Config.LLM_REPLAY_LATENCY_SCALE
+        )
+    return _cassette
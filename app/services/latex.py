@@ -0,0 +1,349 @@
+"""
+LaTeX normalization and server-side rendering
+
+Normalizes math found in solution steps and problem statements into a
+canonical form (delimiters stripped, Unicode operators and bare function
+names converted, every script braced, braces balanced) and builds the
+solution's align block from it. Expressions can optionally be pre-rendered
+to MathML or SVG, cached by a hash of the normalized expression so repeated
+expressions across solutions are rendered only once.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from sympy import Rational, S, latex as sympy_latex
+from ..core.config import Config
+from ..core.types import Solution
+from .matlab_codegen import MatlabCodeGenerator
+from .state_store import StateStore
+
+# Make latex2mathml optional (only needed for MathML pre-rendering)
+try:
+    import latex2mathml.converter
+    HAS_LATEX2MATHML = True
+except ImportError:
+    HAS_LATEX2MATHML = False
+
+# Make matplotlib optional (only needed for SVG pre-rendering)
+try:
+    from matplotlib import mathtext
+    HAS_MATHTEXT = True
+except ImportError:
+    HAS_MATHTEXT = False
+
+logger = logging.getLogger(__name__)
+
+_MATH_SEGMENT = re.compile(r"\$\$(.+?)\$\$|\$(.+?)\$|\\\((.+?)\\\)|\\\[(.+?)\\\]", re.DOTALL)
+
+_UNICODE = {
+    "−": "-", "×": r"\times ", "·": r"\cdot ", "÷": r"\div ", "≤": r"\le ", "≥": r"\ge ",
+    "≠": r"\neq ", "≈": r"\approx ", "±": r"\pm ", "∞": r"\infty ", "π": r"\pi ",
+    "θ": r"\theta ", "α": r"\alpha ", "β": r"\beta ", "λ": r"\lambda ", "μ": r"\mu ",
+    "σ": r"\sigma ", "√": r"\sqrt ", "∑": r"\sum ", "∫": r"\int ", "→": r"\to ",
+}
+
+_ASCII_OPERATORS = [
+    (re.compile(r"\*\*"), "^"),
+    (re.compile(r"<="), r"\\le "),
+    (re.compile(r">="), r"\\ge "),
+    (re.compile(r"!="), r"\\neq "),
+    (re.compile(r"(?<!\\operatorname)\*"), r"\\cdot "),
+]
+
+_FUNCTIONS = re.compile(
+    r"(?<![\\a-zA-Z])(arcsin|arccos|arctan|sinh|cosh|tanh|sin|cos|tan|cot|sec|csc|log|ln|exp|lim|max|min)(?![a-zA-Z])"
+)
+
+# Commands whose argument is upright text or an operator name, where function names stay as written
+_TEXT_ARGUMENT = re.compile(r"\\(?:mathrm|operatorname\*?|text|textrm|textit|mbox)\s*\{")
+
+RENDER_FORMATS = {"mathml", "svg"}
+
+
+def extract_math(text: str) -> List[str]:
+    """Math segments between $...$, $$...$$, \\(...\\) or \\[...\\] delimiters"""
+    return [next(group for group in match.groups() if group is not None)
+            for match in _MATH_SEGMENT.finditer(text)]
+
+
+def _balanced_group(text: str, start: int, opening: str, closing: str) -> int:
+    """Index just past the group opened at text[start], or len(text) if it never closes"""
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == opening:
+            depth += 1
+        elif text[i] == closing:
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return len(text)
+
+
+def _script_atom(text: str, i: int) -> int:
+    """Index just past the script argument starting at text[i]: a group, a command with its arguments, a number or a character"""
+    if text[i] == "(":
+        return _balanced_group(text, i, "(", ")")
+    if text[i] == "\\":
+        end = i + re.match(r"\\[a-zA-Z]+|\\.", text[i:]).end()
+        # A command's optional and brace arguments belong to it: \sqrt[3]{x}, \frac{1}{2}, \text{max}
+        if text[end:end + 1] == "[":
+            end = _balanced_group(text, end, "[", "]")
+        while text[end:end + 1] == "{":
+            end = _balanced_group(text, end, "{", "}")
+        return end
+    if text[i].isdigit():
+        return i + re.match(r"\d+(?:\.\d+)?", text[i:]).end()
+    return i + 1
+
+
+def _brace_scripts(text: str) -> str:
+    """Wrap every ^/_ argument in braces: x^10 -> x^{10}, x^(n+1) -> x^{n+1}, 10^-3 -> 10^{-3}, x_i -> x_{i}"""
+    out: List[str] = []
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        out.append(ch)
+        i += 1
+        if ch not in "^_" or (len(out) > 1 and out[-2] == "\\"):
+            continue
+        while i < len(text) and text[i] == " ":
+            i += 1
+        if i >= len(text) or text[i] == "{":
+            continue
+        # A sign goes into the script with the value it applies to
+        sign = text[i] if text[i] in "+-" and i + 1 < len(text) and text[i + 1] not in " {" else ""
+        start = i + len(sign)
+        end = _script_atom(text, start)
+        argument = text[start:end]
+        if not sign and text[start] == "(" and text[end - 1:end] == ")":
+            argument = argument[1:-1]
+        out.append("{" + sign + argument + "}")
+        i = end
+    return "".join(out)
+
+
+def _sqrt_calls(text: str) -> str:
+    """sqrt(x) -> \\sqrt{x}"""
+    while True:
+        match = re.search(r"(?<![\\a-zA-Z])sqrt\s*\(", text)
+        if match is None:
+            return text
+        start = match.end() - 1
+        end = _balanced_group(text, start, "(", ")")
+        inner = text[start + 1:end - 1] if text[end - 1:end] == ")" else text[start + 1:end]
+        text = f"{text[:match.start()]}\\sqrt{{{inner}}}{text[end:]}"
+
+
+def _function_names(text: str) -> str:
+    """sin x -> \\sin x, leaving \\mathrm{max}, \\operatorname{exp} and \\text{...} arguments alone"""
+    out: List[str] = []
+    i = 0
+    for match in _TEXT_ARGUMENT.finditer(text):
+        if match.start() < i:
+            continue
+        out.append(_FUNCTIONS.sub(r"\\\1", text[i:match.start()]))
+        i = _balanced_group(text, match.end() - 1, "{", "}")
+        out.append(text[match.start():i])
+    out.append(_FUNCTIONS.sub(r"\\\1", text[i:]))
+    return "".join(out)
+
+
+def balance_braces(text: str) -> str:
+    """Drop unmatched closing braces and close any left open (escaped \\{ \\} are ignored)"""
+    out: List[str] = []
+    depth = 0
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch == "\\" and i + 1 < len(text):
+            out.append(text[i:i + 2])
+            i += 2
+            continue
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            if depth == 0:
+                i += 1
+                continue
+            depth -= 1
+        out.append(ch)
+        i += 1
+    return "".join(out) + "}" * depth
+
+
+def normalize_latex(expression: str) -> str:
+    """
+    Convert a math expression into canonical LaTeX
+
+    Args:
+        expression: LaTeX or plain-text math, with or without delimiters
+
+    Returns:
+        Normalized LaTeX with balanced braces
+    """
+    text = expression.strip()
+    segments = extract_math(text)
+    if len(segments) == 1 and _MATH_SEGMENT.fullmatch(text):
+        text = segments[0]
+    text = text.strip().strip("$").strip()
+    for char, replacement in _UNICODE.items():
+        text = text.replace(char, replacement)
+    for pattern, replacement in _ASCII_OPERATORS:
+        text = pattern.sub(replacement, text)
+    text = _sqrt_calls(text)
+    text = _function_names(text)
+    text = balance_braces(_brace_scripts(text))
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([\^_])\s*", r"\1", text)
+    return text.strip()
+
+
+def expression_hash(expression: str, fmt: str = "") -> str:
+    """Cache key for a normalized expression in a given render format"""
+    return hashlib.sha256(f"{fmt}:{expression}".encode("utf-8")).hexdigest()
+
+
+def build_align(expressions: List[str]) -> str:
+    """An align* block with one expression per line"""
+    return "\\begin{align*}\n" + " \\\\\n".join(expressions) + "\n\\end{align*}"
+
+
+def align_lines(latex: str) -> List[str]:
+    """The expressions of an align* block built by build_align"""
+    body = re.sub(r"\\(?:begin|end)\{align\*\}", "", latex)
+    return [line.strip() for line in body.split("\\\\") if line.strip()]
+
+
+def _is_reciprocal(expr) -> bool:
+    """'1/n' as parsed unevaluated: n^-1 for an integer n"""
+    return expr.is_Pow and expr.base.is_Integer and expr.base != 0 and expr.exp == S.NegativeOne
+
+
+def _as_written(expr):
+    """Drop the factors an unevaluated parse adds ('1/2' is 1 * 2^-1, '-x' is -1 * x) without evaluating"""
+    if not expr.args:
+        return expr
+    args = [_as_written(arg) for arg in expr.args]
+    if expr.is_Mul:
+        factors = [factor for arg in args for factor in (arg.args if arg.is_Mul else [arg])]
+        negative = sum(factor == S.NegativeOne for factor in factors) % 2 == 1
+        args = [factor for factor in factors if factor not in (S.One, S.NegativeOne)] or [S.One]
+        if negative:
+            # A negated number ('1/2' included) prints as a leading minus sign; otherwise lead with -1
+            number = next((i for i, arg in enumerate(args) if arg.is_Number or _is_reciprocal(arg)), None)
+            if number is None:
+                args.insert(0, S.NegativeOne)
+            else:
+                arg = args.pop(number)
+                args.insert(0, -arg if arg.is_Number else Rational(-1, arg.base))
+        if len(args) == 1:
+            return args[0]
+    return expr.func(*args, evaluate=False)
+
+
+class LatexBuilder:
+    """Build a solution's LaTeX from the math in its steps"""
+
+    def __init__(self, codegen: Optional[MatlabCodeGenerator] = None):
+        # Used to recognize plain-text equations ("so x^2 + 1 = 5") in steps
+        self.codegen = codegen or MatlabCodeGenerator()
+
+    def equation_to_latex(self, text: str) -> Optional[str]:
+        """LaTeX for the equation in a plain-text sentence, or None if none is found"""
+        sides = self.codegen.equation_sides(text)
+        if sides is None:
+            return None
+        lhs, rhs = self.codegen.expression(sides[0]), self.codegen.expression(sides[1])
+        if lhs is None or rhs is None:
+            return None
+        # The parser leaves expressions unevaluated, and order="none" keeps the terms as written
+        return f"{sympy_latex(_as_written(lhs), order='none')} = {sympy_latex(_as_written(rhs), order='none')}"
+
+    def solution_latex(self, steps: List[str], problem_latex: Optional[str] = None,
+                       equations: bool = True) -> str:
+        """
+        LaTeX for a solution
+
+        Args:
+            steps: Solution steps, with math between $ markers where the model used them
+            problem_latex: The problem's own LaTeX, used when the steps contain no math
+            equations: Parse plain-text equations in the steps with SymPy (run this through run_sympy)
+
+        Returns:
+            An align* block of normalized, de-duplicated expressions
+        """
+        expressions = [normalize_latex(segment) for step in steps for segment in extract_math(step)]
+        if not expressions and equations:
+            expressions = [latex for latex in map(self.equation_to_latex, steps) if latex]
+        if not expressions and problem_latex:
+            expressions = [normalize_latex(segment) for segment in extract_math(f"${problem_latex}$")]
+        expressions = list(OrderedDict.fromkeys(e for e in expressions if e))
+        if not expressions:
+            expressions = ["\\text{Solution steps provided in text format.}"]
+        return build_align(expressions)
+
+
+class LatexRenderer:
+    """Pre-render normalized expressions to MathML or SVG with a shared cache"""
+
+    def __init__(self, store: Optional[StateStore] = None, fmt: Optional[str] = None,
+                 ttl: Optional[int] = None, memory_size: int = 1024):
+        self.store = store
+        self.fmt = (fmt if fmt is not None else Config.LATEX_PRERENDER).lower()
+        self.ttl = ttl if ttl is not None else Config.LATEX_RENDER_CACHE_TTL
+        self.memory_size = memory_size
+        # Hot expressions stay in process; the state store shares renders across workers
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        if self.fmt == "mathml":
+            return HAS_LATEX2MATHML
+        if self.fmt == "svg":
+            return HAS_MATHTEXT
+        return False
+
+    async def render(self, expression: str) -> Optional[str]:
+        """Rendered markup for an expression, or None if rendering is disabled or fails"""
+        if not self.enabled:
+            return None
+        tex = normalize_latex(expression)
+        key = expression_hash(tex, self.fmt)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        markup = await self.store.get(f"latex:{key}") if self.store is not None else None
+        if markup is None:
+            try:
+                markup = await asyncio.to_thread(self._render, tex)
+            except Exception as e:
+                logger.warning(f"Could not render LaTeX '{tex[:60]}': {str(e)}")
+                return None
+            if self.store is not None:
+                await self.store.set(f"latex:{key}", markup, ttl=self.ttl)
+        self._memory[key] = markup
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+        return markup
+
+    async def render_solution(self, solution: Solution) -> List[Dict[str, Any]]:
+        """Rendered markup for each expression of a solution's LaTeX"""
+        if not self.enabled or not solution.latex_solution:
+            return []
+        rendered = []
+        for tex in OrderedDict.fromkeys(align_lines(solution.latex_solution)):
+            markup = await self.render(tex)
+            if markup is not None:
+                rendered.append({"hash": expression_hash(tex, self.fmt), "tex": tex, "markup": markup})
+        return rendered
+
+    def _render(self, tex: str) -> str:
+        if self.fmt == "mathml":
+            return latex2mathml.converter.convert(tex, display="block")
+        buffer = io.BytesIO()
+        mathtext.math_to_image(f"${tex}$", buffer, format="svg")
+        return buffer.getvalue().decode("utf-8")
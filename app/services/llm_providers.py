@@ -0,0 +1,415 @@
+"""
+LLM backends with hedged requests and circuit breaking
+
+Completions can be served by Mistral and by any OpenAI-compatible server
+(vLLM, llama.cpp, Ollama, ...). Responses are streamed so the time to the
+first token is known. When a request has not produced a token by a high
+percentile of its backend's recent time to first token, a duplicate is sent
+to the next backend (or the same one) and whichever finishes first wins; the
+other is cancelled. A backend that fails repeatedly is skipped for a
+cool-down period, then let back in with a single probe request. Client
+errors (a session's bad API key, a malformed request) say nothing about a
+backend shared by every tenant, so they do not count towards its circuit.
+"""
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from ..core.codec import json_dumps, json_loads
+from ..core.config import Config
+
+# Make aiohttp optional (only needed for OpenAI-compatible backends)
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+logger = logging.getLogger(__name__)
+
+# Time-to-first-token samples needed before the hedge deadline adapts
+MIN_SAMPLES = 10
+
+
+@dataclass
+class Completion:
+    content: str
+    model: str
+    provider: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    first_token_latency: float = 0.0
+    latency: float = 0.0
+    # Models of duplicate (hedged) attempts that were sent and then cancelled
+    cancelled: List[str] = field(default_factory=list)
+
+
+class ProviderHTTPError(RuntimeError):
+    """An HTTP error response from a backend"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def is_client_error(error: BaseException) -> bool:
+    """Whether a backend rejected the request itself (4xx other than timeouts and rate limits)"""
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 429)
+
+
+class LLMProvider(ABC):
+    """A chat completion backend"""
+
+    def __init__(self, name: str, model: Optional[str] = None):
+        self.name = name
+        # Model served by this backend; None serves the model the request asks for
+        self.model = model
+
+    @abstractmethod
+    async def complete(self, request: Dict[str, Any], api_key: Optional[str],
+                       first_token: asyncio.Event) -> Completion:
+        """
+        Stream a completion
+
+        Args:
+            request: Chat completion parameters (model, messages, max_tokens, ...)
+            api_key: API key of the requesting session, for backends that use it
+            first_token: Set as soon as the first content token arrives
+
+        Returns:
+            The complete response
+        """
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class MistralProvider(LLMProvider):
+    """Mistral AI, through the shared per-API-key client pool"""
+
+    async def complete(self, request: Dict[str, Any], api_key: Optional[str],
+                       first_token: asyncio.Event) -> Completion:
+        client = Config.get_mistral_client(api_key)
+        model = self.model or request["model"]
+        started = time.perf_counter()
+        first_token_latency = 0.0
+        parts: List[str] = []
+        usage = None
+        stream = await client.chat.stream_async(**{**request, "model": model})
+        async with stream:
+            async for event in stream:
+                chunk = event.data
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if isinstance(content, list):
+                    content = "".join(getattr(part, "text", "") for part in content)
+                if content:
+                    if not first_token.is_set():
+                        first_token_latency = time.perf_counter() - started
+                        first_token.set()
+                    parts.append(content)
+        return Completion(
+            content="".join(parts).strip(),
+            model=model,
+            provider=self.name,
+            prompt_tokens=(usage.prompt_tokens or 0) if usage is not None else 0,
+            completion_tokens=(usage.completion_tokens or 0) if usage is not None else 0,
+            first_token_latency=first_token_latency,
+        )
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Any server implementing the OpenAI /chat/completions streaming API"""
+
+    def __init__(self, name: str, base_url: str, model: Optional[str] = None, api_key: str = ""):
+        if not HAS_AIOHTTP:
+            raise RuntimeError(f"aiohttp is required for the OpenAI-compatible backend '{name}'")
+        super().__init__(name, model)
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            headers = {"Content-Type": "application/json"}
+            if self.api_key:
+                headers["Authorization"] = f"Bearer {self.api_key}"
+            self._session = aiohttp.ClientSession(headers=headers)
+        return self._session
+
+    async def complete(self, request: Dict[str, Any], api_key: Optional[str],
+                       first_token: asyncio.Event) -> Completion:
+        model = self.model or request["model"]
+        payload = {**request, "model": model, "stream": True, "stream_options": {"include_usage": True}}
+        started = time.perf_counter()
+        first_token_latency = 0.0
+        parts: List[str] = []
+        usage: Dict[str, Any] = {}
+        async with self._get_session().post(f"{self.base_url}/chat/completions", data=json_dumps(payload)) as response:
+            if response.status >= 400:
+                detail = (await response.text())[:200]
+                raise ProviderHTTPError(f"{self.name} returned HTTP {response.status}: {detail}", response.status)
+            # Server-sent events, one "data: {...}" line per chunk
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                chunk = json_loads(data)
+                usage = chunk.get("usage") or usage
+                choices = chunk.get("choices") or []
+                content = (choices[0].get("delta") or {}).get("content") if choices else None
+                if content:
+                    if not first_token.is_set():
+                        first_token_latency = time.perf_counter() - started
+                        first_token.set()
+                    parts.append(content)
+        return Completion(
+            content="".join(parts).strip(),
+            model=model,
+            provider=self.name,
+            prompt_tokens=usage.get("prompt_tokens") or 0,
+            completion_tokens=usage.get("completion_tokens") or 0,
+            first_token_latency=first_token_latency,
+        )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class ProviderHealth:
+    """Recent time to first token and circuit breaker state of one backend"""
+
+    def __init__(self, window: int = 200, failure_threshold: Optional[int] = None,
+                 cooldown: Optional[float] = None):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.failure_threshold = failure_threshold or Config.LLM_CIRCUIT_FAILURES
+        self.cooldown = cooldown if cooldown is not None else Config.LLM_CIRCUIT_COOLDOWN
+        self.failures = 0  # consecutive
+        self.open_until = 0.0
+        self.probing = False
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.failure_threshold:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until else "half-open"
+
+    @property
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.probing)
+
+    def acquire(self) -> None:
+        """Mark a request as sent; in half-open state it is the single probe"""
+        self.requests += 1
+        if self.state == "half-open":
+            self.probing = True
+
+    def release(self) -> None:
+        """The request ended without telling anything about the backend's health"""
+        self.probing = False
+
+    def success(self, first_token_latency: float) -> None:
+        self.latencies.append(first_token_latency)
+        self.failures = 0
+        self.probing = False
+
+    def failure(self) -> None:
+        self.errors += 1
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.failure_threshold:
+            self.open_until = time.monotonic() + self.cooldown
+
+    def deadline(self, percentile: float, default: float, floor: float) -> float:
+        """Seconds to wait for a first token before hedging"""
+        if len(self.latencies) < MIN_SAMPLES:
+            return default
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return max(floor, ordered[index])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.failures,
+            "p50_first_token": self._percentile(50),
+            "p95_first_token": self._percentile(95),
+        }
+
+    def _percentile(self, percentile: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))], 3)
+
+
+class HedgedRouter:
+    """Send completions to healthy backends, hedging slow ones and failing over on errors"""
+
+    def __init__(self, providers: List[LLMProvider], hedge: Optional[bool] = None):
+        if not providers:
+            raise ValueError("At least one LLM provider is required")
+        self.providers = providers
+        if hedge is None:
+            # A lone backend would only be sent the same request twice, so hedging is opt-in there
+            hedge = Config.LLM_HEDGE_ENABLED if Config.LLM_HEDGE_ENABLED is not None else len(providers) > 1
+        self.hedge = hedge
+        self.health: Dict[str, ProviderHealth] = {p.name: ProviderHealth() for p in providers}
+        self.hedged = 0
+        self.hedges_won = 0
+
+    async def complete(self, request: Dict[str, Any], api_key: Optional[str] = None) -> Completion:
+        """
+        Get a completion from the first backend to answer
+
+        Args:
+            request: Chat completion parameters
+            api_key: API key of the requesting session
+
+        Returns:
+            The winning completion; its model and provider name the backend that served it
+
+        Raises:
+            RuntimeError: If every backend is unavailable or failed
+        """
+        queue = [p for p in self.providers if self.health[p.name].available]
+        if not queue:
+            raise RuntimeError("No LLM provider available: all circuits are open")
+        pending: Dict[asyncio.Task, LLMProvider] = {}
+        error: Optional[BaseException] = None
+
+        def launch(provider: LLMProvider) -> Tuple[asyncio.Task, asyncio.Event]:
+            first_token = asyncio.Event()
+            # Acquired before the task runs so a half-open backend gets exactly one probe
+            self.health[provider.name].acquire()
+            task = asyncio.create_task(self._attempt(provider, request, api_key, first_token))
+            pending[task] = provider
+            return task, first_token
+
+        primary = queue.pop(0)
+        hedge_task = None
+        try:
+            task, first_token = launch(primary)
+            if self.hedge:
+                deadline = self.health[primary.name].deadline(
+                    Config.LLM_HEDGE_PERCENTILE, Config.LLM_HEDGE_DELAY, Config.LLM_HEDGE_MIN_DELAY
+                )
+                token = asyncio.create_task(first_token.wait())
+                done, _ = await asyncio.wait({task, token}, timeout=deadline,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                token.cancel()
+                if not done:
+                    # No token yet: race a duplicate on the next backend, or the same one
+                    self.hedged += 1
+                    hedge_to = next((p for p in queue if self.health[p.name].available), primary)
+                    if hedge_to in queue:
+                        queue.remove(hedge_to)
+                    logger.info(f"Hedging {primary.name} request after {deadline:.2f}s to {hedge_to.name}")
+                    hedge_task, _ = launch(hedge_to)
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    provider = pending.pop(finished)
+                    if finished.exception() is None:
+                        if finished is hedge_task:
+                            self.hedges_won += 1
+                        completion = finished.result()
+                        # The attempts still in flight are cancelled below but were already sent
+                        completion.cancelled = [p.model or request["model"] for p in pending.values()]
+                        return completion
+                    error = finished.exception()
+                    logger.warning(f"LLM provider {provider.name} failed: {str(error)}")
+                # Fail over once nothing is left in flight
+                while not pending and queue:
+                    provider = queue.pop(0)
+                    if self.health[provider.name].available:
+                        launch(provider)
+            if isinstance(error, ValueError):
+                raise error
+            raise RuntimeError(f"All LLM providers failed: {str(error)}") from error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _attempt(self, provider: LLMProvider, request: Dict[str, Any], api_key: Optional[str],
+                       first_token: asyncio.Event) -> Completion:
+        health = self.health[provider.name]
+        started = time.perf_counter()
+        try:
+            completion = await provider.complete(request, api_key, first_token)
+        except asyncio.CancelledError:
+            # Losing a race says nothing about health, but a request cancelled
+            # before its first token bounds that backend's latency from below
+            if not first_token.is_set():
+                health.latencies.append(time.perf_counter() - started)
+            health.release()
+            raise
+        except ValueError:
+            # Configuration errors (e.g. no API key) are raised before anything is sent
+            health.release()
+            raise
+        except Exception as e:
+            if is_client_error(e):
+                # Rejected for this request or session, e.g. a user's invalid API key
+                health.release()
+            else:
+                health.failure()
+            raise
+        completion.latency = time.perf_counter() - started
+        health.success(completion.first_token_latency or completion.latency)
+        return completion
+
+    def status(self) -> Dict[str, Any]:
+        """Health of every backend and hedging counts"""
+        return {
+            "providers": {name: health.to_dict() for name, health in self.health.items()},
+            "hedged": self.hedged,
+            "hedges_won": self.hedges_won,
+        }
+
+    async def close(self) -> None:
+        for provider in self.providers:
+            await provider.close()
+
+
+def build_providers() -> List[LLMProvider]:
+    """Backends configured by LLM_PROVIDERS, in order of preference"""
+    providers: List[LLMProvider] = []
+    for name, base_url in Config.LLM_PROVIDERS:
+        model = Config.LLM_PROVIDER_MODELS.get(name)
+        if name == "mistral" and not base_url:
+            providers.append(MistralProvider(name, model))
+        elif base_url:
+            providers.append(OpenAICompatibleProvider(name, base_url, model, Config.OPENAI_COMPAT_API_KEY))
+        else:
+            logger.error(f"Ignoring LLM provider '{name}' without a base URL")
+    return providers
+
+
+_router: Optional[HedgedRouter] = None
+
+
+def get_router() -> HedgedRouter:
+    """The process-wide router over the backends configured by LLM_PROVIDERS"""
+    global _router
+    if _router is None:
+        _router = HedgedRouter(build_providers() or [MistralProvider("mistral")])
+    return _router
@@ -0,0 +1,517 @@
+"""
+Template-based MATLAB code generation and offline syntax checking
+
+Builds MATLAB snippets from structured results (equations, integrals,
+derivatives, distribution parameters) so the agents do not need to ask the
+LLM for code, and validates MATLAB text with a lightweight tokenizer that
+checks string termination, bracket balance and block/`end` pairing.
+"""
+import asyncio
+import re
+import logging
+from dataclasses import dataclass
+from string import Template
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from sympy.parsing.sympy_parser import (
+    parse_expr,
+    standard_transformations,
+    implicit_multiplication,
+    implicit_application,
+    function_exponentiation,
+    convert_xor,
+)
+from sympy import Basic, E, Pow, postorder_traversal
+from sympy.printing.octave import octave_code
+from ..core.config import Config
+from ..core.types import Problem, ProblemType
+
+logger = logging.getLogger(__name__)
+
+_EQUATION_TEMPLATE = Template("""% Solve the equation symbolically
+syms $symbols
+${assumptions}eqn = $lhs == $rhs;
+sol = solve(eqn, $variable);
+disp('Solutions:');
+disp(sol);""")
+
+_INTEGRAL_TEMPLATE = Template("""% Compute the integral symbolically
+syms $variable
+f = $integrand;
+F = int(f, $variable$limits);
+disp('Result:');
+disp(simplify(F));""")
+
+_DERIVATIVE_TEMPLATE = Template("""% Compute the derivative symbolically
+syms $variable
+f = $expression;
+df = diff(f, $variable$order);
+disp('Derivative:');
+disp(simplify(df));""")
+
+_DISTRIBUTION_TEMPLATE = Template("""% $title
+$assignments
+$result = $expression;
+fprintf('$label\\n', $result);""")
+
+_BLOCK_KEYWORDS = {
+    "if", "for", "parfor", "while", "switch", "try", "function", "spmd",
+    "classdef", "methods", "properties", "events", "enumeration",
+}
+_END_KEYWORDS = {
+    "end", "endif", "endfor", "endwhile", "endswitch", "end_try_catch", "endfunction",
+}
+_CLOSING = {")": "(", "]": "[", "}": "{"}
+
+# An equals sign that is not part of >=, <=, != or ==
+_EQUALS = re.compile(r"(?<![<>!=])=(?!=)")
+# Side conditions after an equation: "... = 0 for x > 0", "... for x where a != 0"
+_CONDITION = re.compile(r"\b(?:for|where|given|such that|subject to)\b", re.IGNORECASE)
+_INEQUALITY = re.compile(r"\b([a-z])\s*(>=|<=|!=|>|<|≥|≤|≠)\s*(-?\s*(?:\d+(?:\.\d+)?|pi|[a-z])\b(?:\s*/\s*\d+)?)")
+_OCTAVE_RELATIONS = {"≥": ">=", "≤": "<=", "≠": "~=", "!=": "~="}
+
+# Limits on text handed to SymPy, so user input cannot make parsing or later solving blow up
+_MAX_EXPRESSION_LENGTH = 200
+_MAX_NESTING = 8
+_MAX_DIGITS = 15
+_MAX_EXPONENT = 100
+# The only multi-letter names allowed through to the parser; anything else is English or unsafe
+_FUNCTION_NAMES = {
+    "sin", "cos", "tan", "sec", "csc", "cot", "asin", "acos", "atan",
+    "sinh", "cosh", "tanh", "exp", "log", "ln", "sqrt", "pi", "Abs",
+}
+
+
+@dataclass
+class MatlabSyntaxIssue:
+    line: int
+    message: str
+
+    def __str__(self) -> str:
+        return f"line {self.line}: {self.message}"
+
+
+def validate_matlab(code: str) -> List[MatlabSyntaxIssue]:
+    """
+    Check MATLAB code for structural syntax errors without running MATLAB
+
+    Args:
+        code: MATLAB source text
+
+    Returns:
+        List of issues found; empty when the code looks well formed
+    """
+    issues: List[MatlabSyntaxIssue] = []
+    brackets: List[Tuple[str, int]] = []
+    blocks: List[Tuple[str, int]] = []
+    closed_functions = 0
+    in_block_comment = False
+
+    for line_no, line in enumerate(code.splitlines(), 1):
+        stripped = line.strip()
+        if in_block_comment:
+            if stripped == "%}":
+                in_block_comment = False
+            continue
+        if stripped == "%{":
+            in_block_comment = True
+            continue
+
+        # Whether a quote at this point would be a transpose rather than a string
+        after_value = False
+        i = 0
+        while i < len(line):
+            ch = line[i]
+            if ch == "%":
+                break
+            if line.startswith("...", i):
+                break
+            if ch == '"' or (ch == "'" and not after_value):
+                j = i + 1
+                while j < len(line):
+                    if line[j] == ch:
+                        if j + 1 < len(line) and line[j + 1] == ch:
+                            j += 2
+                            continue
+                        break
+                    j += 1
+                if j >= len(line):
+                    issues.append(MatlabSyntaxIssue(line_no, "unterminated string"))
+                    break
+                i = j + 1
+                after_value = True
+                continue
+            if ch.isalpha() or ch == "_":
+                j = i
+                while j < len(line) and (line[j].isalnum() or line[j] == "_"):
+                    j += 1
+                word = line[i:j]
+                is_field = i > 0 and line[i - 1] == "."
+                if not is_field and not brackets:
+                    if word in _BLOCK_KEYWORDS:
+                        blocks.append((word, line_no))
+                    elif word in _END_KEYWORDS:
+                        if blocks:
+                            opened, _ = blocks.pop()
+                            if opened == "function":
+                                closed_functions += 1
+                        else:
+                            issues.append(MatlabSyntaxIssue(line_no, f"'{word}' without matching block"))
+                i = j
+                after_value = word not in _BLOCK_KEYWORDS
+                continue
+            if ch.isdigit():
+                j = i
+                while j < len(line) and (line[j].isalnum() or line[j] == "."):
+                    j += 1
+                i = j
+                after_value = True
+                continue
+            if ch in "([{":
+                brackets.append((ch, line_no))
+                after_value = False
+            elif ch in _CLOSING:
+                if not brackets or brackets[-1][0] != _CLOSING[ch]:
+                    issues.append(MatlabSyntaxIssue(line_no, f"unexpected '{ch}'"))
+                else:
+                    brackets.pop()
+                after_value = True
+            elif ch == "." and i + 1 < len(line) and line[i + 1] == "'":
+                i += 2
+                after_value = True
+                continue
+            elif not ch.isspace():
+                after_value = False
+            i += 1
+
+    if in_block_comment:
+        issues.append(MatlabSyntaxIssue(len(code.splitlines()), "unterminated block comment"))
+    for bracket, line_no in brackets:
+        issues.append(MatlabSyntaxIssue(line_no, f"unclosed '{bracket}'"))
+    for keyword, line_no in blocks:
+        # Functions in a file may omit 'end' as long as none of them use it
+        if keyword == "function" and closed_functions == 0:
+            continue
+        issues.append(MatlabSyntaxIssue(line_no, f"'{keyword}' block is missing 'end'"))
+    return issues
+
+
+class MatlabCodeGenerator:
+    """Generate MATLAB code from structured problem data using templates"""
+
+    def __init__(self):
+        # Symbol splitting is left out on purpose so English words stay multi-letter and get rejected
+        self.transformations = standard_transformations + (
+            implicit_multiplication,
+            implicit_application,
+            function_exponentiation,
+            convert_xor,
+        )
+
+    def from_problem(self, problem: Problem) -> Optional[str]:
+        """
+        Build MATLAB code for a problem whose structure can be recognized
+
+        Args:
+            problem: Problem to generate code for
+
+        Returns:
+            MATLAB code, or None if the problem has no recognizable structure
+        """
+        text = problem.latex or problem.text
+        code = None
+        if problem.type in [ProblemType.CALCULUS, ProblemType.GENERAL, ProblemType.ALGEBRA]:
+            code = self._from_calculus_text(text) or self._from_equation_text(text, problem.context)
+        if code is None:
+            return None
+        issues = validate_matlab(code)
+        if issues:
+            logger.warning(f"Generated MATLAB failed syntax check: {issues[0]}")
+            return None
+        return code
+
+    def equation(self, lhs: str, rhs: str, variable: Optional[str] = None,
+                 assumptions: Iterable[str] = ()) -> Optional[str]:
+        """MATLAB code that solves lhs = rhs for the given (or only) variable, under MATLAB conditions like 'x > 0'"""
+        left, right = self._parse(lhs), self._parse(rhs)
+        if left is None or right is None:
+            return None
+        symbols = sorted((left - right).free_symbols, key=lambda s: s.name)
+        if not symbols:
+            return None
+        names = [s.name for s in symbols]
+        if variable is None:
+            variable = "x" if "x" in names else names[0]
+        # assume replaces earlier assumptions on a variable, assumeAlso adds to them
+        assumptions = "".join(
+            f"{'assume' if index == 0 else 'assumeAlso'}({condition});\n"
+            for index, condition in enumerate(assumptions)
+        )
+        return _EQUATION_TEMPLATE.substitute(
+            symbols=" ".join(names),
+            assumptions=assumptions,
+            lhs=self._octave(left),
+            rhs=self._octave(right),
+            variable=variable,
+        )
+
+    def integral(self, integrand: str, variable: str = "x",
+                 lower: Optional[str] = None, upper: Optional[str] = None) -> Optional[str]:
+        """MATLAB code for a definite or indefinite integral"""
+        expr = self._parse(integrand)
+        if expr is None:
+            return None
+        limits = ""
+        if lower is not None and upper is not None:
+            low, high = self._parse(lower), self._parse(upper)
+            if low is None or high is None:
+                return None
+            limits = f", {self._octave(low)}, {self._octave(high)}"
+        return _INTEGRAL_TEMPLATE.substitute(
+            variable=variable,
+            integrand=self._octave(expr),
+            limits=limits,
+        )
+
+    def derivative(self, expression: str, variable: str = "x", order: int = 1) -> Optional[str]:
+        """MATLAB code for the n-th derivative of an expression"""
+        expr = self._parse(expression)
+        if expr is None:
+            return None
+        return _DERIVATIVE_TEMPLATE.substitute(
+            variable=variable,
+            expression=self._octave(expr),
+            order=f", {order}" if order > 1 else "",
+        )
+
+    def distribution(self, title: str, params: Dict[str, str], expression: str,
+                     label: str, result: str = "prob") -> str:
+        """MATLAB code that evaluates a distribution expression and prints it"""
+        assignments = "\n".join(f"{name} = {value};" for name, value in params.items())
+        return _DISTRIBUTION_TEMPLATE.substitute(
+            title=title,
+            assignments=assignments,
+            result=result,
+            expression=expression,
+            label=label.replace("'", "''").replace("%", "%%") + " = %.6f",
+        )
+
+    @staticmethod
+    def discrete_event(prefix: str, op: str, k: int, upper: Optional[int], params: str) -> str:
+        """MATLAB expression for a discrete event using <prefix>pdf/<prefix>cdf"""
+        pdf, cdf = f"{prefix}pdf", f"{prefix}cdf"
+        if op == "between":
+            return f"{cdf}({upper}, {params}) - {cdf}({k - 1}, {params})"
+        expressions = {
+            "==": f"{pdf}({k}, {params})",
+            "<=": f"{cdf}({k}, {params})",
+            "<": f"{cdf}({k - 1}, {params})",
+            ">=": f"1 - {cdf}({k - 1}, {params})",
+            ">": f"1 - {cdf}({k}, {params})",
+        }
+        return expressions[op]
+
+    def _from_calculus_text(self, text: str) -> Optional[str]:
+        lowered = text.lower()
+        match = re.search(
+            r"(?:integral of|integrate|∫)\s*(.+?)\s*(?:\bd([a-z]))?\s*"
+            r"(?:from\s+(\S+)\s+to\s+([^\s.?,]+))?\s*(?:[.?,]|$)",
+            lowered,
+        )
+        if match:
+            return self.integral(match.group(1), match.group(2) or "x", match.group(3), match.group(4))
+
+        match = re.search(
+            r"(?:derivative of|differentiate|d/d([a-z]))\s*(.+?)"
+            r"(?:\s+with respect to\s+([a-z]))?\s*(?:[.?,]|$)",
+            lowered,
+        )
+        if match:
+            variable = match.group(1) or match.group(3) or "x"
+            return self.derivative(self._strip_definition(match.group(2)), variable)
+        return None
+
+    def expression(self, text: str):
+        """Parse a plain-text math expression with SymPy, or return None if it is not one"""
+        return self._parse(text)
+
+    def equation_sides(self, text: str) -> Optional[Tuple[str, str]]:
+        """The math on either side of the single '=' in a sentence, or None if there is none"""
+        parts = _EQUALS.split(text)
+        if len(parts) != 2:
+            return None
+        lhs, rhs = parts
+        lhs = self._strip_definition(self._math_suffix(lhs))
+        rhs = self._math_prefix(rhs)
+        if lhs and rhs:
+            return lhs, rhs
+        return None
+
+    def _from_equation_text(self, text: str, context: Optional[Dict] = None) -> Optional[str]:
+        candidates = list((context or {}).get("equations", []))
+        candidates += [line for line in re.split(r"[\n;]", text) if "=" in line]
+        for candidate in candidates:
+            sides = self.equation_sides(candidate)
+            if sides and not self._is_given_value(*sides):
+                conditions = self._conditions(_EQUALS.split(candidate)[1], *sides)
+                if conditions is None:
+                    # A side condition that cannot be carried over would give wrong solutions
+                    return None
+                code = self.equation(*sides, *conditions)
+                if code:
+                    return code
+        return None
+
+    def _conditions(self, tail: str, lhs: str, rhs: str) -> Optional[Tuple[Optional[str], List[str]]]:
+        """
+        The variable to solve for and MATLAB assumptions stated after an equation
+
+        "for x" names the variable and "for x > 0, y != 1" adds assumptions.
+        Returns None for a condition on the equation's symbols that is not
+        understood ("for x in [0, 2pi]"); clauses about anything else are ignored.
+        """
+        sentence = re.split(r"[?;]|!(?!=)|\.(?!\d)", tail)[0]
+        clauses = _CONDITION.split(sentence)[1:]
+        symbols = (self._parse(lhs) - self._parse(rhs)).free_symbols
+        names = {symbol.name for symbol in symbols}
+        variable, assumptions = None, []
+        for clause in (clause.strip().rstrip(",").strip() for clause in clauses):
+            if not set(re.findall(r"\b[a-z]\b", clause)) & names and not re.search(r"[<>≤≥≠]|!=", clause):
+                continue
+            if clause in names:
+                variable = clause
+                continue
+            found = _INEQUALITY.findall(clause)
+            for name, relation, value in found:
+                bound = self._parse(value.replace(" ", ""))
+                if name not in names or bound is None or not bound.free_symbols <= symbols:
+                    return None
+                assumptions.append(f"{name} {_OCTAVE_RELATIONS.get(relation, relation)} {value.replace(' ', '')}")
+            if not found or re.sub(r"\band\b|,", " ", _INEQUALITY.sub(" ", clause)).strip():
+                return None
+        return variable, assumptions
+
+    def _is_given_value(self, lhs: str, rhs: str) -> bool:
+        """Whether an equation only states a value, like 'a = 3', rather than posing something to solve"""
+        left, right = self._parse(lhs), self._parse(rhs)
+        if left is None or right is None:
+            return False
+        return (left.is_Symbol and not right.free_symbols) or (right.is_Symbol and not left.free_symbols)
+
+    @staticmethod
+    def _strip_definition(expression: str) -> str:
+        """Drop a leading 'f(x) =' style definition"""
+        return re.sub(r"^\s*[a-z]\s*\(\s*[a-z]\s*\)\s*=\s*", "", expression.strip())
+
+    def _math_suffix(self, text: str) -> str:
+        """Longest trailing run of words that parses as a math expression"""
+        words = re.split(r"(?<=[:,])\s*|\s+", text.strip())
+        best = ""
+        for start in range(len(words) - 1, -1, -1):
+            candidate = " ".join(words[start:]).strip()
+            if self._parse(candidate) is None:
+                if best:
+                    break
+                continue
+            best = candidate
+        return best
+
+    def _math_prefix(self, text: str) -> str:
+        """Longest leading run of words that parses as a math expression"""
+        text = re.split(r"[,?]|\.(?!\d)|\band\b|\bfor\b", text.strip())[0]
+        words = text.split()
+        for end in range(len(words), 0, -1):
+            candidate = " ".join(words[:end])
+            if self._parse(candidate) is not None:
+                return candidate
+        return ""
+
+    def _parse(self, text: str):
+        """Parse text with SymPy, rejecting anything with multi-letter symbols (English words)"""
+        text = text.strip().replace("−", "-").replace("·", "*").replace("×", "*")
+        if not text or not re.fullmatch(r"[\w\s\^\*\+\-/\(\)\.]+", text):
+            return None
+        expr = parse_bounded(text, self.transformations, {"e": E})
+        if expr is None or any(len(s.name) > 1 for s in expr.free_symbols):
+            return None
+        return expr
+
+    @staticmethod
+    def _octave(expr) -> str:
+        return octave_code(expr)
+
+
+def parse_bounded(text: str, transformations: Tuple, local_dict: Optional[Dict[str, Any]] = None,
+                  names: Iterable[str] = ()) -> Optional[Basic]:
+    """
+    Parse untrusted text with SymPy without evaluating it
+
+    Args:
+        text: Expression text
+        transformations: parse_expr transformations
+        local_dict: Names bound for the parser
+        names: Multi-letter names allowed besides the known functions
+
+    Returns:
+        The unevaluated expression, or None if the text is too large, uses
+        unknown names or has constant exponents that would blow up later
+    """
+    if _too_complex(text, names):
+        return None
+    try:
+        # Unevaluated, so the text is only parsed; nothing is computed from it here
+        expr = parse_expr(text, local_dict=local_dict, transformations=transformations, evaluate=False)
+    except Exception:
+        return None
+    if not isinstance(expr, Basic) or not _bounded(expr):
+        return None
+    return expr
+
+
+def _too_complex(text: str, names: Iterable[str] = ()) -> bool:
+    """Cheap checks on raw text before it reaches the parser"""
+    if len(text) > _MAX_EXPRESSION_LENGTH or re.search(rf"\d{{{_MAX_DIGITS + 1},}}", text):
+        return True
+    # Attribute access ("x.__class__") and names that are neither symbols nor known functions
+    if re.search(r"\.\s*[A-Za-z_]", text):
+        return True
+    allowed = _FUNCTION_NAMES.union(names)
+    if any(len(name) > 1 and name not in allowed for name in re.findall(r"[A-Za-z_]\w*", text)):
+        return True
+    depth = 0
+    for ch in text:
+        depth += (ch == "(") - (ch == ")")
+        if depth > _MAX_NESTING:
+            return True
+    return False
+
+
+def _bounded(expr) -> bool:
+    """Reject constant exponents that would make a power huge once evaluated (9^9^9^9)"""
+    # Inner powers first, so an exponent is only evaluated once its own powers are known to be small
+    for node in postorder_traversal(expr):
+        if isinstance(node, Pow) and not node.exp.free_symbols:
+            try:
+                if abs(complex(node.exp.evalf())) > _MAX_EXPONENT:
+                    return False
+            except (TypeError, ValueError):
+                return False
+    return True
+
+
+async def run_sympy(func: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+    """
+    Run SymPy work on user text in a worker thread, off the event loop
+
+    Args:
+        func: Function to call with args
+        timeout: Seconds to wait (defaults to SYMPY_TIMEOUT)
+
+    Returns:
+        The function's result, or None if it did not finish in time
+    """
+    timeout = timeout if timeout is not None else Config.SYMPY_TIMEOUT
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(func, *args), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"SymPy work in {getattr(func, '__qualname__', func)} gave up after {timeout}s")
+        return None
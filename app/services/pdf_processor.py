@@ -1,10 +1,15 @@
 import io
-from typing import List, Tuple
+import hashlib
+from typing import List, Optional, Tuple
 import logging
 import PyPDF2
+from PyPDF2.generic import ArrayObject
 from PIL import Image
 import re
+from ..core.config import Config
 from ..core.types import Problem, ProblemType, ProcessedPDF
+from .segmenter import ProblemSegmenter, TextLine
+from .state_store import StateStore
 
 # Make pytesseract optional (only needed for OCR)
 try:
@@ -17,7 +22,10 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 class PDFProcessor:
-    def __init__(self):
+    def __init__(self, store: Optional[StateStore] = None):
+        # Extracted page lines are cached here by page fingerprint
+        self.store = store
+        self.segmenter = ProblemSegmenter()
         self.problem_indicators = [
             r"solve",
             r"find",
@@ -45,13 +53,25 @@ class PDFProcessor:
             logger.info(f"PDF has {num_pages} pages")
             
             text = ""
+            lines: List[TextLine] = []
             images = []
+            page_fingerprints = []
+            pages_reused = 0
             
             # Extract text and images from each page
             for page_num, page in enumerate(pdf_reader.pages, 1):
                 try:
-                    # Extract text
-                    page_text = page.extract_text()
+                    # Extract text with layout, reusing it if this exact page was seen before
+                    fingerprint = self._page_fingerprint(page)
+                    page_fingerprints.append(fingerprint)
+                    page_lines = await self._cached_page_lines(fingerprint, page_num)
+                    if page_lines is not None:
+                        pages_reused += 1
+                    else:
+                        page_lines = self.segmenter.lines_from_page(page, page_num)
+                        await self._cache_page_lines(fingerprint, page_lines)
+                    lines.extend(page_lines)
+                    page_text = "\n".join(line.text for line in page_lines)
                     if page_text:
                         text += page_text + "\n"
                     
@@ -75,15 +95,18 @@ class PDFProcessor:
                     logger.warning(f"Error processing page {page_num}: {str(e)}")
                     continue
             
-            # Process text to identify problems
-            problems = self._extract_problems(text)
+            # Segment the laid-out lines to identify problems
+            problems = self._problems_from_lines(lines)
             logger.info(f"Extracted {len(problems)} problems from PDF")
             
             # Create metadata
             metadata = {
                 "num_pages": num_pages,
                 "num_problems": len(problems),
-                "num_images": len(images)
+                "num_images": len(images),
+                "page_fingerprints": page_fingerprints,
+                "pages_reused": pages_reused,
+                "pages_parsed": num_pages - pages_reused
             }
             
             return ProcessedPDF(
@@ -96,16 +119,46 @@ class PDFProcessor:
             logger.error(f"Error processing PDF: {str(e)}", exc_info=True)
             raise RuntimeError(f"Failed to process PDF: {str(e)}") from e
     
+    @staticmethod
+    def _page_fingerprint(page) -> str:
+        """Hash of the page content stream(s), identifying unchanged pages across uploads"""
+        digest = hashlib.sha256()
+        contents = page.get_contents()
+        if isinstance(contents, ArrayObject):
+            for stream in contents:
+                digest.update(stream.get_object().get_data())
+        elif contents is not None:
+            digest.update(contents.get_data())
+        return digest.hexdigest()
+    
+    async def _cached_page_lines(self, fingerprint: str, page_num: int) -> Optional[List[TextLine]]:
+        if self.store is None:
+            return None
+        cached = await self.store.get(f"pdf:page-lines:{fingerprint}")
+        if cached is None:
+            return None
+        # The same page content may sit at a different position in the new upload
+        return [TextLine(**{**line, "page": page_num}) for line in cached]
+    
+    async def _cache_page_lines(self, fingerprint: str, lines: List[TextLine]) -> None:
+        if self.store is not None:
+            await self.store.set(
+                f"pdf:page-lines:{fingerprint}",
+                [line.to_dict() for line in lines],
+                ttl=Config.PAGE_CACHE_TTL
+            )
+    
     def _extract_problems(self, text: str) -> List[Problem]:
         """Extract math problems from text"""
+        return self._problems_from_lines(self.segmenter.lines_from_text(text))
+    
+    def _problems_from_lines(self, lines: List[TextLine]) -> List[Problem]:
+        """Segment lines into problems and keep those that look like math problems"""
         problems = []
         
-        # Split text into paragraphs
-        paragraphs = text.split("\n\n")
-        
-        for paragraph in paragraphs:
-            # Skip empty paragraphs
-            if not paragraph.strip():
+        for segment in self.segmenter.segment(lines):
+            paragraph = segment.full_text
+            if not paragraph:
                 continue
             
             # Check if paragraph contains problem indicators
@@ -122,10 +175,20 @@ class PDFProcessor:
                 if latex_matches:
                     latex = " ".join(latex_matches)
                 
+                # Keep numbering and sub-parts for later decomposition
+                context = None
+                if segment.label or segment.parts:
+                    context = {
+                        "label": segment.label,
+                        "page": segment.page,
+                        "parts": [{"label": part.label, "text": part.text} for part in segment.parts]
+                    }
+                
                 problems.append(Problem(
                     text=paragraph.strip(),
                     type=problem_type,
-                    latex=latex
+                    latex=latex,
+                    context=context
                 ))
         
         return problems
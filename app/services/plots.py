@@ -0,0 +1,366 @@
+"""
+Server-side plots of distributions and functions
+
+A plot is described by a small JSON-compatible specification derived from
+the solved problem: the distribution the statistics kernel computed with
+(PMF bars or PDF curve with the queried event shaded) or a function graph
+for problems defining a function or equation in one variable. Specs are
+rendered with headless matplotlib in a bounded process pool, never on the
+event loop, and cached by a hash of the spec so clients fetch each plot
+lazily by ID after the text response has been sent.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import logging
+import math
+import multiprocessing
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+import numpy as np
+from ..core.config import Config
+from ..core.types import Problem, ProblemType, Solution
+from .matlab_codegen import MatlabCodeGenerator
+from .state_store import StateStore
+from .stats_kernel import StatsKernel
+
+# Make matplotlib optional (plots are skipped without it)
+try:
+    import matplotlib
+    HAS_MATPLOTLIB = True
+except ImportError:
+    HAS_MATPLOTLIB = False
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+# Discrete distributions are drawn over mean ± this many standard deviations, with at most _MAX_BARS bars
+_SUPPORT_SDS = 6
+_MAX_BARS = 200
+
+_INTERVAL = re.compile(r"\[\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*\]|from\s+(?:x\s*=\s*)?(-?\d+(?:\.\d+)?)\s+to\s+(-?\d+(?:\.\d+)?)")
+_DEFINITION = re.compile(r"^(?:[a-z]\s*\(\s*[a-z]\s*\)|y)$")
+
+_kernel = StatsKernel()
+_codegen = MatlabCodeGenerator()
+
+
+def plot_id(spec: Dict[str, Any], fmt: str) -> str:
+    """Content address of a rendered plot"""
+    canonical = json.dumps(spec, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{fmt}:{canonical}".encode("utf-8")).hexdigest()[:32]
+
+
+def plot_specs(problem: Problem, solution: Solution) -> List[Dict[str, Any]]:
+    """
+    Plots worth drawing for a solved problem
+
+    Args:
+        problem: The problem as solved
+        solution: Its solution (a real numerical result is marked on function graphs)
+
+    Returns:
+        Plot specifications; empty when nothing recognizable can be plotted
+    """
+    if problem.type in (ProblemType.PROBABILITY, ProblemType.STATISTICS):
+        match = _kernel.match(problem)
+        return [match[1]] if match is not None else []
+    spec = _function_spec(problem.text, solution.numerical_result)
+    return [spec] if spec is not None else []
+
+
+def _function_spec(text: str, result: Any) -> Optional[Dict[str, Any]]:
+    """A graph of the function defined, or the equation posed, in the problem text"""
+    for line in re.split(r"[\n;]|\.\s", text):
+        sides = _codegen.equation_sides(line)
+        if sides is None:
+            continue
+        lhs, rhs = sides
+        definition = _DEFINITION.match(lhs.strip()) is not None
+        expression = _codegen.expression(rhs) if definition else None
+        if not definition:
+            left, right = _codegen.expression(lhs), _codegen.expression(rhs)
+            if left is None or right is None:
+                continue
+            expression = left - right
+        if expression is None or len(expression.free_symbols) != 1:
+            continue
+        variable = next(iter(expression.free_symbols))
+        interval = _INTERVAL.search(text)
+        if interval:
+            low, high = [float(v) for v in interval.groups() if v is not None]
+        elif isinstance(result, (int, float)) and not isinstance(result, bool) and math.isfinite(result):
+            low, high = result - 10.0, result + 10.0
+        else:
+            low, high = -10.0, 10.0
+        if low >= high:
+            continue
+        marks = [float(result)] if isinstance(result, (int, float)) and not isinstance(result, bool) else []
+        return {
+            "kind": "function",
+            "expr": str(expression),
+            "var": str(variable),
+            "range": [low, high],
+            "label": str(expression) if not definition else f"{lhs.strip()} = {expression}",
+            "zero_line": not definition,
+            "marks": [m for m in marks if low <= m <= high],
+        }
+    return None
+
+
+def _in_event(x: np.ndarray, event: List[Any]) -> np.ndarray:
+    """Mask of x values inside the queried event"""
+    op, a, b = event
+    if op == "between":
+        return (x >= a) & (x <= b)
+    if op == "outside":
+        return (x <= a) | (x >= b)
+    return {"==": x == a, "<=": x <= a, "<": x < a, ">=": x >= a, ">": x > a}.get(op, np.zeros_like(x, dtype=bool))
+
+
+def _t_pdf(x: np.ndarray, df: float) -> np.ndarray:
+    log_norm = math.lgamma((df + 1) / 2) - math.lgamma(df / 2) - 0.5 * math.log(df * math.pi)
+    return np.exp(log_norm - (df + 1) / 2 * np.log1p(x * x / df))
+
+
+def _support(mean: float, sd: float, upper: float) -> np.ndarray:
+    """Values of k to draw: 0..upper clamped to mean ± _SUPPORT_SDS·sd, thinned to at most _MAX_BARS"""
+    low = max(0, math.floor(mean - _SUPPORT_SDS * sd))
+    high = int(min(upper, math.ceil(mean + _SUPPORT_SDS * sd)))
+    step = max(1, math.ceil((high - low + 1) / _MAX_BARS))
+    return np.arange(low, high + 1, step)
+
+
+def render_plot(spec: Dict[str, Any], fmt: str) -> bytes:
+    """Render a plot specification to PNG or SVG bytes (runs in a pool worker)"""
+    matplotlib.use("Agg")
+    # Figure without pyplot keeps no global state between renders
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=(6, 4), dpi=100)
+    axes = figure.add_subplot()
+    kind = spec["kind"]
+    if kind in ("binomial", "poisson"):
+        if kind == "binomial":
+            n, p = int(spec["n"]), spec["p"]
+            k = _support(n * p, math.sqrt(n * p * (1 - p)), n)
+            pmf = _kernel.binomial_pmf(k, n, p)
+            axes.set_title(f"Binomial(n = {n}, p = {p:.4g})")
+        else:
+            lam = spec["lam"]
+            event_max = max(v for v in spec["event"][1:] if v is not None)
+            k = _support(lam, math.sqrt(lam), max(lam + 4 * math.sqrt(lam), event_max + 3))
+            pmf = _kernel.poisson_pmf(k, lam)
+            axes.set_title(f"Poisson(λ = {lam:.4g})")
+        inside = _in_event(k, spec["event"])
+        axes.bar(k, pmf, width=0.8 * (k[1] - k[0] if len(k) > 1 else 1),
+                 color=np.where(inside, "tab:orange", "tab:blue"))
+        axes.set_xlabel("k")
+        axes.set_ylabel("P(X = k)")
+    elif kind in ("normal", "t"):
+        loc, scale = spec["loc"], spec["scale"]
+        z = np.linspace(-4.5, 4.5, 600)
+        if kind == "t" and spec.get("df"):
+            z *= 1 + 2 / spec["df"]
+            pdf = _t_pdf(z, spec["df"]) / scale
+            axes.set_title(f"t distribution (df = {spec['df']})")
+        else:
+            pdf = np.exp(-0.5 * z * z) / (scale * math.sqrt(2 * math.pi))
+            axes.set_title(f"Normal(μ = {loc:.4g}, σ = {scale:.4g})")
+        x = loc + scale * z
+        axes.plot(x, pdf, color="tab:blue")
+        axes.fill_between(x, pdf, where=_in_event(x, spec["event"]), color="tab:orange", alpha=0.5)
+        axes.set_xlabel("x")
+        axes.set_ylabel("density")
+    elif kind == "function":
+        from sympy import lambdify, sympify, Symbol
+        variable = Symbol(spec["var"])
+        function = lambdify(variable, sympify(spec["expr"]), modules="numpy")
+        x = np.linspace(spec["range"][0], spec["range"][1], 800)
+        with np.errstate(all="ignore"):
+            y = np.broadcast_to(np.asarray(function(x), dtype=float), x.shape).copy()
+        # Break the line at poles instead of drawing vertical spikes
+        finite = y[np.isfinite(y)]
+        if finite.size:
+            spread = np.percentile(finite, 98) - np.percentile(finite, 2)
+            y[np.abs(y - np.median(finite)) > 10 * (spread or 1)] = np.nan
+        axes.plot(x, y, color="tab:blue", label=spec["label"])
+        if spec.get("zero_line"):
+            axes.axhline(0, color="gray", linewidth=0.8)
+        for mark in spec.get("marks", []):
+            axes.axvline(mark, color="tab:orange", linestyle="--", linewidth=1)
+        axes.set_xlabel(spec["var"])
+        axes.legend(loc="best")
+    else:
+        raise ValueError(f"Unsupported plot kind: {kind}")
+    axes.grid(alpha=0.3)
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=fmt, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+class PlotRenderer:
+    """Render plot specs in a process pool with a shared cache keyed by spec hash"""
+
+    def __init__(self, store: Optional[StateStore] = None, fmt: Optional[str] = None,
+                 workers: Optional[int] = None, ttl: Optional[int] = None, memory_size: int = 128):
+        self.store = store
+        self.fmt = (fmt or Config.PLOT_FORMAT).lower()
+        self.workers = workers or Config.PLOT_WORKERS
+        self.ttl = ttl if ttl is not None else Config.PLOT_CACHE_TTL
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._specs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._rendering: Dict[str, asyncio.Task] = {}
+        # Plot ID -> monotonic time until which a failed render is not retried
+        self._failed: Dict[str, float] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return Config.PLOTS_ENABLED and HAS_MATPLOTLIB and self.fmt in MEDIA_TYPES
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES.get(self.fmt, "application/octet-stream")
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned workers do not inherit the server's threads or event loop
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor) -> None:
+        """Stop a pool whose worker is stuck or died; the next render starts a fresh one"""
+        if self._pool is pool:
+            self._pool = None
+        # A running task cannot be cancelled through the executor, so its workers are terminated;
+        # the pool then fails its other pending renders with BrokenProcessPool
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False)
+
+    async def _has_failed(self, key: str) -> bool:
+        until = self._failed.get(key)
+        if until is not None:
+            if until > time.monotonic():
+                return True
+            del self._failed[key]
+        return self.store is not None and await self.store.get(f"plotfail:{key}") is not None
+
+    async def _mark_failed(self, key: str, error: str) -> None:
+        self._failed[key] = time.monotonic() + Config.PLOT_FAILURE_TTL
+        if len(self._failed) > self.memory_size * 4:
+            self._failed.pop(next(iter(self._failed)))
+        if self.store is not None:
+            await self.store.set(f"plotfail:{key}", {"error": error}, ttl=Config.PLOT_FAILURE_TTL)
+
+    async def submit(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Start rendering a plot in the background
+
+        Args:
+            spec: Plot specification from plot_specs
+
+        Returns:
+            The plot's ID, kind and URL; the image is fetched from the URL when needed
+        """
+        key = plot_id(spec, self.fmt)
+        self._specs[key] = spec
+        self._specs.move_to_end(key)
+        if len(self._specs) > self.memory_size * 4:
+            self._specs.popitem(last=False)
+        if self.store is not None:
+            # Any worker can then render the plot when it is fetched
+            await self.store.set(f"plotspec:{key}", spec, ttl=self.ttl)
+        if key not in self._memory and key not in self._rendering and not await self._has_failed(key):
+            self._start(key, spec)
+        return {"id": key, "kind": spec["kind"], "url": f"/api/plots/{key}"}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Rendered bytes of a submitted plot, waiting for its render if needed; None if unknown"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        task = self._rendering.get(key)
+        if task is None:
+            if self.store is not None:
+                cached = await self.store.get(f"plot:{key}")
+                if cached is not None:
+                    return self._remember(key, base64.b64decode(cached))
+            if await self._has_failed(key):
+                return None
+            spec = self._specs.get(key)
+            if spec is None and self.store is not None:
+                spec = await self.store.get(f"plotspec:{key}")
+            if spec is None:
+                return None
+            task = self._start(key, spec)
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            return None
+
+    async def render(self, spec: Dict[str, Any]) -> Optional[bytes]:
+        """Render a spec now (or take it from the cache); None if rendering failed"""
+        await self.submit(spec)
+        return await self.get(plot_id(spec, self.fmt))
+
+    def _start(self, key: str, spec: Dict[str, Any]) -> asyncio.Task:
+        task = asyncio.create_task(self._render(key, spec))
+        # Failures are logged in _render; nobody may be waiting for the result
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._rendering[key] = task
+        return task
+
+    async def _render(self, key: str, spec: Dict[str, Any]) -> bytes:
+        try:
+            cached = await self.store.get(f"plot:{key}") if self.store is not None else None
+            if cached is not None:
+                return self._remember(key, base64.b64decode(cached))
+            loop = asyncio.get_running_loop()
+            pool = self._get_pool()
+            try:
+                data = await asyncio.wait_for(
+                    loop.run_in_executor(pool, render_plot, spec, self.fmt),
+                    timeout=Config.PLOT_RENDER_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                # The worker keeps running after wait_for gives up, so it is killed to free the pool
+                self._discard_pool(pool)
+                raise TimeoutError(f"render took longer than {Config.PLOT_RENDER_TIMEOUT}s")
+            if self.store is not None:
+                await self.store.set(f"plot:{key}", base64.b64encode(data).decode("ascii"), ttl=self.ttl)
+            return self._remember(key, data)
+        except BrokenProcessPool as e:
+            # Collateral of another render's timeout or a crashed worker; this plot may render next time
+            self._discard_pool(pool)
+            logger.warning(f"Could not render {spec.get('kind')} plot: worker pool stopped ({str(e)})")
+            raise
+        except Exception as e:
+            logger.warning(f"Could not render {spec.get('kind')} plot: {str(e)}")
+            await self._mark_failed(key, str(e))
+            raise
+        finally:
+            self._rendering.pop(key, None)
+
+    def _remember(self, key: str, data: bytes) -> bytes:
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+        return data
+
+    async def close(self) -> None:
+        for task in list(self._rendering.values()):
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
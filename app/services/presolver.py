@@ -0,0 +1,147 @@
+"""
+Speculative pre-solving of uploaded problems
+
+Right after a PDF is processed, its problems can be solved in the background
+into the solution cache so that later solve requests return immediately.
+Work runs in the scheduler's "background" lane, which only uses capacity
+that interactive and batch requests leave free, and is bounded by a
+per-document problem and token budget that can be cancelled at any time.
+
+Pre-solving is opt-in (PRESOLVE_ENABLED or ?presolve=true on upload) and is
+charged to the uploader's quota like the solves it stands in for; a later
+request served from its result is not charged again.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from ..core.config import Config
+from ..core.types import Problem, Solution
+from .accounting import tag_usage
+from .scheduler import FairScheduler, QuotaExceededError, estimate_tokens
+from .solution_cache import SolutionCache
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculativeSolver:
+    """Solve a document's problems ahead of time at background priority"""
+
+    def __init__(
+        self,
+        scheduler: FairScheduler,
+        cache: SolutionCache,
+        solve: Callable[[Problem, Optional[str]], Awaitable[Solution]],
+    ):
+        self.scheduler = scheduler
+        self.cache = cache
+        self.solve = solve
+        # Solution cache key -> background task, and those that already left the queue
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._started: Set[str] = set()
+        # Document -> its outstanding tasks, dropped once the last one is done
+        self._documents: Dict[str, List[asyncio.Task]] = {}
+
+    async def start(self, document_id: str, problems: List[Problem], api_key: Optional[str],
+                    tenant: str) -> int:
+        """
+        Start pre-solving a document's problems
+
+        Args:
+            document_id: Identifier of the uploaded document, used to cancel its work
+            problems: Extracted problems, in document order
+            api_key: API key of the uploading session
+            tenant: Scheduling identity the work is accounted to
+
+        Returns:
+            Number of problems scheduled within the document's budget
+        """
+        self.cancel(document_id)
+        budget = Config.PRESOLVE_TOKEN_BUDGET
+        scheduled: Dict[str, asyncio.Task] = {}
+        for problem in problems:
+            if len(scheduled) >= Config.PRESOLVE_MAX_PROBLEMS:
+                break
+            # Keyed like the cache: a pre-solve only stands in for requests under the same profile
+            fingerprint = self.cache.key(problem)
+            if fingerprint in self._tasks or fingerprint in scheduled:
+                continue
+            if await self.cache.get(problem) is not None:
+                continue
+            cost = estimate_tokens(problem)
+            if cost > budget:
+                break
+            budget -= cost
+            task = asyncio.create_task(self._presolve(fingerprint, problem, api_key, tenant, cost))
+            self._tasks[fingerprint] = task
+            scheduled[fingerprint] = task
+        if scheduled:
+            self._documents[document_id] = list(scheduled.values())
+            logger.info(f"Pre-solving {len(scheduled)} problems of document {document_id}")
+        # A done callback also runs for a task cancelled before its first step
+        for fingerprint, task in scheduled.items():
+            task.add_done_callback(lambda done, fingerprint=fingerprint: self._finished(document_id, fingerprint, done))
+        return len(scheduled)
+
+    def cancel(self, document_id: str) -> int:
+        """Cancel a document's pre-solves that have not finished; returns how many were cancelled"""
+        cancelled = 0
+        for task in self._documents.pop(document_id, []):
+            if not task.done():
+                task.cancel()
+                cancelled += 1
+        return cancelled
+
+    async def wait_for(self, problem: Problem, ensemble: Optional[int] = None) -> Optional[Solution]:
+        """
+        Result of a pre-solve already in progress for this problem under the current profile
+
+        A pre-solve that is still queued is cancelled instead, so the caller
+        solves the problem at its own (higher) priority.
+        """
+        fingerprint = self.cache.key(problem, ensemble)
+        task = self._tasks.get(fingerprint)
+        if task is None or task.cancelled():
+            return None
+        if fingerprint not in self._started:
+            task.cancel()
+            return None
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            return None
+
+    async def close(self) -> None:
+        """Cancel all outstanding pre-solves"""
+        for task in self._tasks.values():
+            task.cancel()
+        self._documents.clear()
+
+    async def _presolve(self, fingerprint: str, problem: Problem, api_key: Optional[str],
+                        tenant: str, cost: int) -> Optional[Solution]:
+        tag_usage(session=tenant, endpoint="presolve", problem_type=problem.type.value)
+
+        async def job() -> Solution:
+            self._started.add(fingerprint)
+            solution = await self.solve(problem, api_key)
+            await self.cache.put(problem, solution)
+            return solution
+
+        try:
+            return await self.scheduler.run(tenant, job, cost=cost, lane="background")
+        except QuotaExceededError as e:
+            logger.info(f"Stopped pre-solving for {tenant}: {str(e)}")
+            return None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Pre-solve failed: {str(e)}")
+            return None
+
+    def _finished(self, document_id: str, fingerprint: str, task: asyncio.Task) -> None:
+        """Forget a finished pre-solve, and its document once none of its pre-solves is left"""
+        if self._tasks.get(fingerprint) is task:
+            del self._tasks[fingerprint]
+            self._started.discard(fingerprint)
+        tasks = self._documents.get(document_id)
+        if tasks is not None and task in tasks and all(other.done() for other in tasks):
+            del self._documents[document_id]
@@ -0,0 +1,333 @@
+"""
+On-demand profiling and slow-request capture
+
+Three ways to see where a worker spends its time without redeploying:
+
+- A time-boxed wall-clock sampler that periodically reads the stacks of
+  all threads (sys._current_frames) and aggregates them as collapsed stacks,
+  ready for flamegraph.pl or speedscope.
+- cProfile for a single request, enabled by an admin-only request header.
+- Automatic capture of requests that exceed a latency threshold: their
+  stage breakdown plus stack samples taken while they were slow. For a
+  request suspended in an await, the sample is its coroutine await chain;
+  while it runs, it is the event loop thread's stack.
+"""
+import asyncio
+import contextvars
+import cProfile
+import io
+import logging
+import pstats
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+from ..core.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Header that asks for a cProfile of one request (together with X-Admin-Token)
+PROFILE_HEADER = b"x-profile"
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename.replace("\\", "/").split("/")
+    return f"{code.co_name} ({'/'.join(path[-2:])})"
+
+
+def thread_stack(frame) -> List[str]:
+    """Frame labels of a thread stack, outermost first"""
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame))
+        frame = frame.f_back
+    return stack[::-1]
+
+
+def await_chain(coro) -> List[str]:
+    """Frame labels of a suspended coroutine and everything it is awaiting, outermost first"""
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            # Awaiting a future, task or other awaitable without a frame
+            stack.append(f"<{type(coro).__name__}>")
+            break
+        stack.append(_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return stack
+
+
+def collapsed(samples: Counter) -> str:
+    """Samples in collapsed-stack format: 'outer;inner;leaf count' per line"""
+    return "\n".join(f"{stack} {count}" for stack, count in samples.most_common()) + "\n"
+
+
+class StackSampler:
+    """Wall-clock sampling profiler over all threads of the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    async def sample(self, seconds: float, interval: Optional[float] = None) -> Counter:
+        """
+        Sample every thread's stack for a while
+
+        Args:
+            seconds: How long to sample, capped at PROFILING_MAX_SECONDS
+            interval: Seconds between samples
+
+        Returns:
+            Sample counts per collapsed stack, each prefixed with its thread name
+
+        Raises:
+            RuntimeError: If another sampling profile is already running
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A sampling profile is already running")
+        try:
+            seconds = min(max(seconds, 0.1), Config.PROFILING_MAX_SECONDS)
+            return await asyncio.to_thread(self._run, seconds, interval or Config.PROFILING_SAMPLE_INTERVAL)
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _run(seconds: float, interval: float) -> Counter:
+        own = threading.get_ident()
+        names = {}
+        samples: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = [names.get(ident, f"thread-{ident}")] + thread_stack(frame)
+                samples[";".join(stack)] += 1
+            time.sleep(interval)
+        return samples
+
+
+class _Trace:
+    """A request being timed"""
+
+    __slots__ = ("id", "method", "path", "started", "wall_started", "stages", "samples", "task", "profile")
+
+    def __init__(self, method: str, path: str, task: Optional[asyncio.Task]):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.stages: List[Dict[str, Any]] = []
+        self.samples: Counter = Counter()
+        self.task = task
+        self.profile: Optional[str] = None
+
+
+_current_trace: contextvars.ContextVar[Optional[_Trace]] = contextvars.ContextVar("request_trace", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of the current request for its breakdown"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        mark(name, time.perf_counter() - started, started - trace.started)
+
+
+def mark(name: str, seconds: float, offset: Optional[float] = None) -> None:
+    """Record a stage of the current request whose duration was measured elsewhere"""
+    trace = _current_trace.get()
+    if trace is not None:
+        if offset is None:
+            offset = time.perf_counter() - trace.started - seconds
+        trace.stages.append({"stage": name, "start": round(offset, 4), "seconds": round(seconds, 4)})
+
+
+class RequestProfiler:
+    """Keep stage breakdowns and stack samples of requests slower than a threshold"""
+
+    def __init__(self, threshold: Optional[float] = None, keep: Optional[int] = None,
+                 interval: Optional[float] = None):
+        self.threshold = threshold if threshold is not None else Config.SLOW_REQUEST_SECONDS
+        self.interval = interval or Config.PROFILING_SAMPLE_INTERVAL
+        self.captures: Deque[Dict[str, Any]] = deque(maxlen=keep or Config.SLOW_REQUEST_KEEP)
+        # Shared with the sampler thread, so only read or changed under _active_lock
+        self._active: Dict[str, _Trace] = {}
+        self._active_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop_thread: Optional[int] = None
+        self._cprofile_lock = threading.Lock()
+
+    def begin(self, method: str, path: str) -> _Trace:
+        """Start timing the current request"""
+        trace = _Trace(method, path, asyncio.current_task())
+        _current_trace.set(trace)
+        if self.threshold > 0:
+            self._loop_thread = threading.get_ident()
+            with self._active_lock:
+                self._active[trace.id] = trace
+            self._ensure_thread()
+            self._wake.set()
+        return trace
+
+    def end(self, trace: _Trace, status: int) -> Optional[str]:
+        """Finish timing a request; returns its capture ID if it was kept"""
+        # Once it is out of _active, the sampler no longer adds to its samples
+        with self._active_lock:
+            self._active.pop(trace.id, None)
+        duration = time.perf_counter() - trace.started
+        slow = self.threshold > 0 and duration >= self.threshold
+        if not slow and trace.profile is None:
+            return None
+        if slow:
+            logger.warning(f"Slow request {trace.method} {trace.path}: {duration:.2f}s ({trace.id})")
+        self.captures.append({
+            "id": trace.id,
+            "method": trace.method,
+            "path": trace.path,
+            "status": status,
+            "time": trace.wall_started,
+            "seconds": round(duration, 4),
+            "stages": trace.stages,
+            "samples": trace.samples,
+            "profile": trace.profile,
+        })
+        return trace.id
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Summaries of captured requests, newest first"""
+        return [
+            {
+                **{key: value for key, value in capture.items() if key not in ("samples", "profile")},
+                "samples": sum(capture["samples"].values()),
+                "cprofile": capture["profile"] is not None,
+            }
+            for capture in list(reversed(self.captures))[:limit]
+        ]
+
+    def get(self, capture_id: str) -> Optional[Dict[str, Any]]:
+        return next((c for c in self.captures if c["id"] == capture_id), None)
+
+    @contextmanager
+    def cprofile(self, trace: _Trace) -> Iterator[bool]:
+        """
+        cProfile the rest of a request
+
+        Everything the event loop runs meanwhile is included, so concurrent
+        requests show up too; only one request is profiled at a time.
+        """
+        if not self._cprofile_lock.acquire(blocking=False):
+            yield False
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            yield True
+        finally:
+            profile.disable()
+            self._cprofile_lock.release()
+            output = io.StringIO()
+            pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(60)
+            trace.profile = output.getvalue()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._sample_loop, name="slow-request-sampler", daemon=True)
+            self._thread.start()
+
+    def _sample_loop(self) -> None:
+        while True:
+            self._wake.clear()
+            with self._active_lock:
+                idle = not self._active
+            if idle:
+                self._wake.wait()
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            loop_frame = None
+            with self._active_lock:
+                active = list(self._active.values())
+            for trace in active:
+                if now - trace.started < self.threshold or trace.task is None:
+                    continue
+                coro = trace.task.get_coro()
+                if getattr(coro, "cr_running", False):
+                    # The request is executing right now: sample the event loop thread
+                    if loop_frame is None:
+                        loop_frame = sys._current_frames().get(self._loop_thread)
+                    stack = thread_stack(loop_frame) if loop_frame is not None else []
+                else:
+                    stack = await_chain(coro)
+                if stack:
+                    with self._active_lock:
+                        if trace.id in self._active:
+                            trace.samples[";".join(stack)] += 1
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware timing the configured paths and capturing slow requests
+
+    Pure ASGI (not BaseHTTPMiddleware) so the endpoint runs in the request's
+    own task, whose await chain is what gets sampled.
+    """
+
+    def __init__(self, app, profiler: RequestProfiler, paths: Optional[List[str]] = None):
+        self.app = app
+        self.profiler = profiler
+        self.paths = set(paths if paths is not None else Config.SLOW_REQUEST_PATHS)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        trace = self.profiler.begin(scope["method"], scope["path"])
+        headers = dict(scope.get("headers") or [])
+        wants_profile = PROFILE_HEADER in headers and self._is_admin(headers)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if wants_profile:
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"x-profile-id", trace.id.encode("ascii"))]}
+            await send(message)
+
+        try:
+            if wants_profile:
+                with self.profiler.cprofile(trace):
+                    await self.app(scope, receive, send_with_id)
+            else:
+                await self.app(scope, receive, send_with_id)
+        finally:
+            self.profiler.end(trace, status)
+
+    @staticmethod
+    def _is_admin(headers: Dict[bytes, bytes]) -> bool:
+        token = headers.get(b"x-admin-token", b"").decode("latin-1")
+        return bool(Config.ADMIN_TOKEN) and secrets.compare_digest(token, Config.ADMIN_TOKEN)
+
+
+sampler = StackSampler()
+request_profiler = RequestProfiler()
@@ -0,0 +1,202 @@
+"""
+Fair scheduling of solves across users
+
+Every solve that needs the LLM goes through a FairScheduler. It keeps one
+queue per tenant (session or API key) in each lane ("interactive" before
+"batch"), dispatches between tenants with deficit round-robin weighted by
+estimated token cost, caps the number of solves in flight and enforces
+per-tenant request and token quotas shared through the state store.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple, TypeVar
+from ..core.config import Config
+from ..core.profiles import current_profile
+from ..core.types import Problem
+from .state_store import StateStore
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Lanes in dispatch order; a lane is only served when all lanes before it are empty
+LANES = ["interactive", "batch", "background"]
+
+
+class QuotaExceededError(RuntimeError):
+    """Raised when a tenant is over its quota or has too many queued requests"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(problem: Problem, solves: int = 1) -> int:
+    """Rough token cost of solving a problem (prompt at ~4 characters per token plus completion)"""
+    return (len(problem.text) // 4 + current_profile().max_tokens) * max(1, solves)
+
+
+class FairScheduler:
+    """Deficit round-robin scheduler with per-tenant queues and quotas"""
+
+    def __init__(
+        self,
+        store: Optional[StateStore] = None,
+        concurrency: Optional[int] = None,
+        quantum: Optional[int] = None,
+        max_queued: Optional[int] = None,
+    ):
+        self.store = store
+        self.concurrency = max(1, concurrency or Config.SCHEDULER_CONCURRENCY)
+        self.quantum = max(1, quantum or Config.SCHEDULER_QUANTUM)
+        self.max_queued = max_queued or Config.SCHEDULER_MAX_QUEUED
+        # Slots kept free of background work so user-facing solves never wait behind it
+        self.background_reserve = min(Config.SCHEDULER_BACKGROUND_RESERVE, self.concurrency - 1)
+        self.running = 0
+        # lane -> tenant -> queued (cost, future); the OrderedDict is the round-robin ring
+        self._queues: Dict[str, "OrderedDict[str, Deque[Tuple[int, asyncio.Future]]]"] = {
+            lane: OrderedDict() for lane in LANES
+        }
+        self._deficits: Dict[str, Dict[str, int]] = {lane: {} for lane in LANES}
+        # Tenants that already received their quantum for the current turn
+        self._credited: Dict[str, Set[str]] = {lane: set() for lane in LANES}
+
+    async def run(self, tenant: str, job: Callable[[], Awaitable[T]], cost: int,
+                  lane: str = "batch") -> T:
+        """
+        Run a job once the tenant's turn comes up
+
+        Args:
+            tenant: Session ID or API key hash the job is accounted to
+            job: Coroutine function performing the solve
+            cost: Estimated tokens used by the job
+            lane: "interactive" for single user-facing requests, "batch" for other
+                requests and "background" for speculative work
+
+        Returns:
+            The job's result
+
+        Raises:
+            QuotaExceededError: If the tenant is over quota or its queue is full
+        """
+        if lane not in self._queues:
+            raise ValueError(f"Unknown scheduler lane: {lane}")
+        if self.queued(tenant) >= self.max_queued:
+            raise QuotaExceededError(f"Too many queued requests (limit {self.max_queued})", retry_after=5)
+        await self._charge_quota(tenant, cost)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (cost, future)
+        self._queues[lane].setdefault(tenant, deque()).append(entry)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Cancelled right after being granted a slot
+                self._release()
+            else:
+                self._remove(lane, tenant, entry)
+            raise
+        try:
+            return await job()
+        finally:
+            self._release()
+
+    def queued(self, tenant: Optional[str] = None) -> int:
+        """Number of queued (not yet running) jobs, overall or for one tenant"""
+        return sum(
+            len(queue)
+            for lane in self._queues.values()
+            for name, queue in lane.items()
+            if tenant is None or name == tenant
+        )
+
+    def status(self, tenant: Optional[str] = None) -> Dict[str, Any]:
+        """Queue depth per lane, running jobs and, if given, the tenant's own queue depth"""
+        status = {
+            "running": self.running,
+            "concurrency": self.concurrency,
+            "queued": {lane: sum(len(q) for q in queues.values()) for lane, queues in self._queues.items()},
+            "tenants": len({name for queues in self._queues.values() for name in queues}),
+        }
+        if tenant is not None:
+            status["queued_for_you"] = self.queued(tenant)
+        return status
+
+    def _release(self) -> None:
+        self.running -= 1
+        self._dispatch()
+
+    def _remove(self, lane: str, tenant: str, entry: Tuple[int, asyncio.Future]) -> None:
+        queue = self._queues[lane].get(tenant)
+        if queue is not None and entry in queue:
+            queue.remove(entry)
+            if not queue:
+                self._drop(lane, tenant)
+
+    def _drop(self, lane: str, tenant: str) -> None:
+        self._queues[lane].pop(tenant, None)
+        self._deficits[lane].pop(tenant, None)
+        self._credited[lane].discard(tenant)
+
+    def _dispatch(self) -> None:
+        while self.running < self.concurrency:
+            future = self._next()
+            if future is None:
+                return
+            self.running += 1
+            future.set_result(None)
+
+    def _next(self) -> Optional[asyncio.Future]:
+        """Pop the next job to run: first non-empty lane, deficit round-robin across tenants"""
+        for lane in LANES:
+            if lane == "background" and self.concurrency - self.running <= self.background_reserve:
+                return None
+            ring, deficits, credited = self._queues[lane], self._deficits[lane], self._credited[lane]
+            while ring:
+                tenant, queue = next(iter(ring.items()))
+                if not queue:
+                    self._drop(lane, tenant)
+                    continue
+                if tenant not in credited:
+                    # Credit a quantum when the tenant reaches the front of the ring
+                    deficits[tenant] = deficits.get(tenant, 0) + self.quantum
+                    credited.add(tenant)
+                cost, future = queue[0]
+                if cost <= deficits[tenant]:
+                    queue.popleft()
+                    deficits[tenant] -= cost
+                    if not queue:
+                        self._drop(lane, tenant)
+                    if future.cancelled():
+                        continue
+                    return future
+                # Not enough credit left: keep the deficit and move to the back of the ring
+                credited.discard(tenant)
+                ring.move_to_end(tenant)
+        return None
+
+    async def _charge_quota(self, tenant: str, cost: int) -> None:
+        """Count the request and its estimated tokens against the tenant's quota window"""
+        if self.store is None or (not Config.QUOTA_REQUESTS and not Config.QUOTA_TOKENS):
+            return
+        window = Config.QUOTA_WINDOW_SECONDS
+        window_start = int(time.time()) // window * window
+        retry_after = window_start + window - int(time.time())
+        key = f"quota:{tenant}:{window_start}"
+        # Charge first, then check: atomic increments cannot be lost between workers, and a
+        # refused request takes its charge back
+        requests = await self.store.incr(f"{key}:requests", 1, ttl=window)
+        if Config.QUOTA_REQUESTS and requests > Config.QUOTA_REQUESTS:
+            await self.store.incr(f"{key}:requests", -1, ttl=window)
+            raise QuotaExceededError(
+                f"Request quota of {Config.QUOTA_REQUESTS} per {window}s exceeded", retry_after)
+        tokens = await self.store.incr(f"{key}:tokens", cost, ttl=window)
+        if Config.QUOTA_TOKENS and tokens > Config.QUOTA_TOKENS:
+            await self.store.incr(f"{key}:tokens", -cost, ttl=window)
+            await self.store.incr(f"{key}:requests", -1, ttl=window)
+            raise QuotaExceededError(
+                f"Token quota of {Config.QUOTA_TOKENS} per {window}s exceeded", retry_after)
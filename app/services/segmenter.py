@@ -0,0 +1,334 @@
+"""
+Layout-aware segmentation of documents into problems
+
+Splits extracted text into right-sized problems using numbering patterns
+("1.", "Problem 3", "Q4"), sub-part markers ("(a)", "b)", "(iii)") that are
+grouped under their parent problem, and font/position data from the PDF
+(headings, indentation, vertical gaps) when it is available.
+"""
+import re
+import logging
+import statistics
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_TOP_LEVEL_PATTERNS = [
+    # "Problem 3:", "Question 2.", "Exercise 4 -", "Q5)"
+    (re.compile(r"^(?:problem|question|exercise|q)\s*\.?\s*(\d{1,3})\s*[.:)\-]?\s*(.*)$", re.IGNORECASE), True),
+    # "1. Solve ..." / "2) Find ..." (but not decimals such as "3.5 is ...")
+    (re.compile(r"^(\d{1,3})\s*[.)]\s+(?!\d)(.*)$"), False),
+]
+
+_SUB_PART_PATTERNS = [
+    re.compile(r"^\((?P<label>[a-h]|i{1,3}|iv|vi{0,3}|ix|x)\)\s*(?P<rest>.*)$", re.IGNORECASE),
+    re.compile(r"^(?P<label>[a-h])\)\s+(?P<rest>.*)$"),
+    re.compile(r"^part\s+\(?(?P<label>[a-h])\)?\s*[.:)]?\s*(?P<rest>.*)$", re.IGNORECASE),
+]
+
+# Approximate width of a space in points, to compare text indentation with PDF positions
+_CHAR_WIDTH = 6.0
+
+# Lines starting this far right of the left margin (in points) are treated as indented
+_INDENT_THRESHOLD = 15.0
+
+# Problems without any numbering are also split at sentence ends once they get this long
+MAX_UNNUMBERED_CHARS = 1200
+
+
+@dataclass
+class TextLine:
+    text: str
+    page: int = 1
+    x: Optional[float] = None
+    y: Optional[float] = None
+    font_size: Optional[float] = None
+    bold: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class Segment:
+    text: str
+    label: Optional[str] = None
+    page: Optional[int] = None
+    parts: List["Segment"] = field(default_factory=list)
+
+    @property
+    def full_text(self) -> str:
+        """Stem followed by each labelled sub-part on its own line"""
+        lines = [self.text] if self.text else []
+        lines += [f"({part.label}) {part.text}" for part in self.parts]
+        return "\n".join(lines).strip()
+
+
+class ProblemSegmenter:
+    """Split a document's lines into problems with grouped sub-parts"""
+
+    def lines_from_text(self, text: str, page: int = 1) -> List[TextLine]:
+        """Lines of plain text, with leading spaces used as an indentation hint"""
+        lines = []
+        for raw in text.split("\n"):
+            indent = len(raw) - len(raw.lstrip(" "))
+            lines.append(TextLine(text=raw.strip(), page=page, x=indent * _CHAR_WIDTH))
+        return lines
+
+    def lines_from_page(self, page, page_num: int) -> List[TextLine]:
+        """Extract lines with font and position data from a PyPDF2 page"""
+        lines: List[TextLine] = []
+        current: Dict[str, Any] = {"text": ""}
+
+        def flush():
+            if current["text"].strip() or current.get("blank"):
+                lines.append(TextLine(
+                    text=current["text"].strip(),
+                    page=page_num,
+                    x=current.get("x"),
+                    y=current.get("y"),
+                    font_size=current.get("font_size"),
+                    bold=current.get("bold", False),
+                ))
+            current.clear()
+            current["text"] = ""
+
+        def visitor(text, cm, tm, font_dict, font_size):
+            for i, chunk in enumerate(text.split("\n")):
+                if i > 0:
+                    if not current["text"].strip():
+                        current["blank"] = True
+                    flush()
+                if not chunk:
+                    continue
+                if not current["text"]:
+                    # Position of the first fragment on the line in user space
+                    current["x"] = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+                    current["y"] = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+                    current["font_size"] = float(font_size) * abs(tm[3] or 1.0) if font_size else None
+                    base_font = str(font_dict.get("/BaseFont", "")) if font_dict else ""
+                    current["bold"] = "bold" in base_font.lower() or "black" in base_font.lower()
+                current["text"] += chunk
+
+        page.extract_text(visitor_text=visitor)
+        flush()
+        return lines
+
+    def segment(self, lines: List[TextLine]) -> List[Segment]:
+        """
+        Group lines into problems
+
+        Args:
+            lines: Document lines in reading order
+
+        Returns:
+            Segments in document order; numbered documents get one segment per
+            problem with sub-parts attached, others fall back to paragraphs
+        """
+        lines = self._join_hyphenated(lines)
+        margin = self._left_margin(lines)
+        heading_size = self._heading_size(lines)
+
+        segments: List[Segment] = []
+        current: Optional[Segment] = None
+        current_lines: List[str] = []
+        last_number = 0
+        found_numbering = False
+
+        def close():
+            nonlocal current, current_lines
+            if current is not None:
+                self._append_text(current, current_lines)
+                if current.text or current.parts:
+                    segments.append(current)
+            current, current_lines = None, []
+
+        for line in lines:
+            text = line.text
+            if not text:
+                current_lines.append("")
+                continue
+
+            top = self._match_top_level(text)
+            if top is not None:
+                number, rest, explicit = top
+                indented = (not explicit and margin is not None and line.x is not None
+                            and line.x > margin + _INDENT_THRESHOLD)
+                # Bare numbers must continue the sequence, otherwise they are a list inside a problem
+                in_sequence = explicit or last_number == 0 or number == last_number + 1
+                if in_sequence and not indented:
+                    close()
+                    found_numbering = True
+                    last_number = number
+                    current = Segment(text="", label=str(number), page=line.page)
+                    current_lines = [rest]
+                    continue
+
+            sub = self._match_sub_part(text)
+            if sub is not None and current is not None:
+                label, rest = sub
+                self._append_text(current, current_lines)
+                current.parts.append(Segment(text=rest, label=label, page=line.page))
+                current_lines = []
+                continue
+
+            if self._is_heading(line, heading_size) and found_numbering:
+                # A section heading ends the previous problem but is not part of the next one
+                close()
+                continue
+
+            if current is None:
+                current = Segment(text="", page=line.page)
+            if current.parts and not current_lines:
+                # Continuation of the latest sub-part
+                current.parts[-1].text = f"{current.parts[-1].text} {text}".strip()
+            else:
+                current_lines.append(text)
+        close()
+
+        if not found_numbering:
+            return self._split_paragraphs(lines)
+        # Text before the first numbered problem is preamble (titles, instructions)
+        return [s for s in segments if s.label is not None]
+
+    def split_parts(self, text: str) -> Segment:
+        """
+        Split a single problem's text into its stem and labelled sub-parts
+
+        Args:
+            text: Text of one problem, with sub-parts starting on their own lines
+
+        Returns:
+            Segment whose parts are empty if no sub-part markers were found
+        """
+        segment = Segment(text="")
+        current_lines: List[str] = []
+        for line in self._join_hyphenated(self.lines_from_text(text)):
+            sub = self._match_sub_part(line.text) if line.text else None
+            if sub is not None:
+                label, rest = sub
+                self._append_text(segment, current_lines)
+                segment.parts.append(Segment(text=rest, label=label))
+                current_lines = []
+            else:
+                current_lines.append(line.text)
+        self._append_text(segment, current_lines)
+        return segment
+
+    @staticmethod
+    def _match_top_level(text: str) -> Optional[Tuple[int, str, bool]]:
+        for pattern, explicit in _TOP_LEVEL_PATTERNS:
+            match = pattern.match(text)
+            if match:
+                return int(match.group(1)), match.group(2).strip(), explicit
+        return None
+
+    @staticmethod
+    def _match_sub_part(text: str) -> Optional[Tuple[str, str]]:
+        for pattern in _SUB_PART_PATTERNS:
+            match = pattern.match(text)
+            if match:
+                return match.group("label").lower(), match.group("rest").strip()
+        return None
+
+    @staticmethod
+    def _append_text(segment: Segment, lines: List[str]) -> None:
+        text = " ".join(line for line in lines if line).strip()
+        if not text:
+            return
+        if segment.parts:
+            segment.parts[-1].text = f"{segment.parts[-1].text} {text}".strip()
+        else:
+            segment.text = f"{segment.text} {text}".strip()
+
+    @staticmethod
+    def _join_hyphenated(lines: List[TextLine]) -> List[TextLine]:
+        """Re-join words broken across lines with a trailing hyphen"""
+        joined: List[TextLine] = []
+        for line in lines:
+            if joined and re.search(r"[a-z]-$", joined[-1].text) and line.text[:1].islower():
+                joined[-1] = TextLine(**{**joined[-1].to_dict(), "text": joined[-1].text[:-1] + line.text})
+            else:
+                joined.append(line)
+        return joined
+
+    @staticmethod
+    def _left_margin(lines: List[TextLine]) -> Optional[float]:
+        positions = Counter(round(line.x) for line in lines if line.x is not None and line.text)
+        if not positions:
+            return None
+        # The most common indentation, the leftmost of equally common ones
+        top = positions.most_common(1)[0][1]
+        return float(min(x for x, count in positions.items() if count == top))
+
+    @staticmethod
+    def _heading_size(lines: List[TextLine]) -> Optional[float]:
+        sizes = [line.font_size for line in lines if line.font_size and line.text]
+        if not sizes:
+            return None
+        return statistics.median(sizes) * 1.15
+
+    @staticmethod
+    def _is_heading(line: TextLine, heading_size: Optional[float]) -> bool:
+        short = len(line.text) < 60 and not line.text.rstrip().endswith((".", "?"))
+        larger = heading_size is not None and line.font_size is not None and line.font_size >= heading_size
+        return short and (line.bold or larger)
+
+    def _split_paragraphs(self, lines: List[TextLine]) -> List[Segment]:
+        """Fallback for unnumbered documents: blank lines, vertical gaps and size limits"""
+        gap = self._paragraph_gap(lines)
+        paragraphs: List[Tuple[int, List[str]]] = []
+        current: List[str] = []
+        page = lines[0].page if lines else 1
+        previous: Optional[TextLine] = None
+        for line in lines:
+            gap_break = (gap is not None and previous is not None and previous.y is not None
+                         and line.y is not None and line.page == previous.page
+                         and abs(previous.y - line.y) > gap)
+            if not line.text or gap_break or (previous is not None and line.page != previous.page):
+                if current:
+                    paragraphs.append((page, current))
+                current = []
+            if line.text:
+                if not current:
+                    page = line.page
+                current.append(line.text)
+            previous = line
+        if current:
+            paragraphs.append((page, current))
+
+        segments = []
+        for page, paragraph in paragraphs:
+            for chunk in self._split_long(" ".join(paragraph)):
+                segments.append(Segment(text=chunk, page=page))
+        return segments
+
+    @staticmethod
+    def _paragraph_gap(lines: List[TextLine]) -> Optional[float]:
+        spacings = [
+            abs(a.y - b.y) for a, b in zip(lines, lines[1:])
+            if a.y is not None and b.y is not None and a.page == b.page and a.y != b.y
+        ]
+        if len(spacings) < 3:
+            return None
+        return statistics.median(spacings) * 1.8
+
+    @staticmethod
+    def _split_long(text: str) -> List[str]:
+        """Split an over-long unnumbered block after questions once it exceeds the size limit"""
+        if len(text) <= MAX_UNNUMBERED_CHARS:
+            return [text]
+        chunks, current = [], ""
+        for sentence in re.split(r"(?<=[.?!])\s+", text):
+            current = f"{current} {sentence}".strip()
+            if len(current) >= MAX_UNNUMBERED_CHARS // 4 and sentence.endswith("?"):
+                chunks.append(current)
+                current = ""
+        if current:
+            if chunks and len(current) < 40:
+                chunks[-1] = f"{chunks[-1]} {current}"
+            else:
+                chunks.append(current)
+        return chunks
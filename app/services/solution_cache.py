@@ -0,0 +1,68 @@
+"""
+Content-addressed cache of solutions
+
+Solutions are keyed by the problem type and its normalized text, so a
+problem that reappears unchanged (for example in a re-uploaded worksheet)
+is served from the cache instead of being solved again. The key also holds
+the effective runtime profile, so a request for a stronger model or a
+larger ensemble is never answered with a solution made under other settings.
+"""
+import hashlib
+import logging
+import re
+from dataclasses import replace
+from typing import Optional
+from ..core.codec import CodecError, from_payload, to_payload
+from ..core.config import Config
+from ..core.profiles import current_profile
+from ..core.types import Problem, Solution
+from .state_store import StateStore
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_problem_text(text: str) -> str:
+    """Normalize problem text so formatting-only edits do not change its identity"""
+    text = text.lower().replace("−", "-")
+    text = re.sub(r"\s+", " ", text)
+    # Spacing around punctuation and operators is not meaningful
+    text = re.sub(r"\s*([=+\-*/^(),.:;?])\s*", r"\1", text)
+    return text.strip()
+
+
+def problem_fingerprint(problem: Problem) -> str:
+    """Stable fingerprint of a problem's type and normalized text"""
+    normalized = f"{problem.type.value}:{normalize_problem_text(problem.text)}"
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class SolutionCache:
+    """Store and look up solutions by problem fingerprint"""
+
+    def __init__(self, store: StateStore, ttl: Optional[int] = None):
+        self.store = store
+        self.ttl = ttl if ttl is not None else Config.SOLUTION_CACHE_TTL
+
+    @staticmethod
+    def key(problem: Problem, ensemble: Optional[int] = None) -> str:
+        """Cache key of a problem under the current request's profile and ensemble size"""
+        return f"solution:{problem_fingerprint(problem)}:{current_profile().fingerprint(ensemble)}"
+
+    async def get(self, problem: Problem, ensemble: Optional[int] = None) -> Optional[Solution]:
+        data = await self.store.get(self.key(problem, ensemble))
+        if data is None:
+            return None
+        try:
+            return from_payload(data)
+        except CodecError as e:
+            # Entries written under an older schema are treated as misses
+            logger.info(f"Ignoring cached solution: {str(e)}")
+            return None
+
+    async def put(self, problem: Problem, solution: Solution, ensemble: Optional[int] = None) -> None:
+        # Plots are binary and regenerated on demand, so they are not cached
+        await self.store.set(
+            self.key(problem, ensemble),
+            to_payload(replace(solution, plots=None)),
+            ttl=self.ttl
+        )
@@ -0,0 +1,268 @@
+"""
+Pluggable key-value store for state shared across workers
+
+Holds per-user state, caches and job results outside the worker process so
+the app can run under several uvicorn workers or serverless instances. The
+backend is chosen from a URL: ``memory://`` (single process only),
+``sqlite:///path/to/state.db`` (processes on one host) or
+``redis://host:port/db`` (any Redis-protocol server, across nodes).
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from ..core.codec import json_dumps, json_loads
+from ..core.config import Config
+
+# Make redis optional (only needed for the redis:// backend)
+try:
+    import redis.asyncio as redis_asyncio
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
+logger = logging.getLogger(__name__)
+
+# INCRBY that sets the expiry only when it creates the key
+_INCR_SCRIPT = """
+local value = redis.call('INCRBY', KEYS[1], ARGV[1])
+if value == tonumber(ARGV[1]) and tonumber(ARGV[2]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return value
+"""
+
+
+class StateStore(ABC):
+    """Async key-value store with optional per-key expiry; values are JSON-serializable"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """Return the value for key, or None if missing or expired"""
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """Store value under key, expiring after ttl seconds if given"""
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Remove key if present"""
+        pass
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        """Atomically add amount to the integer under key (0 if missing) and return the new value"""
+        pass
+
+    async def close(self) -> None:
+        """Release backend resources"""
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """In-process store; only suitable for a single worker"""
+
+    # Keys the LRU bound never evicts (a user's stored API key); they still expire with their TTL
+    PINNED_PREFIXES = ("session:",)
+
+    def __init__(self, max_entries: Optional[int] = None, purge_interval: Optional[float] = None):
+        # Least recently used first
+        self._data: OrderedDict[str, Tuple[bytes, Optional[float]]] = OrderedDict()
+        self._pinned: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self.max_entries = max_entries if max_entries is not None else Config.MEMORY_STORE_MAX_ENTRIES
+        self.purge_interval = purge_interval if purge_interval is not None else Config.MEMORY_STORE_PURGE_SECONDS
+        self._next_purge = time.time() + self.purge_interval
+
+    async def get(self, key: str) -> Optional[Any]:
+        table = self._table(key)
+        entry = table.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del table[key]
+            return None
+        if table is self._data:
+            self._data.move_to_end(key)
+        return json_loads(value)
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        now = time.time()
+        if now >= self._next_purge:
+            self._purge_expired(now)
+        entry = (json_dumps(value), now + ttl if ttl else None)
+        if key.startswith(self.PINNED_PREFIXES):
+            self._pinned[key] = entry
+            return
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._table(key).pop(key, None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        # No await between the read and the write, so this cannot interleave with another task
+        table = self._table(key)
+        entry = table.get(key)
+        if entry is None or (entry[1] is not None and entry[1] <= time.time()):
+            value = amount
+            await self.set(key, value, ttl)
+        else:
+            value = int(json_loads(entry[0])) + amount
+            table[key] = (json_dumps(value), entry[1])
+            if table is self._data:
+                self._data.move_to_end(key)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._data) + len(self._pinned)
+
+    def _table(self, key: str) -> Dict[str, Tuple[bytes, Optional[float]]]:
+        return self._pinned if key.startswith(self.PINNED_PREFIXES) else self._data
+
+    def _purge_expired(self, now: float) -> None:
+        """Drop every expired entry, including keys that are never read again"""
+        for table in (self._data, self._pinned):
+            expired = [key for key, (_, expires_at) in table.items() if expires_at is not None and expires_at <= now]
+            for key in expired:
+                del table[key]
+        self._next_purge = now + self.purge_interval
+
+
+class SQLiteStateStore(StateStore):
+    """Store backed by a SQLite file in WAL mode, shared by processes on one host"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._conn.commit()
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM state WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= time.time():
+                self._conn.execute("DELETE FROM state WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json_loads(row[0])
+
+    def _set(self, key: str, value: Any, ttl: Optional[int]) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json_dumps(value).decode("utf-8"), expires_at),
+            )
+            self._conn.commit()
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _incr(self, key: str, amount: int, ttl: Optional[int]) -> int:
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so other processes cannot read the old value meanwhile
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM state WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None or (row[1] is not None and row[1] <= now):
+                    value, expires_at = amount, now + ttl if ttl else None
+                else:
+                    value, expires_at = int(json_loads(row[0])) + amount, row[1]
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json_dumps(value).decode("utf-8"), expires_at),
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return value
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        return await asyncio.to_thread(self._incr, key, amount, ttl)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisStateStore(StateStore):
+    """Store backed by any Redis-protocol server, shared across nodes"""
+
+    def __init__(self, url: str, namespace: str = "math-agent"):
+        if not HAS_REDIS:
+            raise RuntimeError("The redis package is required for redis:// state stores")
+        self.namespace = namespace
+        self._client = redis_asyncio.from_url(url)
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self._client.get(self._key(key))
+        return json_loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        await self._client.set(self._key(key), json_dumps(value), ex=ttl or None)
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(self._key(key))
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        # One script, so the counter and its expiry are set atomically
+        value = await self._client.eval(_INCR_SCRIPT, 1, self._key(key), amount, ttl or 0)
+        return int(value)
+
+    async def close(self) -> None:
+        await self._client.close()
+
+
+def create_state_store(url: str) -> StateStore:
+    """
+    Create a state store from a URL
+
+    Args:
+        url: memory://, sqlite:///path/to/file.db or redis://host:port/db
+
+    Returns:
+        The configured StateStore backend
+    """
+    if url.startswith("memory://"):
+        return MemoryStateStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteStateStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateStore(url)
+    raise ValueError(f"Unsupported state store URL: {url}")
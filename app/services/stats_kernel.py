@@ -0,0 +1,826 @@
+"""
+Closed-form statistics kernel for common probability and statistics problems
+
+Recognizes parameterized templates (binomial and Poisson probabilities, normal
+probabilities and quantiles, confidence intervals for a mean and one-sample
+t-tests) in problem text and solves them exactly in-process, so the agents
+only need an LLM round-trip when no template matches.
+"""
+import math
+import re
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from ..core.types import Problem, Solution, ProblemType
+from .matlab_codegen import MatlabCodeGenerator
+
+logger = logging.getLogger(__name__)
+
+# Log-factorials up to this argument are served from a precomputed table
+LOG_FACTORIAL_TABLE_SIZE = 10001
+
+_NUM = r"(-?\d+(?:\.\d+)?|-?\.\d+)"
+
+# Ordered so that longer phrases win over their suffixes ("no more than" vs "more than")
+_COMPARATOR_WORDS = [
+    (r"no more than|not more than|at most", "<="),
+    (r"no fewer than|no less than|not less than|at least", ">="),
+    (r"exactly|equal to", "=="),
+    (r"more than|greater than|exceeds?|above|over", ">"),
+    (r"fewer than|less than|below|under", "<"),
+]
+
+# Comparators that follow the number, as in "3 or more"
+_TRAILING_COMPARATOR_WORDS = [
+    (r"or fewer|or less", "<="),
+    (r"or more|or greater", ">="),
+]
+
+_SYMBOLIC_OPS = {
+    "<=": "<=", "≤": "<=", ">=": ">=", "≥": ">=",
+    "=": "==", "==": "==", "<": "<", ">": ">",
+}
+
+_LATEX_OPS = {"==": "=", "<=": "\\le", "<": "<", ">=": "\\ge", ">": ">"}
+
+# Questions the templates would misread as a plain distribution probability:
+# conditional events, runs, waiting times and several questions at once
+_UNSUPPORTED = re.compile(
+    r"\bgiven\s+(?:that|x\b|at least|at most|more than|fewer than|less than|exactly|\d)"
+    r"|\bconditional\b|\bif (?:it is )?known\b|p\s*\([^)]*\|"
+    r"|\bin a row\b|\bconsecutive\b|\bstreak\b|\bruns? of\b"
+    r"|\b(?:first|until|before)\b"
+    r"|(?:^|\s)\(?[b-h]\)\s"
+)
+
+# Leading enumeration such as "3." or "Problem 4:", which is not a quantity of the problem
+_LABEL = re.compile(r"^\s*(?:(?:problem|question|exercise|q)\s*)?\(?\d+[.):]\s+")
+_QUANTITY = re.compile(r"(?<![\w.])\d*\.?\d+")
+
+# Binomial outcomes and their complements: which outcome p refers to, and which one is counted
+_OUTCOME = r"(heads?|tails?|successe?s?|failures?)\b"
+_COMPLEMENTS = {"heads": "tails", "tails": "heads", "success": "failure", "failure": "success"}
+_PLURALS = {"heads": "heads", "tails": "tails", "success": "successes", "failure": "failures"}
+
+# Seconds per unit of time, for scaling Poisson rates to the asked interval
+_TIME_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400, "week": 7 * 86400,
+               "month": 30 * 86400, "year": 365 * 86400}
+_UNIT = r"(second|minute|hour|day|week|month|year)s?\b"
+
+
+class StatsKernel:
+    """Solve common probability and statistics templates without the LLM"""
+
+    def __init__(self, codegen: Optional[MatlabCodeGenerator] = None):
+        self.codegen = codegen or MatlabCodeGenerator()
+        self.log_factorials = np.concatenate(
+            ([0.0], np.cumsum(np.log(np.arange(1, LOG_FACTORIAL_TABLE_SIZE, dtype=np.float64))))
+        )
+        # Templates are tried in order; the first one that matches wins
+        self.templates: List[Tuple[str, Callable[[str, List[float]], Optional[Tuple[Solution, Dict[str, Any]]]]]] = [
+            ("t_test", self._match_t_test),
+            ("confidence_interval", self._match_confidence_interval),
+            ("binomial", self._match_binomial),
+            ("poisson", self._match_poisson),
+            ("normal", self._match_normal),
+        ]
+
+    def solve(self, problem: Problem) -> Optional[Solution]:
+        """
+        Try to solve the problem from a known template
+
+        Args:
+            problem: Problem classified by the text or PDF processor
+
+        Returns:
+            An exact Solution, or None when no template matches
+        """
+        match = self.match(problem)
+        return match[0] if match is not None else None
+
+    def match(self, problem: Problem) -> Optional[Tuple[Solution, Dict[str, Any]]]:
+        """
+        Solve the problem from a known template and describe its distribution
+
+        Args:
+            problem: Problem classified by the text or PDF processor
+
+        Returns:
+            The exact Solution and the distribution it was computed from
+            (kind, parameters and the queried event, used for plotting), or
+            None when no template matches
+        """
+        if problem.type not in [ProblemType.PROBABILITY, ProblemType.STATISTICS]:
+            return None
+
+        text = _LABEL.sub("", problem.text.lower(), count=1)
+        if _UNSUPPORTED.search(text) or text.count("?") > 1 or len(re.findall(r"\bp\s*\(", text)) > 1:
+            return None
+        quantities = {float(value) for value in _QUANTITY.findall(text)}
+        for name, matcher in self.templates:
+            used: List[float] = []
+            try:
+                match = matcher(text, used)
+            except (ValueError, ZeroDivisionError, OverflowError) as e:
+                logger.debug(f"Template '{name}' failed to evaluate: {str(e)}")
+                continue
+            if match is None:
+                continue
+            # An exact answer is only claimed when every quantity in the text went into it
+            unused = quantities.difference(abs(value) for value in used)
+            if unused:
+                logger.debug(f"Template '{name}' left quantities unused: {sorted(unused)}")
+                continue
+            logger.info(f"Solved problem with closed-form '{name}' template")
+            return match
+        return None
+
+    # ------------------------------------------------------------------
+    # Distribution routines
+    # ------------------------------------------------------------------
+
+    def log_factorial(self, k: np.ndarray) -> np.ndarray:
+        """Vectorized log(k!) using the precomputed table where possible"""
+        k = np.asarray(k, dtype=np.int64)
+        if k.size == 0 or k.max() < LOG_FACTORIAL_TABLE_SIZE:
+            return self.log_factorials[k]
+        return np.vectorize(lambda v: math.lgamma(v + 1.0), otypes=[np.float64])(k)
+
+    def binomial_pmf(self, k: np.ndarray, n: int, p: float) -> np.ndarray:
+        """Binomial PMF evaluated at every value in k"""
+        k = np.asarray(k, dtype=np.int64)
+        log_choose = self.log_factorial(n) - self.log_factorial(k) - self.log_factorial(n - k)
+        return np.exp(log_choose + k * math.log(p) + (n - k) * math.log1p(-p))
+
+    def poisson_pmf(self, k: np.ndarray, lam: float) -> np.ndarray:
+        """Poisson PMF evaluated at every value in k"""
+        k = np.asarray(k, dtype=np.int64)
+        return np.exp(k * math.log(lam) - lam - self.log_factorial(k))
+
+    @staticmethod
+    def normal_cdf(x: float, mu: float = 0.0, sigma: float = 1.0) -> float:
+        return 0.5 * math.erfc(-(x - mu) / (sigma * math.sqrt(2.0)))
+
+    @classmethod
+    def normal_ppf(cls, q: float, mu: float = 0.0, sigma: float = 1.0) -> float:
+        """Normal quantile (Acklam's rational approximation plus one Newton step)"""
+        if not 0.0 < q < 1.0:
+            raise ValueError("Quantile must be strictly between 0 and 1")
+        a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+             1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+        b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+             6.680131188771972e+01, -1.328068155288572e+01]
+        c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+             -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+        d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+             3.754408661907416e+00]
+        low = 0.02425
+        if q < low:
+            r = math.sqrt(-2 * math.log(q))
+            z = (((((c[0]*r + c[1])*r + c[2])*r + c[3])*r + c[4])*r + c[5]) / \
+                ((((d[0]*r + d[1])*r + d[2])*r + d[3])*r + 1)
+        elif q > 1 - low:
+            r = math.sqrt(-2 * math.log(1 - q))
+            z = -(((((c[0]*r + c[1])*r + c[2])*r + c[3])*r + c[4])*r + c[5]) / \
+                ((((d[0]*r + d[1])*r + d[2])*r + d[3])*r + 1)
+        else:
+            r = (q - 0.5) ** 2
+            z = (((((a[0]*r + a[1])*r + a[2])*r + a[3])*r + a[4])*r + a[5]) * (q - 0.5) / \
+                (((((b[0]*r + b[1])*r + b[2])*r + b[3])*r + b[4])*r + 1)
+        # Refine against the exact CDF
+        error = cls.normal_cdf(z) - q
+        z -= error * math.sqrt(2 * math.pi) * math.exp(z * z / 2)
+        return mu + sigma * z
+
+    @classmethod
+    def t_cdf(cls, t: float, df: float) -> float:
+        """Student's t CDF via the regularized incomplete beta function"""
+        tail = 0.5 * cls._betainc(df / 2.0, 0.5, df / (df + t * t))
+        return 1.0 - tail if t > 0 else tail
+
+    @classmethod
+    def t_ppf(cls, q: float, df: float) -> float:
+        """Student's t quantile by bisection on the CDF"""
+        if not 0.0 < q < 1.0:
+            raise ValueError("Quantile must be strictly between 0 and 1")
+        lo, hi = -1.0, 1.0
+        while cls.t_cdf(lo, df) > q:
+            lo *= 2.0
+        while cls.t_cdf(hi, df) < q:
+            hi *= 2.0
+        for _ in range(200):
+            mid = 0.5 * (lo + hi)
+            if cls.t_cdf(mid, df) < q:
+                lo = mid
+            else:
+                hi = mid
+            if hi - lo < 1e-12:
+                break
+        return 0.5 * (lo + hi)
+
+    @staticmethod
+    def _betainc(a: float, b: float, x: float) -> float:
+        """Regularized incomplete beta I_x(a, b)"""
+        if x <= 0.0:
+            return 0.0
+        if x >= 1.0:
+            return 1.0
+        log_front = (math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                     + a * math.log(x) + b * math.log1p(-x))
+        if x < (a + 1.0) / (a + b + 2.0):
+            return math.exp(log_front) * StatsKernel._betacf(a, b, x) / a
+        return 1.0 - math.exp(log_front) * StatsKernel._betacf(b, a, 1.0 - x) / b
+
+    @staticmethod
+    def _betacf(a: float, b: float, x: float) -> float:
+        """Continued fraction for the incomplete beta function (modified Lentz)"""
+        tiny = 1e-300
+        qab, qap, qam = a + b, a + 1.0, a - 1.0
+        c = 1.0
+        d = 1.0 - qab * x / qap
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        h = d
+        for m in range(1, 300):
+            m2 = 2 * m
+            for aa in (m * (b - m) * x / ((qam + m2) * (a + m2)),
+                       -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))):
+                d = 1.0 + aa * d
+                d = 1.0 / (d if abs(d) > tiny else tiny)
+                c = 1.0 + aa / c
+                c = c if abs(c) > tiny else tiny
+                delta = d * c
+                h *= delta
+            if abs(delta - 1.0) < 3e-15:
+                break
+        return h
+
+    # ------------------------------------------------------------------
+    # Text parsing helpers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _find_number(patterns: List[str], text: str, used: Optional[List[float]] = None) -> Optional[float]:
+        """First number captured by any of the patterns, recorded in used"""
+        for pattern in patterns:
+            match = re.search(pattern, text)
+            if match:
+                value = float(match.group(1))
+                if used is not None:
+                    used.append(value)
+                return value
+        return None
+
+    @staticmethod
+    def _find_event(text: str, used: Optional[List[float]] = None,
+                    discrete: bool = False) -> Optional[Tuple[str, float, Optional[float]]]:
+        """
+        Find the queried event as (op, value, upper) where op is a comparison or 'between'
+
+        A 'between' event is inclusive. For a discrete distribution, strict
+        bounds such as P(2 < X < 5) become the inclusive 3..4; for a
+        continuous one they make no difference.
+        """
+        parsed = StatsKernel._parse_event(text)
+        if parsed is None:
+            return None
+        op, value, upper, (strict_lower, strict_upper) = parsed
+        if used is not None:
+            used.extend(v for v in (value, upper) if v is not None)
+        if discrete and (strict_lower or strict_upper):
+            if value != int(value) or upper != int(upper):
+                return None
+            value, upper = value + strict_lower, upper - strict_upper
+        return op, value, upper
+
+    @staticmethod
+    def _parse_event(text: str) -> Optional[Tuple[str, float, Optional[float], Tuple[bool, bool]]]:
+        """The queried event and whether each bound of a 'between' event is strict"""
+        inclusive = (False, False)
+        match = re.search(r"p\s*\(\s*" + _NUM + r"\s*(<=|≤|<)\s*x\s*(<=|≤|<)\s*" + _NUM + r"\s*\)", text)
+        if match:
+            return ("between", float(match.group(1)), float(match.group(4)),
+                    (match.group(2) == "<", match.group(3) == "<"))
+
+        match = re.search(r"p\s*\(\s*x\s*(<=|>=|==|≤|≥|=|<|>)\s*" + _NUM + r"\s*\)", text)
+        if match:
+            return _SYMBOLIC_OPS[match.group(1)], float(match.group(2)), None, inclusive
+
+        match = re.search(r"between\s+" + _NUM + r"\s+and\s+" + _NUM, text)
+        if match:
+            return "between", float(match.group(1)), float(match.group(2)), inclusive
+
+        for words, op in _COMPARATOR_WORDS:
+            match = re.search(r"\b(?:" + words + r")\s+" + _NUM, text)
+            if match:
+                return op, float(match.group(1)), None, inclusive
+
+        for words, op in _TRAILING_COMPARATOR_WORDS:
+            match = re.search(_NUM + r"\s+(?:[a-z]+\s+)?(?:" + words + r")\b", text)
+            if match:
+                return op, float(match.group(1)), None, inclusive
+        return None
+
+    @staticmethod
+    def _fmt(value: float) -> str:
+        return f"{value:.6g}"
+
+    @staticmethod
+    def _discrete_support(op: str, k: int, upper: Optional[int]) -> Tuple[np.ndarray, bool]:
+        """Return the values to sum over and whether the result is a complement"""
+        if op == "==":
+            return np.array([k]), False
+        if op == "<=":
+            return np.arange(0, k + 1), False
+        if op == "<":
+            return np.arange(0, max(k, 0)), False
+        if op == ">=":
+            return np.arange(0, max(k, 0)), True
+        if op == ">":
+            return np.arange(0, k + 1), True
+        return np.arange(k, upper + 1), False
+
+    @staticmethod
+    def _as_int(value: Optional[float]) -> Optional[int]:
+        if value is None or value != int(value):
+            return None
+        return int(value)
+
+    @staticmethod
+    def _event_latex(op: str, k: str, upper: Optional[str] = None) -> str:
+        if op == "between":
+            return f"P({k} \\le X \\le {upper})"
+        return f"P(X {_LATEX_OPS[op]} {k})"
+
+    @staticmethod
+    def _plain(latex: str) -> str:
+        """Plain-text form of a simple LaTeX event for MATLAB output strings"""
+        return latex.replace("\\le", "<=").replace("\\ge", ">=")
+
+    @staticmethod
+    def _align(lines: List[str]) -> str:
+        return "\\begin{align*}\n" + "".join(f"{line} \\\\\n" for line in lines) + "\\end{align*}"
+
+    # ------------------------------------------------------------------
+    # Templates
+    # ------------------------------------------------------------------
+
+    def _match_binomial(self, text: str, used: List[float]) -> Optional[Tuple[Solution, Dict[str, Any]]]:
+        if "poisson" in text or not any(word in text for word in ["binomial", "coin", "trial"]):
+            return None
+
+        n = self._as_int(self._find_number([
+            r"\bn\s*=\s*(\d+)",
+            r"(?:flipped|tossed|rolled|repeated)\s+(\d+)\s+times",
+            r"(\d+)\s+(?:independent\s+)?(?:trials|times|tosses|flips|attempts)",
+        ], text, used))
+        p = self._find_number([
+            r"\bp\s*=\s*(0?\.\d+|[01](?:\.0+)?)\b",
+            r"(?:probability of success|success probability)\s*(?:is|of|=)?\s*(0?\.\d+)",
+            r"(?:probability|chance) of (?:a |getting )?(?:heads?|tails?)\s*(?:is|of|=)\s*(0?\.\d+)",
+            r"\b(?:heads?|tails?|success)\s+with probability\s*(0?\.\d+)",
+        ], text, used)
+        fair = p is None and "coin" in text and "biased" not in text
+        if fair:
+            p = 0.5
+        event = self._find_event(text, used, discrete=True)
+        if n is None or p is None or event is None or not 0.0 < p < 1.0:
+            return None
+
+        # X counts the outcome the question names, which need not be the one p is the probability of
+        counted = self._outcome(re.search(r"(?<![\d.])\d+\s+(?:(?!of\b)[a-z]+\s+)?" + _OUTCOME, text))
+        success = self._outcome(re.search(
+            r"\bp\s*=\s*[\d.]+\s+(?:of|for)\s+(?:a |getting )?" + _OUTCOME
+            + r"|(?:probability|chance) of (?:a |getting )?" + _OUTCOME + r"\s*(?:is|of|=)\s*[\d.]"
+            + r"|\b" + _OUTCOME + r"\s+with probability", text))
+        complemented = None
+        if counted is not None and not fair:
+            if success is None and counted == "tails":
+                # A biased coin's p could be for either face
+                return None
+            if _COMPLEMENTS[counted] == (success or "success"):
+                complemented = p
+                p = 1.0 - p
+
+        op, k_value, upper_value = event
+        k, upper = self._as_int(k_value), self._as_int(upper_value)
+        if k is None or (op == "between" and upper is None) or not 0 <= k <= n:
+            return None
+        if upper is not None and not k <= upper <= n:
+            return None
+
+        support, complement = self._discrete_support(op, k, upper)
+        total = float(self.binomial_pmf(support, n, p).sum())
+        probability = min(max(1.0 - total if complement else total, 0.0), 1.0)
+
+        event_latex = self._event_latex(op, str(k), str(upper))
+        pmf_latex = f"P(X = k) = \\binom{{{n}}}{{k}} ({self._fmt(p)})^{{k}} ({self._fmt(1 - p)})^{{{n}-k}}"
+        if op == "==":
+            sum_latex = f"\\binom{{{n}}}{{{k}}} ({self._fmt(p)})^{{{k}}} ({self._fmt(1 - p)})^{{{n - k}}}"
+        elif complement:
+            sum_latex = f"1 - \\sum_{{k=0}}^{{{int(support[-1]) if support.size else -1}}} P(X = k)"
+        else:
+            sum_latex = f"\\sum_{{k={int(support[0])}}}^{{{int(support[-1])}}} P(X = k)"
+
+        counted_note = (f", counting {_PLURALS[counted]}, each with probability 1 - {self._fmt(complemented)} = {self._fmt(p)}"
+                        if complemented is not None else "")
+        steps = [
+            f"Step 1: Identify the distribution. X ~ Binomial(n = {n}, p = {self._fmt(p)}){counted_note}.",
+            f"Step 2: Write the probability mass function: $P(X = k) = \\binom{{{n}}}{{k}} p^k (1-p)^{{{n}-k}}$.",
+            f"Step 3: Express the event: ${event_latex} = {sum_latex}$.",
+            f"Step 4: Evaluate exactly: ${event_latex} = {self._fmt(probability)}$.",
+        ]
+        matlab_code = self.codegen.distribution(
+            f"Binomial distribution: X ~ Bin(n = {n}, p = {self._fmt(p)})",
+            {"n": str(n), "p": self._fmt(p)},
+            self.codegen.discrete_event("bino", op, k, upper, "n, p"),
+            self._plain(event_latex),
+        )
+        solution = Solution(
+            explanation=(f"X counts successes in {n} independent trials with success probability "
+                         f"{self._fmt(p)}, so X follows a binomial distribution. The requested "
+                         f"probability is computed exactly from the binomial PMF."),
+            steps=steps,
+            matlab_code=matlab_code,
+            latex_solution=self._align([pmf_latex, f"{event_latex} = {sum_latex}", f"{event_latex} = {self._fmt(probability)}"]),
+            numerical_result=probability,
+            confidence=1.0
+        )
+        return solution, {"kind": "binomial", "n": n, "p": p, "event": [op, k, upper]}
+
+    @staticmethod
+    def _outcome(match: Optional[re.Match]) -> Optional[str]:
+        """Normalized binomial outcome named by a match of _OUTCOME"""
+        if match is None:
+            return None
+        word = next(group for group in match.groups() if group)
+        for outcome in _COMPLEMENTS:
+            if word.startswith(outcome[:4]):
+                return outcome
+        return None
+
+    def _match_poisson(self, text: str, used: List[float]) -> Optional[Tuple[Solution, Dict[str, Any]]]:
+        if "poisson" not in text:
+            return None
+
+        rate = self._find_rate(text, used)
+        event = self._find_event(text, used, discrete=True)
+        if rate is None or event is None or rate[0] <= 0:
+            return None
+        lam, scaling = rate
+
+        op, k_value, upper_value = event
+        k, upper = self._as_int(k_value), self._as_int(upper_value)
+        if k is None or k < 0 or (op == "between" and (upper is None or upper < k)):
+            return None
+
+        support, complement = self._discrete_support(op, k, upper)
+        total = float(self.poisson_pmf(support, lam).sum())
+        probability = min(max(1.0 - total if complement else total, 0.0), 1.0)
+
+        event_latex = self._event_latex(op, str(k), str(upper))
+        if op == "==":
+            sum_latex = f"\\frac{{{self._fmt(lam)}^{{{k}}} e^{{-{self._fmt(lam)}}}}}{{{k}!}}"
+        elif complement:
+            sum_latex = f"1 - \\sum_{{k=0}}^{{{int(support[-1]) if support.size else -1}}} P(X = k)"
+        else:
+            sum_latex = f"\\sum_{{k={int(support[0])}}}^{{{int(support[-1])}}} P(X = k)"
+
+        steps = [
+            f"Step 1: Identify the distribution. X ~ Poisson(λ = {self._fmt(lam)})"
+            + (f", with the rate scaled to the interval asked about: {scaling}." if scaling else "."),
+            "Step 2: Write the probability mass function: $P(X = k) = \\frac{\\lambda^k e^{-\\lambda}}{k!}$.",
+            f"Step 3: Express the event: ${event_latex} = {sum_latex}$.",
+            f"Step 4: Evaluate exactly: ${event_latex} = {self._fmt(probability)}$.",
+        ]
+
+        matlab_code = self.codegen.distribution(
+            f"Poisson distribution: X ~ Poisson(lambda = {self._fmt(lam)})",
+            {"lambda": self._fmt(lam)},
+            self.codegen.discrete_event("poiss", op, k, upper, "lambda"),
+            self._plain(event_latex),
+        )
+        solution = Solution(
+            explanation=(f"X counts events occurring at an average rate of {self._fmt(lam)}, so X "
+                         f"follows a Poisson distribution. The requested probability is computed "
+                         f"exactly from the Poisson PMF."),
+            steps=steps,
+            matlab_code=matlab_code,
+            latex_solution=self._align([
+                f"P(X = k) = \\frac{{{self._fmt(lam)}^{{k}} e^{{-{self._fmt(lam)}}}}}{{k!}}",
+                f"{event_latex} = {sum_latex}",
+                f"{event_latex} = {self._fmt(probability)}",
+            ]),
+            numerical_result=probability,
+            confidence=1.0
+        )
+        return solution, {"kind": "poisson", "lam": lam, "event": [op, k, upper]}
+
+    def _match_normal(self, text: str, used: List[float]) -> Optional[Tuple[Solution, Dict[str, Any]]]:
+        if "normal" not in text:
+            return None
+
+        if "standard normal" in text:
+            mu, sigma = 0.0, 1.0
+        else:
+            mu = self._find_number([r"(?:mean|μ|mu)\s*(?:of|=|is)?\s*" + _NUM], text, used)
+            sigma = self._find_number([
+                r"(?:standard deviation|std\.? dev\.?|\bsd|σ|sigma)\s*(?:of|=|is)?\s*" + _NUM,
+            ], text, used)
+            if sigma is None:
+                variance = self._find_number([r"variance\s*(?:of|=|is)?\s*" + _NUM], text, used)
+                sigma = math.sqrt(variance) if variance is not None and variance > 0 else None
+        if mu is None or sigma is None or sigma <= 0:
+            return None
+
+        percentile = self._find_number([r"(\d+(?:\.\d+)?)(?:st|nd|rd|th)\s+percentile"], text, used)
+        if percentile is not None:
+            return self._normal_quantile(mu, sigma, percentile / 100.0)
+
+        event = self._find_event(text, used)
+        if event is None or event[0] == "==":
+            return None
+        op, a, b = event
+        if op == "between":
+            if b is None or b < a:
+                return None
+            probability = self.normal_cdf(b, mu, sigma) - self.normal_cdf(a, mu, sigma)
+            z_text = f"z_1 = {self._fmt((a - mu) / sigma)}, z_2 = {self._fmt((b - mu) / sigma)}"
+            standardized = f"\\Phi({self._fmt((b - mu) / sigma)}) - \\Phi({self._fmt((a - mu) / sigma)})"
+            matlab_expr = f"normcdf({self._fmt(b)}, mu, sigma) - normcdf({self._fmt(a)}, mu, sigma)"
+        elif op in ["<", "<="]:
+            probability = self.normal_cdf(a, mu, sigma)
+            z_text = f"z = {self._fmt((a - mu) / sigma)}"
+            standardized = f"\\Phi({self._fmt((a - mu) / sigma)})"
+            matlab_expr = f"normcdf({self._fmt(a)}, mu, sigma)"
+        else:
+            probability = 1.0 - self.normal_cdf(a, mu, sigma)
+            z_text = f"z = {self._fmt((a - mu) / sigma)}"
+            standardized = f"1 - \\Phi({self._fmt((a - mu) / sigma)})"
+            matlab_expr = f"1 - normcdf({self._fmt(a)}, mu, sigma)"
+
+        event_latex = self._event_latex(op, self._fmt(a), self._fmt(b) if b is not None else None)
+        steps = [
+            f"Step 1: Identify the distribution. X ~ N(μ = {self._fmt(mu)}, σ = {self._fmt(sigma)}).",
+            f"Step 2: Standardize with $Z = \\frac{{X - \\mu}}{{\\sigma}}$: {z_text}.",
+            f"Step 3: Express the event with the standard normal CDF: ${event_latex} = {standardized}$.",
+            f"Step 4: Evaluate: ${event_latex} = {self._fmt(probability)}$.",
+        ]
+        matlab_code = self.codegen.distribution(
+            f"Normal distribution: X ~ N(mu = {self._fmt(mu)}, sigma = {self._fmt(sigma)})",
+            {"mu": self._fmt(mu), "sigma": self._fmt(sigma)},
+            matlab_expr,
+            self._plain(event_latex),
+        )
+        solution = Solution(
+            explanation=(f"X is normally distributed with mean {self._fmt(mu)} and standard deviation "
+                         f"{self._fmt(sigma)}. Standardizing reduces the question to the standard "
+                         f"normal CDF, which is evaluated exactly."),
+            steps=steps,
+            matlab_code=matlab_code,
+            latex_solution=self._align([f"{event_latex} = {standardized}", f"{event_latex} = {self._fmt(probability)}"]),
+            numerical_result=probability,
+            confidence=1.0
+        )
+        return solution, {"kind": "normal", "loc": mu, "scale": sigma, "event": [op, a, b]}
+
+    def _find_rate(self, text: str, used: List[float]) -> Optional[Tuple[float, Optional[str]]]:
+        """
+        Poisson mean for the interval the question asks about
+
+        Returns:
+            λ and a description of how the stated rate was scaled to the
+            interval (None if it was not), or None if the rate and interval
+            units cannot be reconciled
+        """
+        match = None
+        for pattern in [r"(?:lambda|λ)\s*(?:=|of|is)?\s*" + _NUM,
+                        r"(?:mean|rate|average)\s*(?:of|=|is)?\s*" + _NUM,
+                        _NUM + r"\s+[a-z ]*?\bper\b"]:
+            match = re.search(pattern, text)
+            if match:
+                break
+        if match is None:
+            return None
+        rate = float(match.group(1))
+        used.append(rate)
+        # Unit of the rate: "4 per hour", "4 calls/hour", "4 an hour"
+        unit = re.match(r"\S+[a-z ]{0,30}?(?:\bper|/|\ban?|\beach|\bevery)\s*" + _UNIT, text[match.start(1):])
+        interval = re.search(
+            r"\b(?:in|during|within|over|for)\s+(?:the\s+next\s+|a\s+period\s+of\s+)?"
+            r"(half\s+an?|an?|one|" + _NUM + r")\s+" + _UNIT,
+            text[:match.start()] + text[match.end():]
+        )
+        if interval is None:
+            return rate, None
+        if unit is None:
+            # The question names an interval, but it is unknown what the rate is per
+            return None
+        count_text = interval.group(1)
+        if count_text.startswith("half"):
+            count = 0.5
+        elif count_text in ("a", "an", "one"):
+            count = 1.0
+        else:
+            count = float(count_text)
+            used.append(count)
+        from_unit, to_unit = unit.group(1), interval.group(interval.lastindex)
+        lam = rate * count * _TIME_UNITS[to_unit] / _TIME_UNITS[from_unit]
+        if lam == rate:
+            return rate, None
+        return lam, (f"λ = {self._fmt(rate)} per {from_unit} × {self._fmt(count)} {to_unit}"
+                     f"{'s' if count != 1 else ''} = {self._fmt(lam)}")
+
+    def _normal_quantile(self, mu: float, sigma: float, q: float) -> Optional[Tuple[Solution, Dict[str, Any]]]:
+        if not 0.0 < q < 1.0:
+            return None
+        z = self.normal_ppf(q)
+        value = mu + sigma * z
+        steps = [
+            f"Step 1: Identify the distribution. X ~ N(μ = {self._fmt(mu)}, σ = {self._fmt(sigma)}).",
+            f"Step 2: Find the standard normal quantile: $z = \\Phi^{{-1}}({self._fmt(q)}) = {self._fmt(z)}$.",
+            f"Step 3: Transform back: $x = \\mu + z\\sigma = {self._fmt(mu)} + ({self._fmt(z)})({self._fmt(sigma)}) = {self._fmt(value)}$.",
+        ]
+        matlab_code = self.codegen.distribution(
+            f"Normal quantile: X ~ N(mu = {self._fmt(mu)}, sigma = {self._fmt(sigma)})",
+            {"mu": self._fmt(mu), "sigma": self._fmt(sigma)},
+            f"norminv({self._fmt(q)}, mu, sigma)",
+            f"Quantile at {self._fmt(q)}",
+            result="x",
+        )
+        solution = Solution(
+            explanation=(f"The {self._fmt(q * 100)}th percentile of a normal distribution with mean "
+                         f"{self._fmt(mu)} and standard deviation {self._fmt(sigma)} is found from the "
+                         f"standard normal quantile."),
+            steps=steps,
+            matlab_code=matlab_code,
+            latex_solution=self._align([
+                f"z = \\Phi^{{-1}}({self._fmt(q)}) = {self._fmt(z)}",
+                f"x = {self._fmt(mu)} + {self._fmt(z)} \\cdot {self._fmt(sigma)} = {self._fmt(value)}",
+            ]),
+            numerical_result=value,
+            confidence=1.0
+        )
+        return solution, {"kind": "normal", "loc": mu, "scale": sigma, "event": ["<=", value, None]}
+
+    def _find_sample_stats(self, text: str, used: List[float]) -> Tuple[Optional[float], Optional[float], Optional[int], bool]:
+        """Find sample mean, standard deviation, size and whether sigma is known"""
+        mean = self._find_number([
+            r"sample mean\s*(?:of|=|is|was)?\s*(?:x̄\s*=\s*)?" + _NUM,
+            r"(?:x̄|xbar|x-bar)\s*(?:=|of|is)?\s*" + _NUM,
+        ], text, used)
+        population_sigma = self._find_number([
+            r"population standard deviation\s*(?:of|=|is)?\s*" + _NUM,
+            r"(?:σ|sigma)\s*(?:=|of|is)\s*" + _NUM,
+        ], text, used)
+        sd = population_sigma if population_sigma is not None else self._find_number([
+            r"standard deviation\s*(?:of|=|is|was)?\s*" + _NUM,
+            r"\bs\s*=\s*" + _NUM,
+        ], text, used)
+        n = self._as_int(self._find_number([
+            r"\bn\s*=\s*(\d+)",
+            r"sample size\s*(?:of|=|is)?\s*(\d+)",
+            r"sample of\s*(\d+)",
+            r"(\d+)\s+(?:observations|samples|students|people|subjects|measurements|items|units|participants)",
+        ], text, used))
+        return mean, sd, n, population_sigma is not None
+
+    def _match_confidence_interval(self, text: str, used: List[float]) -> Optional[Tuple[Solution, Dict[str, Any]]]:
+        if "confidence interval" not in text:
+            return None
+
+        mean, sd, n, sigma_known = self._find_sample_stats(text, used)
+        if mean is None:
+            mean = self._find_number([r"\bmean\s*(?:of|=|is|was)?\s*" + _NUM], text, used)
+        level = self._find_number([_NUM + r"\s*%"], text, used) or 95.0
+        if mean is None or sd is None or n is None or n < 2 or sd <= 0 or not 0 < level < 100:
+            return None
+
+        alpha = 1.0 - level / 100.0
+        standard_error = sd / math.sqrt(n)
+        if sigma_known:
+            critical = self.normal_ppf(1.0 - alpha / 2.0)
+            critical_latex = f"z_{{{self._fmt(alpha / 2)}}}"
+            critical_matlab = f"norminv(1 - alpha/2)"
+            method = "z-interval (population standard deviation known)"
+        else:
+            critical = self.t_ppf(1.0 - alpha / 2.0, n - 1)
+            critical_latex = f"t_{{{self._fmt(alpha / 2)}, {n - 1}}}"
+            critical_matlab = f"tinv(1 - alpha/2, n - 1)"
+            method = f"t-interval with {n - 1} degrees of freedom"
+        margin = critical * standard_error
+        lower, upper = mean - margin, mean + margin
+
+        steps = [
+            f"Step 1: Identify the method: {method}.",
+            f"Step 2: Compute the standard error: $SE = \\frac{{{self._fmt(sd)}}}{{\\sqrt{{{n}}}}} = {self._fmt(standard_error)}$.",
+            f"Step 3: Find the critical value: ${critical_latex} = {self._fmt(critical)}$.",
+            f"Step 4: Compute the margin of error: $E = {self._fmt(critical)} \\times {self._fmt(standard_error)} = {self._fmt(margin)}$.",
+            f"Step 5: The {self._fmt(level)}% confidence interval is $({self._fmt(lower)}, {self._fmt(upper)})$.",
+        ]
+        matlab_code = (
+            f"% {self._fmt(level)}% confidence interval for the mean\n"
+            f"xbar = {self._fmt(mean)};\n"
+            f"s = {self._fmt(sd)};\n"
+            f"n = {n};\n"
+            f"alpha = {self._fmt(alpha)};\n"
+            f"crit = {critical_matlab};\n"
+            f"margin = crit * s / sqrt(n);\n"
+            f"ci = [xbar - margin, xbar + margin];\n"
+            f"fprintf('CI: (%.6f, %.6f)\\n', ci(1), ci(2));"
+        )
+        solution = Solution(
+            explanation=(f"A {self._fmt(level)}% confidence interval for the population mean is built "
+                         f"from the sample mean {self._fmt(mean)}, standard deviation {self._fmt(sd)} and "
+                         f"sample size {n} using a {method}."),
+            steps=steps,
+            matlab_code=matlab_code,
+            latex_solution=self._align([
+                f"\\bar{{x}} \\pm {critical_latex} \\frac{{s}}{{\\sqrt{{n}}}} = {self._fmt(mean)} \\pm {self._fmt(critical)} \\cdot {self._fmt(standard_error)}",
+                f"CI = ({self._fmt(lower)}, {self._fmt(upper)})",
+            ]),
+            numerical_result={"lower": lower, "upper": upper, "margin": margin, "level": level / 100.0},
+            confidence=1.0
+        )
+        return solution, {"kind": "normal" if sigma_known else "t", "df": None if sigma_known else n - 1,
+                          "loc": mean, "scale": standard_error, "event": ["between", lower, upper]}
+
+    def _match_t_test(self, text: str, used: List[float]) -> Optional[Tuple[Solution, Dict[str, Any]]]:
+        if not any(word in text for word in ["t-test", "t test", "hypothesis", "test whether", "test the claim"]):
+            return None
+
+        mean, sd, n, _ = self._find_sample_stats(text, used)
+        mu0 = self._find_number([
+            r"h0\s*:\s*(?:μ|mu)\s*=\s*" + _NUM,
+            r"(?:μ0|μ₀|mu0|mu_0)\s*=\s*" + _NUM,
+            r"(?:population|hypothesized|claimed|true) mean\s*(?:of|=|is|was)?\s*" + _NUM,
+        ], text, used)
+        if mean is None or sd is None or n is None or mu0 is None or n < 2 or sd <= 0:
+            return None
+        alpha = self._find_number([
+            r"(?:α|alpha|significance level)\s*(?:of|=|is)?\s*(0?\.\d+)",
+        ], text, used)
+        if alpha is None:
+            level = self._find_number([_NUM + r"\s*%\s*(?:significance|level)"], text, used)
+            alpha = level / 100.0 if level is not None else 0.05
+
+        alternative = re.search(r"(?:h1|ha|h_a)\s*:\s*(?:μ|mu)\s*(>|<|≠|!=)", text)
+        if alternative:
+            tail = {">": ">", "<": "<"}.get(alternative.group(1), "!=")
+        elif re.search(r"\b(?:greater than|more than|exceeds|higher than|increased)\b", text):
+            tail = ">"
+        elif re.search(r"\b(?:less than|lower than|fewer than|decreased)\b", text):
+            tail = "<"
+        else:
+            tail = "!="
+
+        df = n - 1
+        standard_error = sd / math.sqrt(n)
+        t_stat = (mean - mu0) / standard_error
+        if tail == ">":
+            p_value = 1.0 - self.t_cdf(t_stat, df)
+            h1_latex = f"\\mu > {self._fmt(mu0)}"
+            p_matlab = "1 - tcdf(t, df)"
+        elif tail == "<":
+            p_value = self.t_cdf(t_stat, df)
+            h1_latex = f"\\mu < {self._fmt(mu0)}"
+            p_matlab = "tcdf(t, df)"
+        else:
+            p_value = 2.0 * (1.0 - self.t_cdf(abs(t_stat), df))
+            h1_latex = f"\\mu \\neq {self._fmt(mu0)}"
+            p_matlab = "2 * (1 - tcdf(abs(t), df))"
+        reject = p_value < alpha
+        decision = "Reject" if reject else "Fail to reject"
+
+        steps = [
+            f"Step 1: State the hypotheses: $H_0: \\mu = {self._fmt(mu0)}$ versus $H_1: {h1_latex}$.",
+            f"Step 2: Compute the test statistic: $t = \\frac{{\\bar{{x}} - \\mu_0}}{{s/\\sqrt{{n}}}} = \\frac{{{self._fmt(mean)} - {self._fmt(mu0)}}}{{{self._fmt(sd)}/\\sqrt{{{n}}}}} = {self._fmt(t_stat)}$.",
+            f"Step 3: With {df} degrees of freedom, the p-value is ${self._fmt(p_value)}$.",
+            f"Step 4: Compare with α = {self._fmt(alpha)}: {decision.lower()} the null hypothesis.",
+        ]
+        matlab_code = (
+            f"% One-sample t-test\n"
+            f"xbar = {self._fmt(mean)};\n"
+            f"mu0 = {self._fmt(mu0)};\n"
+            f"s = {self._fmt(sd)};\n"
+            f"n = {n};\n"
+            f"df = n - 1;\n"
+            f"t = (xbar - mu0) / (s / sqrt(n));\n"
+            f"p = {p_matlab};\n"
+            f"fprintf('t = %.6f, p-value = %.6f\\n', t, p);"
+        )
+        solution = Solution(
+            explanation=(f"A one-sample t-test compares the sample mean {self._fmt(mean)} (n = {n}) "
+                         f"against the hypothesized mean {self._fmt(mu0)} at significance level "
+                         f"{self._fmt(alpha)}. {decision} the null hypothesis."),
+            steps=steps,
+            matlab_code=matlab_code,
+            latex_solution=self._align([
+                f"H_0: \\mu = {self._fmt(mu0)}, \\quad H_1: {h1_latex}",
+                f"t = \\frac{{{self._fmt(mean)} - {self._fmt(mu0)}}}{{{self._fmt(sd)}/\\sqrt{{{n}}}}} = {self._fmt(t_stat)}",
+                f"p = {self._fmt(p_value)}",
+            ]),
+            numerical_result={"t_statistic": t_stat, "p_value": p_value, "df": df, "reject_null": reject},
+            confidence=1.0
+        )
+        return solution, {"kind": "t", "df": df, "loc": 0.0, "scale": 1.0,
+                          "event": [tail, t_stat, None] if tail != "!=" else ["outside", -abs(t_stat), abs(t_stat)]}
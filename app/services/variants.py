@@ -0,0 +1,258 @@
+"""
+Grouping of duplicate and parameter-variant problems within a document
+
+Worksheets often repeat a problem verbatim, or repeat the same stem with
+different numbers. Each problem's text is reduced to a template with numeric
+slots. Problems with the same template and numbers are duplicates, and
+those with the same template but different numbers are variants. Only one
+representative per group is solved by an agent. Duplicates reuse its
+solution. A variant is solved by substituting its own numbers into the
+problem's equation with SymPy. This happens only after the representative's
+answer has been checked against the same symbolic solve, and only when
+every number in the problem is part of its equation; otherwise the variant
+is solved normally. Group membership is recorded per tenant, so only the
+user who uploaded a document has its problems solved this way.
+"""
+import asyncio
+import contextvars
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+from sympy import Eq, latex as sympy_latex, simplify, solve as sympy_solve
+from ..core.codec import CodecError, from_payload, to_payload
+from ..core.config import Config
+from ..core.types import Problem, Solution
+from .answer_matcher import AnswerMatcher
+from .latex import build_align
+from .matlab_codegen import MatlabCodeGenerator, run_sympy
+from .solution_cache import normalize_problem_text, problem_fingerprint
+from .state_store import StateStore
+
+logger = logging.getLogger(__name__)
+
+# Leading enumeration such as "3.", "(b)" or "Problem 4:"
+_LABEL = re.compile(r"^\s*(?:(?:problem|question|exercise|q)\s*)?\(?(?:\d+|[a-z])[.):]\s*", re.IGNORECASE)
+# Numbers that can vary between variants; exponents are part of the template
+_SLOT = re.compile(r"(?<![\^\d.])\d+(?:\.\d+)?")
+_DEFINITION = re.compile(r"^[a-z]\s*\(\s*[a-z]\s*\)$")
+
+# Fingerprints being resolved along the current chain, to break cycles between documents
+_resolving: contextvars.ContextVar[FrozenSet[str]] = contextvars.ContextVar("variant_resolving", default=frozenset())
+
+
+def template(text: str) -> Tuple[str, List[str]]:
+    """
+    Split a problem's text into a template and its numeric slots
+
+    Args:
+        text: Problem text
+
+    Returns:
+        The normalized text with each number replaced by '#', and the numbers in order
+    """
+    normalized = normalize_problem_text(_LABEL.sub("", text, count=1))
+    return _SLOT.sub("#", normalized), _SLOT.findall(normalized)
+
+
+@dataclass
+class ProblemGroup:
+    representative: int
+    duplicates: List[int] = field(default_factory=list)
+    variants: List[int] = field(default_factory=list)
+
+
+def group_problems(problems: List[Problem]) -> List[ProblemGroup]:
+    """
+    Group a document's problems by template
+
+    Args:
+        problems: Extracted problems, in document order
+
+    Returns:
+        One group per distinct template (indexes into problems); the first
+        problem of each group is its representative
+    """
+    groups: Dict[Tuple[str, str], ProblemGroup] = {}
+    slots: Dict[int, List[str]] = {}
+    ordered: List[ProblemGroup] = []
+    for index, problem in enumerate(problems):
+        text, numbers = template(problem.text)
+        slots[index] = numbers
+        key = (problem.type.value, text)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = group = ProblemGroup(representative=index)
+            ordered.append(group)
+        elif numbers == slots[group.representative]:
+            group.duplicates.append(index)
+        else:
+            group.variants.append(index)
+    return ordered
+
+
+@dataclass
+class _Equation:
+    lhs: Any
+    rhs: Any
+    variable: Any
+    lhs_text: str
+    rhs_text: str
+    solutions: List[Any]
+    # The problem's text with the equation taken out
+    rest: str
+
+
+class VariantSolver:
+    """Serve duplicates and variants from one solved representative per group"""
+
+    def __init__(self, store: StateStore, matcher: Optional[AnswerMatcher] = None,
+                 codegen: Optional[MatlabCodeGenerator] = None, ttl: Optional[int] = None):
+        self.store = store
+        self.matcher = matcher or AnswerMatcher()
+        self.codegen = codegen or MatlabCodeGenerator()
+        self.ttl = ttl if ttl is not None else Config.SOLUTION_CACHE_TTL
+        # Representative fingerprint and settings -> solve in progress, shared by its duplicates and variants
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def register(self, problems: List[Problem], groups: List[ProblemGroup], tenant: str) -> None:
+        """Remember which representative each duplicate and variant of a tenant's document belongs to"""
+        for group in groups:
+            representative = problems[group.representative]
+            await self.store.set(f"variant:{tenant}:{problem_fingerprint(representative)}",
+                                 {"role": "representative"}, ttl=self.ttl)
+            payload = to_payload(representative)
+            for role, members in (("duplicate", group.duplicates), ("variant", group.variants)):
+                for index in members:
+                    await self.store.set(f"variant:{tenant}:{problem_fingerprint(problems[index])}",
+                                         {"role": role, "representative": payload}, ttl=self.ttl)
+
+    async def solve(self, problem: Problem, tenant: str,
+                    solve: Callable[[Problem], Awaitable[Tuple[Solution, bool]]],
+                    settings: str = "") -> Optional[Tuple[Solution, bool]]:
+        """
+        Solve a duplicate or variant from its group's representative
+
+        Args:
+            problem: Problem to solve
+            tenant: Requesting tenant; only its own uploads are consulted
+            solve: Solves (or looks up) a problem the normal way
+            settings: Identity of the settings solve uses (profile and ensemble); an
+                in-flight representative solve is only shared under the same settings
+
+        Returns:
+            The solution and whether it came from the cache, or None if the
+            problem is not a known duplicate/variant or its variant cannot be
+            checked symbolically
+        """
+        fingerprint = problem_fingerprint(problem)
+        chain = _resolving.get()
+        if fingerprint in chain:
+            return None
+        entry = await self.store.get(f"variant:{tenant}:{fingerprint}")
+        if not entry or entry.get("role") not in ("duplicate", "variant"):
+            return None
+        try:
+            representative = from_payload(entry["representative"])
+        except CodecError:
+            return None
+        token = _resolving.set(chain | {fingerprint})
+        try:
+            rep_solution, cached = await self._solve_representative(representative, solve, settings)
+        finally:
+            _resolving.reset(token)
+        if entry["role"] == "duplicate":
+            logger.info("Reusing the solution of an identical problem in the document")
+            return rep_solution, cached
+        derived = await run_sympy(self.derive, representative, rep_solution, problem)
+        if derived is None:
+            return None
+        logger.info("Solved a parameter variant by substitution into its representative's equation")
+        return derived, False
+
+    async def _solve_representative(self, problem: Problem,
+                                    solve: Callable[[Problem], Awaitable[Tuple[Solution, bool]]],
+                                    settings: str) -> Tuple[Solution, bool]:
+        fingerprint = f"{problem_fingerprint(problem)}:{settings}"
+        task = self._inflight.get(fingerprint)
+        if task is None:
+            task = asyncio.create_task(solve(problem))
+            self._inflight[fingerprint] = task
+            task.add_done_callback(lambda _: self._inflight.pop(fingerprint, None))
+        return await asyncio.shield(task)
+
+    def derive(self, representative: Problem, rep_solution: Solution, variant: Problem) -> Optional[Solution]:
+        """
+        Solve a variant symbolically, trusting the method only if it reproduces the representative's answer
+
+        Returns:
+            The variant's solution, or None if either problem has no solvable
+            equation, has numbers outside it (intervals, counts, conditions that
+            substitution would ignore) or the symbolic answer disagrees with the
+            representative's
+        """
+        rep_equation, equation = self._equation(representative), self._equation(variant)
+        if rep_equation is None or equation is None:
+            return None
+        if template(rep_equation.rest)[1] or template(equation.rest)[1]:
+            return None
+        rep_answer = self.matcher.extract(rep_solution)
+        expected = ", ".join(str(s) for s in rep_equation.solutions)
+        if rep_answer is None or not self.matcher.equivalent(rep_answer, expected):
+            logger.info(f"Representative answer '{rep_answer}' does not match the symbolic solve ({expected})")
+            return None
+        # Each solution must satisfy the variant's own equation
+        residual = equation.lhs - equation.rhs
+        if not all(simplify(residual.subs(equation.variable, s)) == 0 for s in equation.solutions):
+            return None
+
+        _, rep_slots = template(representative.text)
+        _, slots = template(variant.text)
+        changes = ", ".join(f"{a} → {b}" for a, b in zip(rep_slots, slots) if a != b)
+        name = equation.variable.name
+        values = ", ".join(sympy_latex(s) for s in equation.solutions)
+        equation_latex = f"{sympy_latex(equation.lhs)} = {sympy_latex(equation.rhs)}"
+        numeric = [complex(s.evalf()) for s in equation.solutions]
+        real = [v.real for v in numeric if abs(v.imag) < 1e-12]
+        return Solution(
+            explanation=(f"This problem repeats an earlier one with different numbers ({changes}). "
+                         f"It is solved with the same method, and each solution is checked by substitution."),
+            steps=[
+                f"Step 1: Same problem as before with the numbers changed: {changes}.",
+                f"Step 2: Write the equation: ${equation_latex}$.",
+                f"Step 3: Solve for {name}: ${name} = {values}$.",
+                f"Step 4: Check: substituting each solution into the equation gives $0 = 0$.",
+            ],
+            matlab_code=self.codegen.equation(equation.lhs_text, equation.rhs_text, name),
+            latex_solution=build_align([equation_latex, f"{name} = {values}"]),
+            numerical_result=(real[0] if len(real) == 1 == len(numeric) else real or None),
+            confidence=rep_solution.confidence,
+        )
+
+    def _equation(self, problem: Problem) -> Optional[_Equation]:
+        """The single-variable equation posed in a problem, with its SymPy solutions"""
+        wants_roots = re.search(r"\b(?:roots?|zeros?|solve)\b", problem.text, re.IGNORECASE) is not None
+        for line in re.split(r"[\n;]|\.\s", problem.text):
+            sides = self.codegen.equation_sides(line)
+            if sides is None:
+                continue
+            lhs_text, rhs_text = sides
+            if _DEFINITION.match(lhs_text.strip()):
+                if not wants_roots:
+                    continue
+                lhs_text = rhs_text
+                rhs_text = "0"
+            lhs, rhs = self.codegen.expression(lhs_text), self.codegen.expression(rhs_text)
+            if lhs is None or rhs is None or len((lhs - rhs).free_symbols) != 1:
+                continue
+            variable = next(iter((lhs - rhs).free_symbols))
+            try:
+                solutions = sympy_solve(Eq(lhs, rhs), variable)
+            except Exception:
+                continue
+            if solutions:
+                rest = problem.text
+                for side in sides:
+                    rest = rest.replace(side, " ", 1)
+                return _Equation(lhs, rhs, variable, lhs_text, rhs_text, list(solutions), rest)
+        return None
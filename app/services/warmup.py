@@ -0,0 +1,129 @@
+"""
+Worker warmup
+
+Pays the one-off costs of a fresh worker (heavy imports, PDF parser setup,
+template compilation, classifier regexes, API client pools) before the
+worker reports itself ready, so the first real request is not slow.
+"""
+import asyncio
+import importlib
+import io
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+import PyPDF2
+from fastapi.templating import Jinja2Templates
+from ..core.config import Config
+from ..core.types import Problem, ProblemType
+from .pdf_processor import PDFProcessor
+from .text_processor import TextProcessor
+
+logger = logging.getLogger(__name__)
+
+_SAMPLE_PROBLEMS = [
+    "A coin is flipped 10 times. What is the probability of getting exactly 4 heads?",
+    "Solve the equation: x^2 + 5x + 6 = 0",
+    "Find the integral of x^2 sin(x) dx from 0 to pi.",
+    "Find the eigenvalues of the matrix [[2, 1], [1, 2]].",
+]
+
+_STUB_RESPONSE = """The equation is a quadratic that factors directly.
+1. Factor the left side: $(x + 2)(x + 3) = 0$
+2. Therefore $x = -2$ or $x = -3$"""
+
+
+class Warmup:
+    """Runs warmup stages once per worker and tracks readiness"""
+
+    def __init__(self, templates: Jinja2Templates, pdf_processor: PDFProcessor,
+                 text_processor: TextProcessor):
+        self.templates = templates
+        self.pdf_processor = pdf_processor
+        self.text_processor = text_processor
+        self.ready = False
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    async def run(self, synthetic_solve: Optional[bool] = None) -> None:
+        """Run every warmup stage; failures are recorded but never fatal"""
+        if synthetic_solve is None:
+            synthetic_solve = Config.WARMUP_SYNTHETIC_SOLVE
+        started = time.perf_counter()
+
+        # Blocking stages run in a thread so liveness checks keep answering
+        sync_stages: List[tuple] = [
+            ("imports", self._import_modules),
+            ("pdf_parser", self._warm_pdf_parser),
+            ("templates", self._compile_templates),
+            ("classifiers", self._warm_classifiers),
+            ("client_pool", self._open_client_pool),
+        ]
+        for name, stage in sync_stages:
+            await self._run_stage(name, lambda stage=stage: asyncio.to_thread(stage))
+        if synthetic_solve:
+            await self._run_stage("synthetic_solve", self._synthetic_solve)
+
+        self.ready = True
+        logger.info(f"Worker warmup finished in {time.perf_counter() - started:.2f}s")
+
+    def status(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "stages": self.stages}
+
+    async def _run_stage(self, name: str, stage: Callable) -> None:
+        started = time.perf_counter()
+        try:
+            await stage()
+            self.stages[name] = {"ok": True, "seconds": round(time.perf_counter() - started, 4)}
+        except Exception as e:
+            logger.warning(f"Warmup stage '{name}' failed: {str(e)}")
+            self.stages[name] = {"ok": False, "error": str(e)}
+
+    @staticmethod
+    def _import_modules() -> None:
+        for module in ["mistralai", "sympy", "numpy", "PyPDF2.filters"]:
+            importlib.import_module(module)
+        # Importing the client class pulls in the generated SDK models
+        from mistralai import Mistral  # noqa: F401
+
+    def _warm_pdf_parser(self) -> None:
+        writer = PyPDF2.PdfWriter()
+        writer.add_blank_page(width=612, height=792)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        reader = PyPDF2.PdfReader(io.BytesIO(buffer.getvalue()))
+        for page in reader.pages:
+            page.extract_text()
+            page.get("/Resources", {})
+
+    def _compile_templates(self) -> None:
+        # Jinja caches the compiled template on the environment
+        self.templates.get_template("index.html")
+
+    def _warm_classifiers(self) -> None:
+        for text in _SAMPLE_PROBLEMS:
+            problem = self.text_processor.process_text(text)
+            self.pdf_processor._determine_problem_type(problem.text)
+        self.pdf_processor._extract_problems("\n\n".join(_SAMPLE_PROBLEMS))
+
+        from ..agents.probability_agent import _stats_kernel
+        from ..agents.general_agent import _codegen
+        _stats_kernel.solve(Problem(text=_SAMPLE_PROBLEMS[0], type=ProblemType.PROBABILITY))
+        _codegen.from_problem(Problem(text=_SAMPLE_PROBLEMS[1], type=ProblemType.ALGEBRA))
+
+    @staticmethod
+    def _open_client_pool() -> None:
+        from .llm_providers import get_router
+        get_router()
+        if Config.MISTRAL_API_KEY:
+            Config.get_mistral_client()
+
+    async def _synthetic_solve(self) -> None:
+        """Solve a sample problem end to end against a stubbed completion"""
+        from ..agents.general_agent import GeneralAgent
+
+        async def stub_completion(messages):
+            return _STUB_RESPONSE
+
+        agent = GeneralAgent(api_key="warmup")
+        agent._get_completion = stub_completion
+        problem = self.text_processor.process_text(_SAMPLE_PROBLEMS[1])
+        await agent.solve(problem)
@@ -0,0 +1,68 @@
+"""
+Usage accounting: flushed aggregates add up, and summaries group and filter by tag
+"""
+import asyncio
+import contextvars
+
+import pytest
+
+from app.services import accounting
+from app.services.accounting import UsageAccountant, tag_usage
+
+HOUR = 3600 * 1000
+
+
+def _accountant(tmp_path):
+    return UsageAccountant(path=str(tmp_path / "usage.db"), prices={"large": (2.0, 6.0)})
+
+
+def _record(accountant, model, session="s1", endpoint="solve", problem_type="algebra"):
+    # A fresh context per completion, as each request has its own tags
+    def run():
+        tag_usage(session=session, endpoint=endpoint, problem_type=problem_type)
+        accountant.record(model, 1000, 500, 2.0)
+
+    contextvars.copy_context().run(run)
+
+
+def test_flushes_add_to_existing_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(accounting.time, "time", lambda: HOUR + 10)
+    accountant = _accountant(tmp_path)
+
+    async def scenario():
+        _record(accountant, "large")
+        await accountant.flush()
+        _record(accountant, "large")
+        await accountant.flush()
+        rows = await accountant.summary()
+        await accountant.close()
+        return rows
+
+    assert asyncio.run(scenario()) == [{
+        "requests": 2, "prompt_tokens": 2000, "completion_tokens": 1000, "mean_latency": 2.0, "cost": 0.01}]
+
+
+def test_summary_groups_by_tags_and_filters_by_hour(tmp_path, monkeypatch):
+    now = [HOUR + 10]
+    monkeypatch.setattr(accounting.time, "time", lambda: now[0])
+    accountant = _accountant(tmp_path)
+
+    async def scenario():
+        _record(accountant, "large", session="s1")
+        _record(accountant, "small", session="s2")
+        now[0] += 3600
+        _record(accountant, "large", session="s2", problem_type="probability")
+        by_model = await accountant.summary(["model"])
+        by_session = await accountant.summary(["session", "problem_type"], since=now[0])
+        await accountant.close()
+        return by_model, by_session
+
+    by_model, by_session = asyncio.run(scenario())
+    assert [(row["model"], row["requests"], row["cost"]) for row in by_model] == [("large", 2, 0.01), ("small", 1, 0.0)]
+    assert [(row["session"], row["problem_type"], row["requests"]) for row in by_session] == [("s2", "probability", 1)]
+
+
+def test_unknown_tags_are_rejected(tmp_path):
+    accountant = _accountant(tmp_path)
+    with pytest.raises(ValueError, match="Cannot group usage by: tenant"):
+        asyncio.run(accountant.summary(["model", "tenant"]))
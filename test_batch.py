@@ -0,0 +1,88 @@
+"""
+Bulk processing checkpoints: unsolved documents are retried and a dead worker does not end the run
+"""
+import argparse
+import sqlite3
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app import batch
+
+
+def _record(sha, solved, error=None):
+    return {"path": f"{sha}.txt", "paths": [f"{sha}.txt"], "sha256": sha, "seconds": 0.1, "pages": 0,
+            "problems": [], "solved": solved, "error": error}
+
+
+@pytest.mark.parametrize("name", ["results.jsonl", "results.db"])
+def test_only_solved_documents_are_complete_for_a_solving_run(tmp_path, name):
+    sink = batch.open_sink(str(tmp_path / name))
+    sink.write(_record("solved", True))
+    sink.write(_record("extracted", False))
+    sink.write(_record("failed", False, error="worker died"))
+    sink.close()
+
+    sink = batch.open_sink(str(tmp_path / name))
+    assert sink.completed(solved=True) == {"solved"}
+    assert sink.completed(solved=False) == {"solved", "extracted"}
+    sink.close()
+
+
+def test_older_sqlite_output_is_migrated(tmp_path):
+    path = str(tmp_path / "results.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE documents (sha256 TEXT PRIMARY KEY, path TEXT, paths TEXT, pages INTEGER, "
+                 "problems INTEGER, seconds REAL, error TEXT, processed_at REAL)")
+    conn.execute("INSERT INTO documents VALUES ('old', 'old.txt', '[]', 0, 0, 0.1, NULL, 0)")
+    conn.commit()
+    conn.close()
+
+    sink = batch.open_sink(path)
+    sink.write(_record("new", True))
+    assert sink.completed(solved=True) == {"new"}
+    assert sink.completed(solved=False) == {"old", "new"}
+    sink.close()
+
+
+class FakePool:
+    """Runs documents inline; a document named crash.txt breaks the pool as a dying worker would"""
+
+    created = []
+
+    def __init__(self, **kwargs):
+        self.broken = False
+        FakePool.created.append(self)
+
+    def submit(self, fn, path, sha):
+        if self.broken:
+            raise BrokenProcessPool("A process in the process pool was terminated abruptly")
+        future = Future()
+        if path.endswith("crash.txt"):
+            self.broken = True
+            future.set_exception(BrokenProcessPool("A process in the process pool was terminated abruptly"))
+        else:
+            future.set_result({"path": path, "sha256": sha, "seconds": 0, "pages": 0, "problems": [],
+                               "solved": False})
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def test_a_dead_worker_restarts_the_pool(tmp_path, monkeypatch):
+    FakePool.created = []
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", FakePool)
+    for name in ("a.txt", "crash.txt", "c.txt", "d.txt"):
+        (tmp_path / name).write_text(f"Solve {name}", encoding="utf-8")
+    output = str(tmp_path / "results.jsonl")
+    args = argparse.Namespace(
+        inputs=[str(tmp_path)], manifest=None, output=output, format=None, workers=1, concurrency=1,
+        solve=False, resume=True, api_key=None, report_interval=60.0)
+
+    assert batch.run(args) == 1
+    assert len(FakePool.created) == 2
+    sink = batch.open_sink(output)
+    assert len(sink.completed()) == 3
+    sink.close()
@@ -0,0 +1,91 @@
+"""
+Recording completions to a cassette and replaying them offline
+"""
+import asyncio
+import os
+
+import pytest
+
+from app import main
+from app.agents import base_agent
+from app.agents.general_agent import GeneralAgent
+from app.core.config import Config
+from app.services import cassette as cassette_module
+from app.services.cassette import Cassette
+from app.services.llm_providers import Completion
+
+REQUEST = {"model": "test-model", "messages": [{"role": "user", "content": "Solve 2x = 4"}]}
+OTHER = {"model": "test-model", "messages": [{"role": "user", "content": "Solve 3x = 9"}]}
+
+
+class Router:
+    """Answers with a numbered completion, or fails when `offline`"""
+
+    def __init__(self, offline=False):
+        self.offline = offline
+        self.calls = 0
+
+    async def complete(self, request, api_key):
+        if self.offline:
+            raise RuntimeError("network is unreachable")
+        self.calls += 1
+        return Completion(content=f"x = {self.calls}", model=request["model"], provider="fake")
+
+
+def test_recordings_replay_in_order_and_survive_a_lost_index(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+
+    async def scenario():
+        recorder = Cassette(path, mode="record")
+        for response in ("first", "second"):
+            await recorder.record(REQUEST, response, 0.1)
+        os.remove(recorder.index_path)
+        player = Cassette(path, mode="replay")
+        return len(player), [await player.replay(REQUEST) for _ in range(3)]
+
+    assert asyncio.run(scenario()) == (2, ["first", "second", "first"])
+
+
+def test_replay_misses_fail_unless_recording(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+
+    async def scenario():
+        await Cassette(path, mode="record").record(REQUEST, "x = 2", 0.1)
+        with pytest.raises(RuntimeError, match="No recorded response"):
+            await Cassette(path, mode="replay").replay(OTHER)
+        return await Cassette(path, mode="auto").replay(OTHER)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_agent_round_trip_runs_offline(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "LLM_CASSETTE_PATH", str(tmp_path / "llm.jsonl"))
+    monkeypatch.setattr(cassette_module, "_cassette", None)
+    monkeypatch.setattr(base_agent.accountant, "record", lambda *args: None)
+    messages = REQUEST["messages"]
+
+    monkeypatch.setattr(Config, "LLM_CASSETTE_MODE", "record")
+    monkeypatch.setattr(base_agent, "get_router", lambda: Router())
+    recorded = asyncio.run(GeneralAgent(api_key="key")._get_completion(messages))
+
+    monkeypatch.setattr(Config, "LLM_CASSETTE_MODE", "replay")
+    monkeypatch.setattr(base_agent, "get_router", lambda: Router(offline=True))
+    agent = GeneralAgent(api_key=None)
+    assert asyncio.run(agent._get_completion(messages)) == recorded == "x = 1"
+    with pytest.raises(RuntimeError, match="No recorded response"):
+        asyncio.run(agent._get_completion(OTHER["messages"]))
+
+
+def test_replay_needs_no_api_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "LLM_CASSETTE_PATH", str(tmp_path / "llm.jsonl"))
+    monkeypatch.setattr(cassette_module, "_cassette", None)
+    monkeypatch.setattr(Config, "get_api_key", classmethod(lambda cls, api_key=None: api_key))
+
+    class Request:
+        session = {}
+
+    monkeypatch.setattr(Config, "LLM_CASSETTE_MODE", "replay")
+    asyncio.run(main.validate_config_on_demand(Request()))
+    monkeypatch.setattr(Config, "LLM_CASSETTE_MODE", "auto")
+    with pytest.raises(main.HTTPException):
+        asyncio.run(main.validate_config_on_demand(Request()))
@@ -0,0 +1,39 @@
+"""
+Decomposition of multi-part problems, including parts whose labels repeat
+"""
+import asyncio
+
+from app.agents.decomposer import DecompositionSolver
+from app.core.types import Problem, ProblemType, Solution
+from app.services.segmenter import Segment
+
+
+class EchoSolver:
+    def __init__(self):
+        self.problems = []
+
+    async def solve(self, problem):
+        self.problems.append(problem)
+        return Solution(explanation=problem.context["part"], steps=["done"],
+                        numerical_result=len(self.problems), confidence=0.9)
+
+
+def _problem(parts):
+    return Problem(text="A fair die is rolled twice.", type=ProblemType.PROBABILITY,
+                   context={"parts": [{"label": label, "text": text} for label, text in parts]})
+
+
+def test_repeated_labels_are_all_solved():
+    solver = EchoSolver()
+    solution = asyncio.run(DecompositionSolver(solver).solve(_problem(
+        [("a", "Find P(sum = 7)."), ("b", "Find P(doubles)."), ("a", "Find P(sum > 9).")]
+    )))
+    assert len(solver.problems) == 3
+    assert set(solution.numerical_result) == {"a", "b", "a-2"}
+    assert len(solution.steps) == 3
+
+
+def test_references_resolve_to_the_latest_part_with_that_label():
+    parts = [Segment(text=text, label=label) for label, text in
+             [("a", "Find x."), ("a", "Find y."), ("b", "Using part (a), find x + y."), ("c", "Hence find 2x.")]]
+    assert DecompositionSolver.dependencies(parts) == {0: [], 1: [], 2: [1], 3: [2]}
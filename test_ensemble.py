@@ -0,0 +1,45 @@
+"""
+Ensemble voting over model answers, including answers too costly to evaluate
+"""
+import asyncio
+import time
+
+from app.agents.ensemble import EnsembleSolver
+from app.core.types import Problem, ProblemType, Solution
+from app.services.answer_matcher import AnswerMatcher
+
+
+class FakeAgent:
+    """Answers with the next of `answers`, one per member"""
+
+    answers = []
+
+    def __init__(self, model=None, api_key=None, temperature=None):
+        self.model = model
+        self.api_key = api_key
+        self.temperature = temperature
+
+    async def solve(self, problem):
+        return Solution(explanation=f"The final answer is {FakeAgent.answers.pop(0)}", steps=[])
+
+
+def _vote(answers):
+    FakeAgent.answers = list(answers)
+    solver = EnsembleSolver(FakeAgent(), size=len(answers), temperatures=[0.0], models=["m"], quorum=3)
+    return asyncio.run(solver.solve(Problem(text="Solve x^2 = 4", type=ProblemType.ALGEBRA)))
+
+
+def test_power_towers_are_not_evaluated():
+    matcher = AnswerMatcher()
+    started = time.perf_counter()
+    assert matcher.canonicalize("9^9^9^9") == ["9^9^9^9"]
+    assert not matcher.equivalent("9^9^9^9", "2")
+    assert time.perf_counter() - started < 1
+    assert matcher.equivalent("x = 2 or x = -2", "-2, 2")
+    assert matcher.equivalent("\\frac{1}{2}", "0.5")
+
+
+def test_equivalent_answers_reach_quorum():
+    solution = _vote(["x = 1/2", "9^9^9^9", "0.5"])
+    assert solution.explanation.endswith(("x = 1/2", "0.5"))
+    assert solution.confidence == 2 / 3
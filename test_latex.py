@@ -0,0 +1,30 @@
+"""
+LaTeX normalization and plain-text equations in solution steps
+"""
+from app.services.latex import LatexBuilder, normalize_latex
+
+builder = LatexBuilder()
+
+
+def test_equations_are_shown_as_written():
+    assert builder.equation_to_latex("so 2 + 3 = 5") == "2 + 3 = 5"
+    assert builder.equation_to_latex("x^2*x^3 = x^5") == "x^{2} x^{3} = x^{5}"
+    assert builder.equation_to_latex("so 3 - 2x = 1") == "3 - 2 x = 1"
+    assert builder.equation_to_latex("y = 1/2 x + 3") == "y = \\frac{x}{2} + 3"
+    assert builder.equation_to_latex("so y = e^(-x^2/2)") == "y = e^{- \\frac{x^{2}}{2}}"
+
+
+def test_function_names_are_converted_outside_text_arguments():
+    assert normalize_latex("sin x + log(x)") == "\\sin x + \\log(x)"
+    assert normalize_latex("\\mathrm{max}(a, b)") == "\\mathrm{max}(a, b)"
+    assert normalize_latex("\\operatorname{exp}(x)") == "\\operatorname{exp}(x)"
+    assert normalize_latex("\\operatorname*{max}_x f") == "\\operatorname*{max}_{x} f"
+    assert normalize_latex("\\text{log of } x + log x") == "\\text{log of } x + \\log x"
+
+
+def test_script_arguments_are_braced_whole():
+    assert normalize_latex("x_\\text{max}") == "x_{\\text{max}}"
+    assert normalize_latex("e^\\sqrt{x}") == "e^{\\sqrt{x}}"
+    assert normalize_latex("x^\\frac{1}{2}") == "x^{\\frac{1}{2}}"
+    assert normalize_latex("10^-3") == "10^{-3}"
+    assert normalize_latex("x^(n+1) + x_i") == "x^{n+1} + x_{i}"
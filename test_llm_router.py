@@ -0,0 +1,155 @@
+"""
+Hedged LLM routing against fake backends: hedging, failover and circuit breaking
+"""
+import asyncio
+import time
+
+import pytest
+
+from app.agents import base_agent
+from app.agents.general_agent import GeneralAgent
+from app.core.config import Config
+from app.services.llm_providers import Completion, HedgedRouter, LLMProvider, ProviderHTTPError
+
+REQUEST = {"model": "test-model", "messages": [{"role": "user", "content": "Solve 2x = 4"}]}
+
+
+class FakeProvider(LLMProvider):
+    """Answers after `delay` seconds, or fails with `error`"""
+
+    def __init__(self, name, delay=0.0, error=None):
+        super().__init__(name)
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def complete(self, request, api_key, first_token):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            first_token.set()
+            return Completion(content=f"answer from {self.name}", model=request["model"], provider=self.name,
+                              first_token_latency=self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture(autouse=True)
+def hedging(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_HEDGE_DELAY", 0.05)
+    monkeypatch.setattr(Config, "LLM_HEDGE_MIN_DELAY", 0.01)
+    monkeypatch.setattr(Config, "LLM_CIRCUIT_FAILURES", 2)
+    monkeypatch.setattr(Config, "LLM_CIRCUIT_COOLDOWN", 0.1)
+
+
+def test_hedge_fires_at_the_deadline_and_the_loser_is_cancelled():
+    slow, fast = FakeProvider("slow", delay=1.0), FakeProvider("fast", delay=0.01)
+    router = HedgedRouter([slow, fast], hedge=True)
+
+    async def scenario():
+        started = time.perf_counter()
+        completion = await router.complete(REQUEST)
+        elapsed = time.perf_counter() - started
+        # Give the cancelled primary a chance to unwind
+        await asyncio.sleep(0)
+        return completion, elapsed
+
+    completion, elapsed = asyncio.run(scenario())
+    assert completion.provider == "fast"
+    assert completion.cancelled == ["test-model"]
+    assert 0.05 <= elapsed < 0.5
+    assert router.hedged == 1 and router.hedges_won == 1
+    assert slow.cancelled == 1
+    # Losing the race is not a failure
+    assert router.health["slow"].state == "closed" and router.health["slow"].errors == 0
+
+
+def test_no_hedge_when_the_first_token_arrives_in_time():
+    primary, backup = FakeProvider("primary", delay=0.01), FakeProvider("backup")
+    router = HedgedRouter([primary, backup], hedge=True)
+    assert asyncio.run(router.complete(REQUEST)).provider == "primary"
+    assert router.hedged == 0 and backup.calls == 0
+
+
+def test_failover_after_an_error():
+    broken, healthy = FakeProvider("broken", error=RuntimeError("HTTP 503")), FakeProvider("healthy")
+    router = HedgedRouter([broken, healthy], hedge=False)
+    assert asyncio.run(router.complete(REQUEST)).provider == "healthy"
+    assert broken.calls == 1 and router.health["broken"].errors == 1
+
+
+def test_circuit_opens_and_admits_exactly_one_probe():
+    broken, healthy = FakeProvider("broken", error=RuntimeError("HTTP 503")), FakeProvider("healthy")
+    router = HedgedRouter([broken, healthy], hedge=False)
+    health = router.health["broken"]
+
+    async def scenario():
+        for _ in range(2):
+            await router.complete(REQUEST)
+        assert health.state == "open"
+        await router.complete(REQUEST)
+        calls_while_open = broken.calls
+        await asyncio.sleep(0.15)
+        assert health.state == "half-open"
+        # The backend recovers but answers slowly; concurrent requests must not all probe it
+        broken.error, broken.delay = None, 0.05
+        results = await asyncio.gather(*(router.complete(REQUEST) for _ in range(5)))
+        return calls_while_open, results
+
+    calls_while_open, results = asyncio.run(scenario())
+    assert calls_while_open == 2
+    assert broken.calls == 3 and broken.max_in_flight == 1
+    assert sorted(r.provider for r in results) == ["broken"] + ["healthy"] * 4
+    assert health.state == "closed"
+
+
+def test_every_backend_failing_raises():
+    router = HedgedRouter([FakeProvider("a", error=RuntimeError("down")),
+                           FakeProvider("b", error=RuntimeError("down"))], hedge=False)
+    with pytest.raises(RuntimeError, match="All LLM providers failed"):
+        asyncio.run(router.complete(REQUEST))
+
+
+def test_client_errors_do_not_open_the_shared_circuit():
+    rejected, healthy = FakeProvider("mistral", error=ProviderHTTPError("HTTP 401: invalid key", 401)), \
+        FakeProvider("healthy")
+    router = HedgedRouter([rejected, healthy], hedge=False)
+
+    async def scenario():
+        for _ in range(5):
+            await router.complete(REQUEST, api_key="bad-key")
+
+    asyncio.run(scenario())
+    health = router.health["mistral"]
+    assert rejected.calls == 5 and health.state == "closed" and health.errors == 0
+
+
+def test_hedging_defaults_to_off_with_a_single_backend(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_HEDGE_ENABLED", None)
+    assert not HedgedRouter([FakeProvider("only")]).hedge
+    assert HedgedRouter([FakeProvider("a"), FakeProvider("b")]).hedge
+    monkeypatch.setattr(Config, "LLM_HEDGE_ENABLED", True)
+    assert HedgedRouter([FakeProvider("only")]).hedge
+
+
+def test_cancelled_hedges_are_accounted(monkeypatch):
+    slow, fast = FakeProvider("slow", delay=1.0), FakeProvider("fast", delay=0.01)
+    router = HedgedRouter([slow, fast], hedge=True)
+    recorded = []
+    monkeypatch.setattr(base_agent, "get_router", lambda: router)
+    monkeypatch.setattr(base_agent.accountant, "record", lambda *args: recorded.append(args))
+
+    agent = GeneralAgent(api_key="key")
+    asyncio.run(agent._get_completion(REQUEST["messages"]))
+    assert len(recorded) == 2
+    assert recorded[1][2:] == (0, 0.0)
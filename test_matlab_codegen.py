@@ -0,0 +1,53 @@
+"""
+MATLAB templates from problem text, and the limits on what reaches SymPy
+"""
+import asyncio
+import time
+
+from app.core.types import Problem, ProblemType
+from app.services.matlab_codegen import MatlabCodeGenerator, run_sympy
+
+codegen = MatlabCodeGenerator()
+
+
+def _code(text):
+    return codegen.from_problem(Problem(text=text, type=ProblemType.ALGEBRA))
+
+
+def test_equation_template():
+    code = _code("Solve 2x + 3 = 7")
+    assert "eqn = 2*x + 3 == 7;" in code
+    assert "sol = solve(eqn, x);" in code
+
+
+def test_side_conditions_become_assumptions():
+    code = _code("Solve x^2 - 4 = 0 for x > 0")
+    assert "assume(x > 0);\neqn = x.^2 - 4 == 0;" in code
+    code = _code("Solve a*x + 2 = 0 for x where a != 0")
+    assert "assume(a ~= 0);" in code and "sol = solve(eqn, x);" in code
+    assert "assumeAlso(x < 3.5);" in _code("Solve x^2 = 2 for x >= 0 and x < 3.5")
+    assert _code("Solve sin(x) = 0 for x in [0, 2pi]") is None
+
+
+def test_given_value_is_not_an_equation():
+    assert _code("If a = 3 find a value") is None
+
+
+def test_power_tower_is_rejected_quickly():
+    start = time.monotonic()
+    assert _code("Solve x = 9^9^9^9") is None
+    assert codegen.expression("2^(10^6)") is None
+    assert time.monotonic() - start < 1
+
+
+def test_parser_rejects_code_and_keeps_text_unevaluated():
+    assert codegen.expression("x.__class__") is None
+    assert codegen.expression("open(x)") is None
+    assert codegen.expression("((((((((((x))))))))))") is None
+    assert str(codegen.expression("x^2*x^3")) == "x**2*x**3"
+    assert str(codegen.expression("2 + 3")) == "2 + 3"
+
+
+def test_run_sympy_gives_up_after_timeout():
+    assert asyncio.run(run_sympy(time.sleep, 1, timeout=0.05)) is None
+    assert asyncio.run(run_sympy(codegen.expression, "x + 1")) is not None
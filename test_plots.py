@@ -0,0 +1,83 @@
+"""
+Plot rendering: bounded discrete supports, cached failures and stuck pool workers
+"""
+import asyncio
+import time
+
+from app.core.config import Config
+from app.core.types import Problem, ProblemType, Solution
+from app.services import plots
+from app.services.plots import PlotRenderer, plot_specs, render_plot
+
+
+def _slow_render(spec, fmt):
+    time.sleep(60)
+
+
+def test_huge_binomial_renders_quickly():
+    started = time.perf_counter()
+    for n in (20000, 10 ** 9):
+        data = render_plot({"kind": "binomial", "n": n, "p": 0.5, "event": ["<=", n // 2, None]}, "png")
+        assert data.startswith(b"\x89PNG")
+    data = render_plot({"kind": "poisson", "lam": 1e6, "event": [">=", 10 ** 12, None]}, "png")
+    assert data.startswith(b"\x89PNG")
+    assert time.perf_counter() - started < 10
+
+
+def test_shaded_event_excludes_strict_bounds():
+    problem = Problem(text="A binomial experiment has n = 10 trials with p = 0.3. Find P(2 < X < 5).",
+                      type=ProblemType.PROBABILITY)
+    assert plot_specs(problem, Solution(explanation="", steps=[]))[0]["event"] == ["between", 3, 4]
+
+
+def test_support_is_clamped_and_thinned():
+    k = plots._support(5e8, (1e9 * 0.25) ** 0.5, 10 ** 9)
+    assert len(k) <= plots._MAX_BARS + 1
+    assert k[0] >= 5e8 - 6 * (1e9 * 0.25) ** 0.5 - 1
+    assert list(plots._support(3, 1.5, 10)) == list(range(0, 11))
+
+
+def test_failed_render_is_not_retried():
+    renderer = PlotRenderer(workers=1)
+    spec = {"kind": "unknown"}
+
+    async def scenario():
+        try:
+            first = await renderer.render(spec)
+            started = []
+            renderer._start = lambda key, spec: started.append(key)
+            second = await renderer.render(spec)
+            return first, second, started
+        finally:
+            await renderer.close()
+
+    first, second, started = asyncio.run(scenario())
+    assert first is None and second is None and started == []
+
+
+def test_timed_out_worker_is_killed_and_the_pool_replaced(monkeypatch):
+    monkeypatch.setattr(Config, "PLOT_RENDER_TIMEOUT", 3.0)
+    monkeypatch.setattr(plots, "render_plot", _slow_render)
+    renderer = PlotRenderer(workers=1)
+
+    discarded = []
+    discard = renderer._discard_pool
+
+    def record(pool):
+        discarded.append((pool, list(pool._processes.values())))
+        discard(pool)
+
+    renderer._discard_pool = record
+
+    async def scenario():
+        try:
+            return await renderer.render({"kind": "normal", "loc": 0, "scale": 1, "event": ["<", 0, None]})
+        finally:
+            await renderer.close()
+
+    assert asyncio.run(scenario()) is None
+    (pool, processes), = discarded
+    assert renderer._pool is not pool and processes
+    for process in processes:
+        process.join(timeout=5)
+        assert not process.is_alive()
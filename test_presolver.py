@@ -0,0 +1,102 @@
+"""
+Speculative pre-solving: per-document budget, cancellation and hand-over to user requests
+"""
+import asyncio
+
+import pytest
+
+from app.core.config import Config
+from app.core.types import Problem, ProblemType, Solution
+from app.services.presolver import SpeculativeSolver
+from app.services.scheduler import FairScheduler, estimate_tokens
+from app.services.solution_cache import SolutionCache
+from app.services.state_store import MemoryStateStore
+
+PROBLEMS = [Problem(text=f"Solve x + {i} = 0", type=ProblemType.ALGEBRA) for i in range(3)]
+
+
+class Solver:
+    """Solves once `release` is set, remembering which problems it started"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = []
+
+    async def __call__(self, problem, api_key):
+        self.started.append(problem.text)
+        await self.release.wait()
+        return Solution(explanation=f"Solved {problem.text}", steps=[])
+
+
+def _presolver(solver, concurrency=4):
+    store = MemoryStateStore()
+    return SpeculativeSolver(FairScheduler(store, concurrency=concurrency), SolutionCache(store), solver)
+
+
+@pytest.fixture(autouse=True)
+def no_quota(monkeypatch):
+    monkeypatch.setattr(Config, "QUOTA_REQUESTS", 0)
+    monkeypatch.setattr(Config, "QUOTA_TOKENS", 0)
+    monkeypatch.setattr(Config, "SCHEDULER_BACKGROUND_RESERVE", 1)
+
+
+def test_problems_beyond_the_budget_are_not_scheduled(monkeypatch):
+    async def scenario():
+        presolver = _presolver(Solver())
+        monkeypatch.setattr(Config, "PRESOLVE_MAX_PROBLEMS", 2)
+        by_count = await presolver.start("doc1", PROBLEMS, None, "tenant")
+        monkeypatch.setattr(Config, "PRESOLVE_MAX_PROBLEMS", 20)
+        monkeypatch.setattr(Config, "PRESOLVE_TOKEN_BUDGET", estimate_tokens(PROBLEMS[0]) + 1)
+        by_tokens = await presolver.start("doc1", PROBLEMS, None, "tenant")
+        await presolver.close()
+        return by_count, by_tokens
+
+    assert asyncio.run(scenario()) == (2, 1)
+
+
+def test_cancelled_documents_are_forgotten():
+    async def scenario():
+        presolver = _presolver(Solver())
+        scheduled = await presolver.start("doc1", PROBLEMS, None, "tenant")
+        cancelled = presolver.cancel("doc1")
+        await asyncio.sleep(0)
+        return scheduled, cancelled, presolver.cancel("doc1"), presolver._tasks, presolver._documents
+
+    assert asyncio.run(scenario()) == (3, 3, 0, {}, {})
+
+
+def test_finished_documents_are_forgotten():
+    async def scenario():
+        solver = Solver()
+        solver.release.set()
+        presolver = _presolver(solver)
+        await presolver.start("doc1", PROBLEMS, None, "tenant")
+        for _ in range(20):
+            await asyncio.sleep(0)
+        return presolver._tasks, presolver._documents, await presolver.cache.get(PROBLEMS[2])
+
+    tasks, documents, cached = asyncio.run(scenario())
+    assert tasks == {} and documents == {}
+    assert cached.explanation == f"Solved {PROBLEMS[2].text}"
+
+
+def test_started_presolves_are_awaited_and_queued_ones_cancelled():
+    async def scenario():
+        solver = Solver()
+        # One slot for background work: the first problem runs, the others queue
+        presolver = _presolver(solver, concurrency=2)
+        await presolver.start("doc1", PROBLEMS[:2], None, "tenant")
+        await asyncio.sleep(0)
+        queued = await presolver.wait_for(PROBLEMS[1])
+        waiting = asyncio.create_task(presolver.wait_for(PROBLEMS[0]))
+        await asyncio.sleep(0)
+        solver.release.set()
+        started = await waiting
+        await asyncio.sleep(0)
+        return queued, started, solver.started, presolver._documents
+
+    queued, started, solved, documents = asyncio.run(scenario())
+    assert queued is None
+    assert started.explanation == f"Solved {PROBLEMS[0].text}"
+    assert solved == [PROBLEMS[0].text]
+    assert documents == {}
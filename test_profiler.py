@@ -0,0 +1,87 @@
+"""
+Profiling: the stack sampler, slow-request capture and the admin-only cProfile header
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.config import Config
+from app.services.profiler import ProfilingMiddleware, RequestProfiler, StackSampler, collapsed, stage
+
+
+def _spin(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampler_sees_other_threads_and_runs_one_at_a_time():
+    sampler = StackSampler()
+    stop = threading.Event()
+    worker = threading.Thread(target=_spin, args=(stop,), name="spinner")
+    worker.start()
+
+    async def scenario():
+        first = asyncio.create_task(sampler.sample(0.2, 0.01))
+        await asyncio.sleep(0.05)
+        with pytest.raises(RuntimeError, match="already running"):
+            await sampler.sample(0.1)
+        return await first
+
+    try:
+        samples = asyncio.run(scenario())
+    finally:
+        stop.set()
+        worker.join()
+    spinning = [stack for stack in samples if stack.startswith("spinner;")]
+    assert spinning and all("_spin (" in stack for stack in spinning)
+    assert collapsed(samples).splitlines()[0].rsplit(" ", 1)[1].isdigit()
+
+
+@pytest.fixture
+def profiled(monkeypatch):
+    monkeypatch.setattr(Config, "ADMIN_TOKEN", "secret")
+    profiler = RequestProfiler(threshold=0.1, keep=10, interval=0.01)
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        with stage("solve"):
+            await asyncio.sleep(0.3)
+        return {"ok": True}
+
+    @app.get("/fast")
+    async def fast():
+        return {"ok": True}
+
+    app.add_middleware(ProfilingMiddleware, profiler=profiler, paths=["/slow", "/fast"])
+    return profiler, TestClient(app)
+
+
+def test_slow_requests_are_captured_with_stages_and_samples(profiled):
+    profiler, client = profiled
+    assert client.get("/fast").status_code == 200
+    assert client.get("/slow").status_code == 200
+
+    (capture,) = profiler.recent()
+    assert capture["path"] == "/slow" and capture["status"] == 200 and capture["seconds"] >= 0.3
+    assert [s["stage"] for s in capture["stages"]] == ["solve"]
+    assert capture["samples"] > 0 and not capture["cprofile"]
+    stacks = profiler.get(capture["id"])["samples"]
+    assert any("slow (" in stack and "sleep (" in stack for stack in stacks)
+    assert profiler._active == {}
+
+
+def test_cprofile_header_needs_the_admin_token(profiled):
+    profiler, client = profiled
+    for headers in ({"X-Profile": "1"}, {"X-Profile": "1", "X-Admin-Token": "wrong"}):
+        response = client.get("/fast", headers=headers)
+        assert "x-profile-id" not in response.headers
+    assert profiler.recent() == []
+
+    response = client.get("/fast", headers={"X-Profile": "1", "X-Admin-Token": "secret"})
+    capture = profiler.get(response.headers["x-profile-id"])
+    assert "function calls" in capture["profile"]
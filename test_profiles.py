@@ -0,0 +1,75 @@
+"""
+Runtime profiles applied per request: reused agents and cached solutions
+"""
+import asyncio
+
+from app.agents import base_agent
+from app.agents.general_agent import GeneralAgent
+from app.core.profiles import ProfileRegistry, profiles
+from app.core.types import Problem, ProblemType, Solution
+from app.services.llm_providers import Completion
+from app.services.solution_cache import SolutionCache
+from app.services.state_store import MemoryStateStore
+
+
+class RecordingRouter:
+    def __init__(self):
+        self.requests = []
+
+    async def complete(self, request, api_key):
+        self.requests.append(request)
+        return Completion(content="Step 1: x = 2", model=request["model"], provider="fake")
+
+
+def test_reused_agent_follows_each_requests_profile(monkeypatch):
+    router = RecordingRouter()
+    monkeypatch.setattr(base_agent, "get_router", lambda: router)
+    # Created once, as for a WebSocket connection
+    agent = GeneralAgent(api_key="key")
+
+    async def request(name, overrides=None):
+        profiles.activate(name, overrides)
+        await agent._get_completion([{"role": "user", "content": "Solve 2x = 4"}])
+
+    asyncio.run(request("low-latency"))
+    asyncio.run(request("high-quality", {"temperature": 0.7}))
+    first, second = router.requests
+    assert (first["model"], first["max_tokens"]) == ("mistral-small-latest", 1024)
+    assert (second["model"], second["max_tokens"], second["temperature"]) == ("mistral-large-latest", 4096, 0.7)
+
+
+def test_cached_solutions_are_scoped_to_profile_and_ensemble():
+    cache = SolutionCache(MemoryStateStore())
+    problem = Problem(text="Solve 2x + 3 = 7", type=ProblemType.ALGEBRA)
+
+    async def scenario():
+        profiles.activate("balanced")
+        await cache.put(problem, Solution(explanation="x = 2", steps=[]))
+        hit = await cache.get(problem)
+        larger_ensemble = await cache.get(problem, ensemble=3)
+        profiles.activate("high-quality")
+        other_profile = await cache.get(problem)
+        profiles.activate("balanced", {"temperature": 0.9})
+        overridden = await cache.get(problem)
+        return hit, larger_ensemble, other_profile, overridden
+
+    hit, larger_ensemble, other_profile, overridden = asyncio.run(scenario())
+    assert hit is not None and hit.explanation == "x = 2"
+    assert larger_ensemble is None and other_profile is None and overridden is None
+
+
+def test_malformed_profile_file_keeps_the_last_good_profiles(tmp_path):
+    path = tmp_path / "profiles.json"
+    path.write_text('{"balanced": {"max_tokens": 2048, "temperature": 0.3}}', encoding="utf-8")
+    registry = ProfileRegistry(path=str(path), default="balanced")
+    assert registry.version == 1 and registry.profiles["balanced"].max_tokens == 2048
+
+    for malformed in ('{"balanced": {"max_tokens": "2048", "temperature": "hot"}}',
+                      '{"balanced": {"max_tokens": 100000}}',
+                      '{"balanced": {"ensemble_size": 2.5}}',
+                      '{"fast": {"model": 7}}'):
+        path.write_text(malformed, encoding="utf-8")
+        assert registry.reload() is False
+    assert registry.version == 1
+    balanced = registry.resolve("balanced")
+    assert (balanced.max_tokens, balanced.temperature) == (2048, 0.3)
@@ -0,0 +1,30 @@
+"""
+Bounds on client-chosen ensemble sizes, over HTTP and the WebSocket
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import MAX_ENSEMBLE, app, parse_ensemble
+
+client = TestClient(app)
+
+
+def test_solve_text_rejects_oversized_ensemble():
+    response = client.post("/solve-text", json={"text": "Solve 2x + 3 = 7", "ensemble": 500})
+    assert response.status_code == 422
+
+
+def test_solve_rejects_oversized_ensemble():
+    response = client.post("/solve?ensemble=500", json={"text": "Solve 2x + 3 = 7", "type": "algebra"})
+    assert response.status_code == 422
+    response = client.post("/solve?ensemble=0", json={"text": "Solve 2x + 3 = 7", "type": "algebra"})
+    assert response.status_code == 422
+
+
+def test_websocket_ensemble_is_cast_and_bounded():
+    assert parse_ensemble(None) is None
+    assert parse_ensemble("3") == 3
+    assert parse_ensemble(MAX_ENSEMBLE) == MAX_ENSEMBLE
+    for value in (0, MAX_ENSEMBLE + 1, "500", "five", 2.5, True, [2]):
+        with pytest.raises(ValueError):
+            parse_ensemble(value)
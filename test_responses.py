@@ -0,0 +1,127 @@
+"""
+Response shaping: negotiated compression, cursor pagination and field selection
+"""
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core.compression import CompressionMiddleware, choose_encoding, parse_accept_encoding
+from app.main import decode_cursor, encode_cursor, page_limit, parse_fields
+
+BODY = "x = 2\n" * 500
+
+
+def test_accept_encoding_q_values():
+    assert parse_accept_encoding("gzip;q=0.5, br , identity;q=0, x;q=bad") == {
+        "gzip": 0.5, "br": 1.0, "identity": 0.0, "x": 0.0}
+    assert parse_accept_encoding("") == {}
+
+
+def test_preferred_acceptable_encoding_is_chosen():
+    assert choose_encoding("gzip, br", ["br", "gzip"]) == "br"
+    assert choose_encoding("gzip;q=1, br;q=0.5", ["br", "gzip"]) == "gzip"
+    assert choose_encoding("br;q=0", ["br", "gzip"]) is None
+    assert choose_encoding("*;q=0.2", ["br", "gzip"]) == "br"
+    assert choose_encoding("identity", ["br", "gzip"]) is None
+
+
+@pytest.fixture
+def compressed_client():
+    app = FastAPI()
+
+    @app.get("/text")
+    def text():
+        return PlainTextResponse(BODY)
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("x = 2")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((line for line in BODY.splitlines(keepends=True)), media_type="text/plain")
+
+    @app.get("/png")
+    def png():
+        return Response(b"\x89PNG" + b"\0" * 4096, media_type="image/png")
+
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    return TestClient(app)
+
+
+def test_large_text_is_gzipped(compressed_client):
+    response = compressed_client.get("/text", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(BODY)
+    assert response.text == BODY
+
+
+def test_small_binary_and_unaccepted_responses_are_sent_as_is(compressed_client):
+    assert "content-encoding" not in compressed_client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in compressed_client.get("/png", headers={"Accept-Encoding": "gzip"}).headers
+    response = compressed_client.get("/text", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers and response.text == BODY
+
+
+def test_streamed_response_is_compressed_chunk_by_chunk(compressed_client):
+    response = compressed_client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.text == BODY
+
+
+def test_cursor_round_trip_and_validation():
+    cursor = encode_cursor("doc1", 200)
+    assert decode_cursor(cursor, "doc1") == 200
+    # A cursor is bound to its document, and only whole non-negative offsets are accepted
+    for bad, document_id in ((cursor, "doc2"), ("not base64!", "doc1"), (encode_cursor("doc1", -1), "doc1")):
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            decode_cursor(bad, document_id)
+
+
+def test_page_limit_is_clamped():
+    assert page_limit(None) == main.Config.PROBLEM_PAGE_SIZE
+    assert page_limit(0) == main.Config.PROBLEM_PAGE_SIZE
+    assert page_limit(-5) == 1
+    assert page_limit(10 ** 6) == main.Config.PROBLEM_PAGE_MAX
+
+
+def test_fields_are_parsed_and_validated():
+    assert parse_fields(None) is None
+    assert parse_fields("") is None
+    assert parse_fields(" steps ,latex_solution") == {"steps", "latex_solution"}
+    with pytest.raises(ValueError, match="Unknown fields: secret"):
+        parse_fields("steps,secret")
+
+
+def test_document_problems_are_paged(monkeypatch):
+    monkeypatch.setattr(main, "get_tenant", lambda request, api_key: "tenant")
+    entries = [{"index": i, "text": f"Solve x + {i} = 0", "type": "algebra"} for i in range(5)]
+    client = TestClient(main.app)
+
+    async def store():
+        await main.state_store.set("document:tenant:doc1", entries)
+
+    asyncio.run(store())
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, "fields": "steps"}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/api/documents/doc1/problems", params=params).json()
+        assert page["total"] == 5 and len(page["problems"]) <= 2
+        seen.extend(problem["index"] for problem in page["problems"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == list(range(5))
+
+    assert client.get("/api/documents/doc1/problems", params={"cursor": encode_cursor("other", 2)}).status_code == 400
+    assert client.get("/api/documents/doc1/problems", params={"fields": "secret"}).status_code == 400
+    assert client.get("/api/documents/missing/problems").status_code == 404
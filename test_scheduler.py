@@ -0,0 +1,48 @@
+"""
+Fair scheduler quotas shared by several workers through one state store
+"""
+import asyncio
+
+from app.core.config import Config
+from app.services.scheduler import FairScheduler, QuotaExceededError
+from app.services.state_store import SQLiteStateStore
+
+
+def test_request_quota_holds_across_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "QUOTA_REQUESTS", 4)
+    monkeypatch.setattr(Config, "QUOTA_TOKENS", 0)
+    path = str(tmp_path / "state.db")
+    # Two workers, each with its own connection to the shared store
+    workers = [FairScheduler(SQLiteStateStore(path)), FairScheduler(SQLiteStateStore(path))]
+
+    async def job():
+        return "solved"
+
+    async def scenario():
+        results = await asyncio.gather(
+            *(workers[i % 2].run("tenant", job, cost=100) for i in range(10)), return_exceptions=True)
+        return ([r for r in results if r == "solved"],
+                [r for r in results if isinstance(r, QuotaExceededError)])
+
+    solved, refused = asyncio.run(scenario())
+    assert len(solved) == 4 and len(refused) == 6
+
+
+def test_refused_requests_do_not_use_up_the_token_quota(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "QUOTA_REQUESTS", 0)
+    monkeypatch.setattr(Config, "QUOTA_TOKENS", 1000)
+    scheduler = FairScheduler(SQLiteStateStore(str(tmp_path / "state.db")))
+
+    async def job():
+        return "solved"
+
+    async def scenario():
+        results = [await scheduler.run("tenant", job, cost=600)]
+        for cost in (600, 400):
+            try:
+                results.append(await scheduler.run("tenant", job, cost=cost))
+            except QuotaExceededError:
+                results.append("refused")
+        return results
+
+    assert asyncio.run(scenario()) == ["solved", "refused", "solved"]
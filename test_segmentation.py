@@ -0,0 +1,122 @@
+"""
+Segmentation accuracy check against the labelled fixture corpus
+"""
+import asyncio
+import io
+import json
+import re
+import sys
+from pathlib import Path
+
+from PyPDF2 import PageObject, PdfReader, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from app.services.pdf_processor import PDFProcessor
+from app.services.segmenter import ProblemSegmenter
+
+CORPUS_PATH = Path(__file__).parent / "fixtures" / "segmentation_corpus.json"
+MIN_F1 = 0.9
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def evaluate_corpus():
+    """Return per-document results and the overall precision, recall and F1"""
+    segmenter = ProblemSegmenter()
+    corpus = json.loads(CORPUS_PATH.read_text(encoding="utf-8"))
+    results = []
+    matched = predicted_total = expected_total = 0
+    for doc in corpus:
+        segments = segmenter.segment(segmenter.lines_from_text(doc["text"]))
+        predicted = [_normalize(segment.full_text) for segment in segments]
+        expected = [_normalize(text) for text in doc["expected"]]
+        hits = sum(1 for text in predicted if text in expected)
+        matched += hits
+        predicted_total += len(predicted)
+        expected_total += len(expected)
+        results.append((doc["name"], hits, len(predicted), len(expected), predicted == expected))
+    precision = matched / predicted_total if predicted_total else 0.0
+    recall = matched / expected_total if expected_total else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return results, precision, recall, f1
+
+
+def test_segmentation_accuracy():
+    _, _, _, f1 = evaluate_corpus()
+    assert f1 >= MIN_F1, f"Segmentation F1 {f1:.3f} below {MIN_F1}"
+
+
+def _font(base_font):
+    return DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject(base_font),
+        NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+    })
+
+
+def _pdf(lines):
+    """One-page PDF with (text, x, y, font size, bold) lines"""
+    page = PageObject.create_blank_page(None, 612, 792)
+    content = DecodedStreamObject()
+    content.set_data("\n".join(
+        f"BT /{'F2' if bold else 'F1'} {size} Tf {x} {y} Td ({text}) Tj ET" for text, x, y, size, bold in lines
+    ).encode("latin-1"))
+    page[NameObject("/Contents")] = content
+    page[NameObject("/Resources")] = DictionaryObject({NameObject("/Font"): DictionaryObject({
+        NameObject("/F1"): _font("/Helvetica"),
+        NameObject("/F2"): _font("/Helvetica-Bold"),
+    })})
+    writer = PdfWriter()
+    writer.add_page(page)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+WORKSHEET = [
+    ("Worksheet 3", 72, 740, 18, True),
+    ("1. Solve each equation:", 72, 700, 11, False),
+    ("1. x + 1 = 3", 100, 686, 11, False),
+    ("2. 2x = 8", 100, 672, 11, False),
+    ("Section B", 72, 640, 14, True),
+    ("2. Find the derivative of x^2.", 72, 610, 11, False),
+]
+
+
+def test_pdf_lines_carry_position_and_font():
+    page = PdfReader(io.BytesIO(_pdf(WORKSHEET))).pages[0]
+    lines = ProblemSegmenter().lines_from_page(page, 1)
+    assert [(line.text, line.x, line.y, line.font_size, line.bold) for line in lines] == [
+        (text, float(x), float(y), float(size), bold) for text, x, y, size, bold in WORKSHEET]
+
+
+def test_pdf_headings_and_indented_lists_do_not_split_problems():
+    processed = asyncio.run(PDFProcessor().process_pdf(_pdf(WORKSHEET)))
+    assert [problem.text for problem in processed.problems] == [
+        # The indented "2." continues the sequence but is a list inside problem 1
+        "Solve each equation: 1. x + 1 = 3 2. 2x = 8",
+        # The bold heading is not part of either problem
+        "Find the derivative of x^2.",
+    ]
+
+
+def main():
+    """Print a per-document report"""
+    print("=" * 50)
+    print("Problem Segmentation - Fixture Corpus")
+    print("=" * 50)
+    results, precision, recall, f1 = evaluate_corpus()
+    for name, hits, predicted, expected, exact in results:
+        status = "PASS" if exact else "FAIL"
+        print(f"{status}: {name} ({hits}/{expected} matched, {predicted} predicted)")
+    exact_docs = sum(1 for result in results if result[4])
+    print(f"\nDocuments segmented exactly: {exact_docs}/{len(results)}")
+    print(f"Precision: {precision:.3f}  Recall: {recall:.3f}  F1: {f1:.3f}")
+    return 0 if f1 >= MIN_F1 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+State stores: LRU bound and expiry in memory, atomic counters
+"""
+import asyncio
+import threading
+import time
+
+from app.services.state_store import MemoryStateStore, SQLiteStateStore
+
+
+def test_least_recently_used_keys_are_evicted():
+    async def scenario():
+        store = MemoryStateStore(max_entries=3)
+        for key in "abc":
+            await store.set(key, key)
+        await store.get("a")
+        await store.set("d", "d")
+        return len(store), [await store.get(key) for key in "abcd"]
+
+    assert asyncio.run(scenario()) == (3, ["a", None, "c", "d"])
+
+
+def test_session_keys_are_never_evicted():
+    async def scenario():
+        store = MemoryStateStore(max_entries=2)
+        await store.set("session:abc:api_key", "sk-user", ttl=60)
+        for index in range(5):
+            await store.set(f"cache:{index}", index)
+        return await store.get("session:abc:api_key"), len(store)
+
+    assert asyncio.run(scenario()) == ("sk-user", 3)
+
+
+def test_expired_keys_are_purged_without_being_read():
+    async def scenario():
+        store = MemoryStateStore(purge_interval=0)
+        for index in range(100):
+            await store.set(f"job:{index}", index, ttl=1)
+        await store.set("kept", 1)
+        # Entries that have already expired
+        for key in list(store._data):
+            if key != "kept":
+                value, _ = store._data[key]
+                store._data[key] = (value, time.time() - 1)
+        await store.set("other", 2)
+        return len(store)
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_sqlite_increments_are_atomic_across_connections(tmp_path):
+    path = str(tmp_path / "state.db")
+    stores = [SQLiteStateStore(path), SQLiteStateStore(path)]
+
+    def add(store):
+        for _ in range(50):
+            store._incr("counter", 1, 60)
+
+    threads = [threading.Thread(target=add, args=(store,)) for store in stores for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert asyncio.run(stores[0].get("counter")) == 200
@@ -0,0 +1,85 @@
+"""
+Closed-form statistics kernel: exact answers, and problems it must leave to the LLM
+"""
+import math
+
+from app.core.types import Problem, ProblemType
+from app.services.stats_kernel import StatsKernel
+
+kernel = StatsKernel()
+
+
+def _match(text):
+    return kernel.match(Problem(text=text, type=ProblemType.PROBABILITY))
+
+
+def test_binomial_exact():
+    solution, spec = _match("A fair coin is flipped 10 times. What is the probability of getting exactly 3 heads?")
+    assert math.isclose(solution.numerical_result, 120 / 1024)
+    assert solution.confidence == 1.0
+    assert spec == {"kind": "binomial", "n": 10, "p": 0.5, "event": ["==", 3, None]}
+
+
+def test_problem_label_is_not_a_quantity():
+    assert _match("3. A fair coin is flipped 10 times. What is the probability of getting exactly 3 heads?") is not None
+
+
+def test_poisson_rate_scaled_to_interval():
+    solution, spec = _match(
+        "Calls arrive according to a Poisson process at a rate of 4 per hour. "
+        "What is the probability of exactly 2 calls in 30 minutes?"
+    )
+    assert spec["lam"] == 2.0
+    assert math.isclose(solution.numerical_result, 2 * math.exp(-2))
+
+
+def test_poisson_interval_without_rate_unit_is_left_to_llm():
+    assert _match("A Poisson process averages 3 events. Find the probability of at most 5 events in 2 minutes.") is None
+
+
+def test_runs_are_left_to_llm():
+    assert _match("A fair coin is flipped 10 times. What is the probability of at least 3 heads in a row?") is None
+
+
+def test_conditional_events_are_left_to_llm():
+    assert _match("A fair coin is flipped 10 times. What is the probability of at least 8 heads given at least 5 heads?") is None
+
+
+def test_several_questions_are_left_to_llm():
+    assert _match("A binomial random variable has n = 10 and p = 0.3. Find P(X > 3) and P(X = 0).") is None
+
+
+def test_unused_quantities_are_left_to_llm():
+    assert _match("2 fair coins are each flipped 10 times. What is the probability of exactly 3 heads?") is None
+
+
+def test_normal_and_confidence_interval():
+    solution, _ = _match("X is normally distributed with mean 100 and standard deviation 15. Find P(X < 130).")
+    assert math.isclose(solution.numerical_result, 0.97725, abs_tol=1e-5)
+    solution, spec = _match(
+        "A sample of 25 students has sample mean 72 and standard deviation 8. "
+        "Construct a 95% confidence interval for the mean."
+    )
+    assert spec["kind"] == "t" and spec["df"] == 24
+    assert math.isclose(solution.numerical_result["margin"], 2.0639 * 1.6, abs_tol=1e-3)
+
+
+def test_strict_bounds_of_a_discrete_event_are_exclusive():
+    solution, spec = _match("A binomial experiment has n = 10 trials with p = 0.3. Find P(2 < X < 5).")
+    expected = sum(math.comb(10, k) * 0.3 ** k * 0.7 ** (10 - k) for k in (3, 4))
+    assert math.isclose(solution.numerical_result, expected)
+    assert spec["event"] == ["between", 3, 4]
+    solution, _ = _match("A binomial experiment has n = 10 trials with p = 0.3. Find P(2 <= X < 5).")
+    assert math.isclose(solution.numerical_result, expected + math.comb(10, 2) * 0.3 ** 2 * 0.7 ** 8)
+
+
+def test_counting_the_other_outcome_uses_its_probability():
+    solution, spec = _match("A coin with p = 0.7 of heads is flipped 8 times. What is the probability of at least 6 tails?")
+    assert math.isclose(solution.numerical_result, sum(math.comb(8, k) * 0.3 ** k * 0.7 ** (8 - k) for k in (6, 7, 8)))
+    assert math.isclose(spec["p"], 0.3)
+    solution, _ = _match("A coin lands heads with probability 0.6 and is tossed 5 times. Find the probability of exactly 2 heads.")
+    assert math.isclose(solution.numerical_result, 10 * 0.6 ** 2 * 0.4 ** 3)
+
+
+def test_biased_coin_with_an_unnamed_face_is_left_to_llm():
+    assert _match("A biased coin with p = 0.7 is flipped 8 times. What is the probability of at least 6 tails?") is None
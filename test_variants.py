@@ -0,0 +1,56 @@
+"""
+Duplicate and variant problems: grouping, derived solutions and tenant scoping
+"""
+import asyncio
+
+from app.core.types import Problem, ProblemType, Solution
+from app.services.state_store import MemoryStateStore
+from app.services.variants import VariantSolver, group_problems
+
+
+def _problem(text):
+    return Problem(text=text, type=ProblemType.ALGEBRA)
+
+
+def test_problems_are_grouped_by_template():
+    problems = [_problem("Solve 2x + 3 = 7"), _problem("Solve 2x + 3 = 7"),
+                _problem("Solve 2x + 5 = 11"), _problem("Find the area of a circle of radius 2")]
+    groups = [(g.representative, g.duplicates, g.variants) for g in group_problems(problems)]
+    assert groups == [(0, [1], [2]), (3, [], [])]
+
+
+def test_variant_is_derived_from_the_representative():
+    solver = VariantSolver(MemoryStateStore())
+    solution = solver.derive(_problem("Solve 2x + 3 = 7"), Solution(explanation="x = 2", steps=[],
+                                                                    numerical_result=2),
+                             _problem("Solve 2x + 5 = 11"))
+    assert solution is not None and solution.numerical_result == 3
+
+
+def test_variant_with_numbers_outside_its_equation_is_not_derived():
+    solver = VariantSolver(MemoryStateStore())
+    solution = solver.derive(_problem("Solve x^2 = 4 for x in [-3, 3]"),
+                             Solution(explanation="x = -2 or x = 2", steps=[], numerical_result=[-2, 2]),
+                             _problem("Solve x^2 = 16 for x in [-3, 3]"))
+    assert solution is None
+
+
+def test_group_membership_is_scoped_to_the_uploading_tenant():
+    solver = VariantSolver(MemoryStateStore())
+    problems = [_problem("Solve 2x + 3 = 7"), _problem("Solve 2x + 5 = 11")]
+    solved = []
+
+    async def solve(problem):
+        solved.append(problem.text)
+        return Solution(explanation="x = 2", steps=[], numerical_result=2), False
+
+    async def scenario():
+        await solver.register(problems, group_problems(problems), "tenant-a")
+        other = await solver.solve(problems[1], "tenant-b", solve)
+        own = await solver.solve(problems[1], "tenant-a", solve)
+        return other, own
+
+    other, own = asyncio.run(scenario())
+    assert other is None
+    assert own is not None and own[0].numerical_result == 3
+    assert solved == ["Solve 2x + 3 = 7"]
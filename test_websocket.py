@@ -0,0 +1,80 @@
+"""
+The /ws solve channel: several problems per connection, malformed messages and per-problem errors
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core.types import Solution
+from app.services.scheduler import QuotaExceededError
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def validated(request):
+        pass
+
+    async def solve_cached(problem, api_key, tenant, lane, ensemble=None, agents=None):
+        if "quota" in problem.text:
+            raise QuotaExceededError("Token quota of 1000 per 3600s exceeded", retry_after=30)
+        return Solution(explanation=f"Solved {problem.text} ({lane})", steps=["x = 2"]), False
+
+    monkeypatch.setattr(main, "validate_config_on_demand", validated)
+    monkeypatch.setattr(main, "solve_cached", solve_cached)
+    monkeypatch.setattr(main.latex_renderer, "fmt", "none")
+    monkeypatch.setattr(main.Config, "PLOTS_ENABLED", False)
+    return TestClient(main.app)
+
+
+def _receive(websocket, count):
+    return [websocket.receive_json() for _ in range(count)]
+
+
+def test_several_problems_share_one_connection(client):
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "solve", "id": "a", "text": "Solve 2x = 4", "fields": ["explanation"]})
+        websocket.send_json({"type": "solve", "id": "b", "problem": {"text": "Solve 3x = 6", "type": "algebra"}})
+        websocket.send_json({"type": "ping"})
+        messages = _receive(websocket, 5)
+
+    assert {(m["type"], m.get("id")) for m in messages} == {
+        ("accepted", "a"), ("accepted", "b"), ("result", "a"), ("result", "b"), ("pong", None)}
+    results = {m["id"]: m for m in messages if m["type"] == "result"}
+    assert results["a"]["explanation"] == "Solved Solve 2x = 4 (interactive)"
+    assert "steps" not in results["a"]
+    assert results["b"]["explanation"] == "Solved Solve 3x = 6 (batch)"
+    assert results["b"]["steps"] == ["x = 2"] and results["b"]["cached"] is False
+
+
+def test_malformed_messages_are_answered_without_closing(client):
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_text("not json")
+        websocket.send_text("[1, 2]")
+        websocket.send_json({"type": "solve", "text": "Solve 2x = 4"})
+        websocket.send_json({"type": "shout", "id": "x"})
+        websocket.send_json({"type": "cancel", "id": "missing"})
+        websocket.send_json({"type": "ping"})
+        messages = _receive(websocket, 6)
+
+    assert [(m["type"], m.get("status")) for m in messages] == [
+        ("error", 400), ("error", 400), ("error", 400), ("error", 400), ("error", 404), ("pong", None)]
+    assert messages[0]["detail"] == "Messages must be JSON objects"
+    assert messages[3]["detail"] == "Unknown message type: shout"
+
+
+def test_quota_and_profile_errors_are_reported_per_problem(client):
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "solve", "id": "q", "text": "Solve the quota problem x = 1"})
+        quota = [m for m in _receive(websocket, 2) if m["type"] == "error"][0]
+        websocket.send_json({"type": "solve", "id": "p", "text": "Solve 2x = 4", "profile": "missing"})
+        profile = [m for m in _receive(websocket, 2) if m["type"] == "error"][0]
+        websocket.send_json({"type": "solve", "id": "e", "text": "Solve 2x = 4", "ensemble": "many"})
+        ensemble = [m for m in _receive(websocket, 2) if m["type"] == "error"][0]
+        websocket.send_json({"type": "solve", "id": "ok", "text": "Solve 2x = 4"})
+        result = [m for m in _receive(websocket, 2) if m["type"] == "result"][0]
+
+    assert (quota["id"], quota["status"], quota["retry_after"]) == ("q", 429, 30)
+    assert (profile["id"], profile["status"]) == ("p", 400)
+    assert "Unknown profile 'missing'" in profile["detail"]
+    assert (ensemble["id"], ensemble["status"]) == ("e", 400)
+    assert result["id"] == "ok"